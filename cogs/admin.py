@@ -1,11 +1,37 @@
 import discord
-from discord.ext import commands
-from config import OWNER
+import datetime
+import tempfile
+import os
+from discord.ext import commands, tasks
+from config import OWNER, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_HOURS
 from utils.db import DBManager
+from utils.backup import export_guild, import_guild
+from utils.visual import bracket_renderer, bracket_image_cache
 
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.archive_job.start()
+
+    def cog_unload(self):
+        self.archive_job.cancel()
+
+    @tasks.loop(hours=ARCHIVE_INTERVAL_HOURS)
+    async def archive_job(self):
+        """
+        Archiva periódicamente los torneos finalizados hace más de ARCHIVE_AFTER_DAYS días.
+        """
+        try:
+            archived = await DBManager.archive_finished_tournaments(datetime.timedelta(days=ARCHIVE_AFTER_DAYS))
+        except Exception as e:
+            print(f"Error archiving tournaments: {e}")
+            return
+        if archived:
+            print(f"Archived tournaments: {archived}")
+
+    @archive_job.before_loop
+    async def before_archive_job(self):
+        await self.bot.wait_until_ready()
 
     def is_owner(self, ctx):
         return ctx.author.id in OWNER
@@ -144,5 +170,138 @@ class Admin(commands.Cog):
             
             await ctx.send(embed=embed)
 
+    @commands.command(name="indexes")
+    async def indexes(self, ctx):
+        """
+        Muestra los índices que faltan o que no se están usando en la base de datos.
+        """
+        if not self.is_owner(ctx):
+            await ctx.send("No tienes permisos.")
+            return
+
+        report = await DBManager.check_indexes()
+
+        embed = discord.Embed(title="Índices de la Base de Datos", color=discord.Color.blue())
+        for collection_name, info in report.items():
+            missing = ", ".join(info['missing']) or "Ninguno"
+            unused = "No disponible" if info['unused'] is None else (", ".join(info['unused']) or "Ninguno")
+            undeclared = ", ".join(info['undeclared']) or "Ninguno"
+            embed.add_field(name=collection_name, value=f"**Faltan:** {missing}\n**Sin uso:** {unused}\n**No declarados:** {undeclared}", inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.command(name="locks")
+    async def locks(self, ctx):
+        """
+        Muestra las métricas de espera de los locks por torneo.
+        """
+        if not self.is_owner(ctx):
+            await ctx.send("No tienes permisos.")
+            return
+
+        cog = self.bot.get_cog("Tourney")
+        if not cog:
+            await ctx.send("El módulo de torneos no está cargado.")
+            return
+
+        stats = cog.tournament_locks.stats()
+        embed = discord.Embed(title="Locks de Torneos", color=discord.Color.blue())
+        embed.add_field(name="Locks", value=f"{stats['locks']} ({stats['held']} ocupados)", inline=True)
+        embed.add_field(name="Adquisiciones", value=f"{stats['acquisitions']} ({stats['contended']} con espera)", inline=True)
+        embed.add_field(name="Espera", value=f"Media: {stats['avg_wait_ms']} ms\nMáxima: {stats['max_wait_ms']} ms", inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.command(name="render")
+    async def render(self, ctx):
+        """
+        Muestra el estado del pool de render y de la caché de imágenes de bracket.
+        """
+        if not self.is_owner(ctx):
+            await ctx.send("No tienes permisos.")
+            return
+
+        renderer = bracket_renderer.stats()
+        cache = bracket_image_cache.stats()
+        embed = discord.Embed(title="Render de Brackets", color=discord.Color.blue())
+        embed.add_field(name="Pool", value=f"{renderer['kind']} ({renderer['workers']} workers, cola {renderer['queue_size']})", inline=True)
+        embed.add_field(name="Renders", value=f"{renderer['rendered']} ({renderer['in_flight']} en curso, {renderer['waiting']} esperando)", inline=True)
+        embed.add_field(name="Caché", value=f"Aciertos: {cache['hits']} (+{cache['disk_hits']} disco)\nFallos: {cache['misses']}\n{cache['entries']} imágenes, {cache['bytes'] // 1024} KB", inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.command(name="archive")
+    async def archive(self, ctx, days: int = ARCHIVE_AFTER_DAYS):
+        """
+        Archiva los torneos finalizados hace más de los días indicados.
+        """
+        if not self.is_owner(ctx):
+            await ctx.send("No tienes permisos.")
+            return
+
+        archived = await DBManager.archive_finished_tournaments(datetime.timedelta(days=days))
+        await ctx.send(embed=discord.Embed(
+            title="Archivo de Torneos",
+            description=f"Torneos archivados: **{archived}**",
+            color=discord.Color.blue()
+        ))
+
+    @commands.command(name="backup")
+    async def backup(self, ctx, guild_id: int = None):
+        """
+        Exporta los torneos, equipos y configuración de un servidor a un fichero .jsonl.gz.
+        """
+        if not self.is_owner(ctx):
+            await ctx.send("No tienes permisos.")
+            return
+
+        guild_id = guild_id or (ctx.guild.id if ctx.guild else None)
+        if not guild_id:
+            await ctx.send("Indica el ID del servidor.")
+            return
+
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        path = os.path.join(tempfile.gettempdir(), f"backup_{guild_id}_{timestamp}.jsonl.gz")
+        try:
+            counts = await export_guild(guild_id, path)
+            summary = "\n".join(f"**{name}:** {count}" for name, count in counts.items()) or "Sin datos"
+            embed = discord.Embed(title="Copia de Seguridad", description=summary, color=discord.Color.blue())
+            try:
+                await ctx.send(embed=embed, file=discord.File(path))
+            except discord.HTTPException:
+                await ctx.send("El fichero es demasiado grande para Discord. Usa `python -m utils.backup export`.", embed=embed)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @commands.command(name="restore")
+    async def restore(self, ctx):
+        """
+        Importa una copia de seguridad .jsonl.gz adjunta al mensaje.
+        """
+        if not self.is_owner(ctx):
+            await ctx.send("No tienes permisos.")
+            return
+
+        if not ctx.message.attachments:
+            await ctx.send("Adjunta el fichero .jsonl.gz de la copia.")
+            return
+
+        attachment = ctx.message.attachments[0]
+        path = os.path.join(tempfile.gettempdir(), f"restore_{attachment.id}.jsonl.gz")
+        try:
+            await attachment.save(path)
+            counts = await import_guild(path)
+        except Exception as e:
+            print(f"Error importing backup: {e}")
+            await ctx.send(f"No se pudo importar la copia: {e}")
+            return
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+        summary = "\n".join(f"**{name}:** {inserted} insertados, {skipped} omitidos" for name, (inserted, skipped) in counts.items()) or "Sin datos"
+        await ctx.send(embed=discord.Embed(title="Copia Importada", description=summary, color=discord.Color.blue()))
+
 async def setup(bot):
     await bot.add_cog(Admin(bot))
\ No newline at end of file
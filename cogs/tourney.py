@@ -1,12 +1,18 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import uuid
 import datetime
 import random
 import io
-from utils.db import DBManager, Tournament, Match
-from utils.visual import generate_bracket_image
-from config import PREFIX, BUG_CHANNEL 
+import time
+import asyncio
+import functools
+import inspect
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from utils.db import DBManager, Tournament, Match, GuildConfig, DuplicateTeamError
+from utils.visual import render_bracket, bracket_renderer, warm_fonts
+from config import PREFIX, BUG_CHANNEL, PENDING_REGISTRATION_SWEEP_INTERVAL, TOURNAMENT_LOCKS_MAX, TOURNAMENT_LOCK_IDLE_TTL
 
 try:
     from config import BOT_LINK, DOC_URL
@@ -14,9 +20,132 @@ except ImportError:
     BOT_LINK = None
     DOC_URL = None
 
+class TournamentLocks:
+    """
+    Registro de locks por torneo con tamaño máximo y expulsión de los que llevan tiempo sin usarse
+    """
+    def __init__(self, maxsize: int, idle_ttl: float):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.acquisitions = 0
+        self.contended = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._locks = OrderedDict()  # clave -> [lock, usuarios, último uso]
+
+    def _evict(self):
+        """
+        Elimina los locks libres que han expirado o que sobran por tamaño
+        """
+        now = time.monotonic()
+        for key, (lock, users, last_used) in list(self._locks.items()):
+            if users == 0 and (now - last_used > self.idle_ttl or len(self._locks) > self.maxsize):
+                del self._locks[key]
+
+    @asynccontextmanager
+    async def acquire(self, key):
+        """
+        Mantiene el lock del torneo indicado durante el bloque 'async with'
+        """
+        entry = self._locks.get(key)
+        if entry is None:
+            self._evict()
+            entry = self._locks[key] = [asyncio.Lock(), 0, time.monotonic()]
+        self._locks.move_to_end(key)
+        lock = entry[0]
+        entry[1] += 1
+        start = time.monotonic()
+        try:
+            if lock.locked():
+                self.contended += 1
+            async with lock:
+                wait = time.monotonic() - start
+                self.acquisitions += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                yield
+        finally:
+            entry[1] -= 1
+            entry[2] = time.monotonic()
+
+    def stats(self):
+        """
+        Obtiene las métricas de espera de los locks
+        """
+        return {
+            "locks": len(self._locks),
+            "held": sum(1 for lock, users, last_used in self._locks.values() if lock.locked()),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": round(self.total_wait / self.acquisitions * 1000, 2) if self.acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2)
+        }
+
+async def active_tournament_key(guild_id: int, fresh: bool = False):
+    """
+    Clave del lock del torneo activo de un servidor (o del propio servidor si no tiene torneo activo)
+    """
+    tourney = await DBManager.get_active_tournament(guild_id, fresh=fresh)
+    return tourney.id if tourney else f"guild:{guild_id}"
+
+def serialized(func):
+    """
+    Ejecuta el comando con el lock del torneo que modifica, de forma que los comandos
+    que modifican un mismo torneo no se intercalan. Los de otros torneos siguen en paralelo.
+    Si el comando recibe 'tourney_id' se usa ese torneo; si no, el torneo activo del servidor,
+    que se vuelve a leer con el lock tomado (fresh=True, así el comando ve también lo que hayan escrito
+    otros procesos) por si ha cambiado mientras se esperaba
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(self, ctx, *args, **kwargs):
+        tourney_id = signature.bind_partial(self, ctx, *args, **kwargs).arguments.get('tourney_id')
+        if tourney_id:
+            async with self.tournament_locks.acquire(tourney_id):
+                return await func(self, ctx, *args, **kwargs)
+        while True:
+            key = await active_tournament_key(ctx.guild.id)
+            async with self.tournament_locks.acquire(key):
+                if await active_tournament_key(ctx.guild.id, fresh=True) == key:
+                    return await func(self, ctx, *args, **kwargs)
+    return wrapper
+
 class Tourney(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.tournament_locks = TournamentLocks(TOURNAMENT_LOCKS_MAX, TOURNAMENT_LOCK_IDLE_TTL)
+        self.registration_sweep.start()
+
+    async def cog_load(self):
+        """
+        Precarga las fuentes del bracket para que el primer render no pague la lectura de disco.
+        """
+        await asyncio.to_thread(warm_fonts)
+
+    async def cog_unload(self):
+        """
+        Cierra el pool de render de brackets y detiene el barrido de inscripciones.
+        """
+        self.registration_sweep.cancel()
+        bracket_renderer.shutdown()
+
+    @tasks.loop(seconds=PENDING_REGISTRATION_SWEEP_INTERVAL)
+    async def registration_sweep(self):
+        """
+        Libera las plazas de las inscripciones caducadas aunque la vista que las creó ya no exista.
+        """
+        try:
+            released = await DBManager.release_expired_registrations()
+        except Exception as e:
+            print(f"Error releasing expired registrations: {e}")
+            return
+        if released:
+            print(f"Expired registrations released: {released}")
+
+    @registration_sweep.before_loop
+    async def before_registration_sweep(self):
+        await self.bot.wait_until_ready()
     
     async def cog_check(self, ctx):
         return True
@@ -37,8 +166,8 @@ class Tourney(commands.Cog):
         if not config:
             return
         
-        logs_enabled = config.get("tourney_logs_enabled", False)
-        log_channel_id = config.get("tourney_log_channel_id")
+        logs_enabled = config.tourney_logs_enabled
+        log_channel_id = config.tourney_log_channel_id
         
         if not logs_enabled or not log_channel_id:
             return
@@ -64,8 +193,8 @@ class Tourney(commands.Cog):
             return True
         
         config = await DBManager.get_guild_config(ctx.guild.id)
-        if config and 'admin_roles' in config:
-            allowed_roles = config.get('admin_roles', [])
+        if config and config.admin_roles:
+            allowed_roles = config.admin_roles
             for role in ctx.author.roles:
                 if str(role.id) in allowed_roles:
                     return True
@@ -85,8 +214,8 @@ class Tourney(commands.Cog):
         if not config:
             return True
         
-        lobby_channel = config.get('lobby_channel_id')
-        bot_admin_channel = config.get('bot_admin_channel_id')
+        lobby_channel = config.lobby_channel_id
+        bot_admin_channel = config.bot_admin_channel_id
         
         allowed_channels = []
         if lobby_channel: allowed_channels.append(int(lobby_channel))
@@ -183,6 +312,8 @@ class Tourney(commands.Cog):
         embed_admin.add_field(name=f"{PREFIX}tourney roles [add/remove] <@rol>", value="Gestionar roles de admin.", inline=False)
         embed_admin.add_field(name=f"{PREFIX}tourney kick <id_equipo / @miembro>", value="Expulsar equipo del torneo.", inline=False)
         embed_admin.add_field(name=f"{PREFIX}tourney delete <id_torneo>", value="Elimina un torneo de la base de datos.", inline=False)
+        embed_admin.add_field(name=f"{PREFIX}tourney events", value="Muestra los últimos eventos del torneo activo.", inline=False)
+        embed_admin.add_field(name=f"{PREFIX}tourney rollback <n_evento>", value="Devuelve el torneo activo al estado tras ese evento.", inline=False)
         
         pages = [embed_user, embed_admin]
         
@@ -257,7 +388,7 @@ class Tourney(commands.Cog):
         elif ctx.guild.icon:
             image_url = str(ctx.guild.icon.url)
 
-        if await DBManager.get_active_tournament(ctx.guild.id):
+        if await DBManager.get_active_tournament(ctx.guild.id, fresh=True):
              await ctx.send(embed=self.get_embed("Error", "Ya hay un torneo activo. Finaliza primero.", discord.Color.red(), author=ctx.author))
              return
 
@@ -278,6 +409,8 @@ class Tourney(commands.Cog):
             "max_teams": max_teams,
             "min_members": min_members,
             "max_members": max_members,
+            "reserved_slots": 0,
+            "version": 0,
             "image_url": image_url
         }
         
@@ -304,6 +437,7 @@ class Tourney(commands.Cog):
         await ctx.send(embed=embed)
 
     @tourney.command(name="delete")
+    @serialized
     async def delete_tourney(self, ctx, tourney_id: str):
         """
         Se encarga de eliminar un torneo.
@@ -311,7 +445,7 @@ class Tourney(commands.Cog):
         if not await self.admin_check(ctx): 
             return
         
-        tourney = await DBManager.get_tournament(tourney_id)
+        tourney = await DBManager.get_tournament(tourney_id, fresh=True)
         if not tourney:
             await ctx.send(embed=self.get_embed("Error", f"No se encontró un torneo con ID `{tourney_id}`.", discord.Color.red(), author=ctx.author))
             return
@@ -383,6 +517,7 @@ class Tourney(commands.Cog):
         await ctx.send(embed=self.get_embed(f"Configuración del Servidor", desc, author=ctx.author))
 
     @tourney.command(name="close")
+    @serialized
     async def tourney_close(self, ctx):
         """
         Se encarga de cerrar las inscripciones del torneo.
@@ -410,6 +545,7 @@ class Tourney(commands.Cog):
         await ctx.send(embed=self.get_embed("Torneo Cerrado", "El estado del torneo se ha actualizado a **Pending**. Las inscripciones están ahora cerradas.", discord.Color.orange(), author=ctx.author))
 
     @tourney.command(name="open")
+    @serialized
     async def tourney_open(self, ctx):
         """
         Se encarga de abrir las inscripciones del torneo.
@@ -443,6 +579,7 @@ class Tourney(commands.Cog):
         await ctx.send(embed=self.get_embed("Torneo Abierto", "Las inscripciones están ahora abiertas.", discord.Color.green(), author=ctx.author))
 
     @tourney.command(name="start")
+    @serialized
     async def start_tourney(self, ctx, tourney_id: str = None):
         """
         Se encarga de iniciar el torneo.
@@ -450,7 +587,7 @@ class Tourney(commands.Cog):
         if not await self.admin_check(ctx): return
         
         if tourney_id:
-            tourney = await DBManager.get_tournament(tourney_id)
+            tourney = await DBManager.get_tournament(tourney_id, fresh=True)
         else:
             tourney = await DBManager.get_active_tournament(ctx.guild.id)
             
@@ -512,15 +649,15 @@ class Tourney(commands.Cog):
             else:
                  m['winner_id'] = None
 
-        tourney['status'] = "active"
-        tourney['current_round'] = 1
-        tourney['matches'] = [matches]
-        
-        await DBManager.update_tournament(tourney['id'], {
+        updated = await DBManager.update_tournament_if_version(tourney['id'], tourney.get('version', 0), {"$set": {
             "status": "active",
             "current_round": 1,
-            "matches": tourney['matches']
-        })
+            "matches": [matches]
+        }}, event="started")
+        if not updated:
+             await ctx.send(embed=self.get_embed("Error", "El torneo ha sido modificado mientras se iniciaba. Inténtalo de nuevo.", discord.Color.red(), author=ctx.author))
+             return
+        tourney.update(updated)
         
         teams_names = [t['name'] for t in teams]
         await self.send_log(
@@ -543,14 +680,14 @@ class Tourney(commands.Cog):
         Se encarga de procesar la ronda actual del torneo.
         """
         guild = ctx.guild
-        round_num = tourney['current_round']
-        current_round_matches = tourney['matches'][round_num - 1]
+        round_num = tourney.current_round
+        current_round_matches = tourney.matches[round_num - 1]
         
-        config = await DBManager.get_guild_config(guild.id)
-        if not config: config = {}
+        config = await DBManager.get_guild_config(guild.id) or GuildConfig(guild_id=guild.id)
         
-        teams_data = await DBManager.get_teams(tourney['id'])
-        team_names = {t['id']: t['name'] for t in teams_data}
+        teams_data = await DBManager.get_teams(tourney.id)
+        teams_by_id = {t.id: t for t in teams_data}
+        team_names = {t.id: t.name for t in teams_data}
         
         async def fetch_image(url):
             try:
@@ -570,7 +707,7 @@ class Tourney(commands.Cog):
         if tourney.get('image'):
              tourney_image_bytes = await fetch_image(tourney['image'])
         
-        bracket_buf = generate_bracket_image(
+        bracket_buf = await render_bracket(
             tourney, 
             round_num, 
             team_names,
@@ -579,35 +716,32 @@ class Tourney(commands.Cog):
             tourney_image_bytes=tourney_image_bytes
         )
         
-        bracket_channel_id = config.get('bracket_channel_id')
+        bracket_channel_id = config.bracket_channel_id
         if bracket_channel_id:
             ch = guild.get_channel(bracket_channel_id)
             if ch:
                 file = discord.File(bracket_buf, filename="bracket.png")
                 msg = await ch.send(content=f"Ronda {round_num}", file=file)
                 if msg.attachments:
-                    await DBManager.update_tournament(tourney['id'], {"last_bracket_url": msg.attachments[0].url})
+                    await DBManager.update_tournament(tourney.id, {"last_bracket_url": msg.attachments[0].url})
 
-        category_id = config.get('category_id')
+        category_id = config.category_id
         category = guild.get_channel(category_id) if category_id else None
         
         if not category:
              pass
 
-        new_matches_state = []
-        
-        for match in current_round_matches:
-            if match['winner_id']:
-                new_matches_state.append(match)
+        for match_idx, match in enumerate(current_round_matches):
+            if match.winner_id:
                 continue
             
-            t1_id = match['team1_id']
-            t2_id = match['team2_id']
+            t1_id = match.team1_id
+            t2_id = match.team2_id
             if t1_id == "BYE_SLOT": t1_id = None
             if t2_id == "BYE_SLOT": t2_id = None
             
-            t1 = next((t for t in teams_data if t['id'] == t1_id), None)
-            t2 = next((t for t in teams_data if t['id'] == t2_id), None)
+            t1 = teams_by_id.get(t1_id)
+            t2 = teams_by_id.get(t2_id)
             
             if t1 and t2 and category:
                 overwrites = {
@@ -615,30 +749,28 @@ class Tourney(commands.Cog):
                     guild.me: discord.PermissionOverwrite(read_messages=True)
                 }
                 
-                match_members = t1['members'] + t2['members']
+                match_members = t1.members + t2.members
                 for uid in match_members:
                     member = guild.get_member(uid)
                     if member:
                         overwrites[member] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
                 
-                ch_name = f"{t1['name']}-vs-{t2['name']}"
+                ch_name = f"{t1.name}-vs-{t2.name}"
                 try:
                     channel = await guild.create_text_channel(ch_name, category=category, overwrites=overwrites)
-                    match['channel_id'] = channel.id
+                    match.channel_id = channel.id
+                    updated = await DBManager.update_match(tourney.id, round_num - 1, match_idx, {"channel_id": channel.id})
+                    if updated:
+                        tourney.version = updated.version
                     
-                    embed = self.get_embed("Enfrentamiento", f"**{t1['name']}** vs **{t2['name']}**", author=ctx.author)
-                    embed.add_field(name=t1['name'], value="\n".join([f"<@{m}>" for m in t1['members']]))
-                    embed.add_field(name=t2['name'], value="\n".join([f"<@{m}>" for m in t2['members']]))
+                    embed = self.get_embed("Enfrentamiento", f"**{t1.name}** vs **{t2.name}**", author=ctx.author)
+                    embed.add_field(name=t1.name, value="\n".join([f"<@{m}>" for m in t1.members]))
+                    embed.add_field(name=t2.name, value="\n".join([f"<@{m}>" for m in t2.members]))
                     await channel.send(embed=embed)
-                    await channel.send(f"<@{t1['leader_id']}> <@{t2['leader_id']}> ¡Comenzad!")
+                    await channel.send(f"<@{t1.leader_id}> <@{t2.leader_id}> ¡Comenzad!")
                     
                 except Exception as e:
                     print(f"Error creating channel: {e}")
-            
-            new_matches_state.append(match)
-            
-        tourney['matches'][round_num - 1] = new_matches_state
-        await DBManager.update_tournament(tourney['id'], {"matches": tourney['matches']})
 
     @tourney.group(name="set", invoke_without_command=True)
     async def tourney_set(self, ctx):
@@ -730,78 +862,97 @@ class Tourney(commands.Cog):
         await ctx.send(embed=self.get_embed("Prefijo Actualizado", f"El prefijo del bot ha sido cambiado a `{new_prefix}`", author=ctx.author))
 
     @tourney_set.command(name="winner")
+    @serialized
     async def set_winner_cmd(self, ctx, member: discord.Member):
         if not await self.admin_check(ctx): return
         
         tourney = await DBManager.get_active_tournament(ctx.guild.id)
-        if not tourney or tourney['status'] != "active":
+        if not tourney or tourney.status != "active":
              await ctx.send(embed=self.get_embed("Error", "No hay torneo activo.", discord.Color.red(), author=ctx.author))
              return
              
         team_id = None
-        user_team = await DBManager.get_team_by_member(member.id, tourney['id'])
+        user_team = await DBManager.get_team_by_member(member.id, tourney.id)
         if user_team:
-            team_id = user_team['id']
+            team_id = user_team.id
         else:
             await ctx.send(embed=self.get_embed("Error", f"El usuario {member.mention} no pertenece a ningún equipo en este torneo.", discord.Color.red(), author=ctx.author))
             return
 
-        round_idx = tourney['current_round'] - 1
-        current_matches = tourney['matches'][round_idx]
+        round_idx = tourney.current_round - 1
+        current_matches = tourney.matches[round_idx]
         
         found_match = None
-        for match in current_matches:
-            if match['team1_id'] == team_id or match['team2_id'] == team_id:
+        found_idx = None
+        for idx, match in enumerate(current_matches):
+            if match.team1_id == team_id or match.team2_id == team_id:
                 found_match = match
+                found_idx = idx
                 break
                 
         if not found_match:
              await ctx.send(embed=self.get_embed("Error", "Equipo no encontrado en la ronda actual.", discord.Color.red(), author=ctx.author))
              return
              
-        if found_match['winner_id']:
+        if found_match.winner_id:
              await ctx.send(embed=self.get_embed("Error", "Este enfrentamiento ya tiene ganador.", discord.Color.red(), author=ctx.author))
              return
              
-        found_match['winner_id'] = team_id
+        updated = await DBManager.set_match_winner(tourney.id, round_idx, found_idx, team_id)
+        if not updated:
+             await ctx.send(embed=self.get_embed("Error", "Este enfrentamiento ya tiene ganador.", discord.Color.red(), author=ctx.author))
+             return
+
+        tourney = updated
+        current_matches = tourney.matches[round_idx]
         
-        if found_match['channel_id']:
-            ch = ctx.guild.get_channel(found_match['channel_id'])
+        if found_match.channel_id:
+            ch = ctx.guild.get_channel(found_match.channel_id)
             if ch:
-                await ch.send(embed=self.get_embed("Ganador Establecido", f"El equipo **{user_team['name']}** avanza. (ID: {team_id})", author=ctx.author))
+                await ch.send(embed=self.get_embed("Ganador Establecido", f"El equipo **{user_team.name}** avanza. (ID: {team_id})", author=ctx.author))
                 pass 
 
-        await DBManager.update_tournament(tourney['id'], {"matches": tourney['matches']})
-        await ctx.send(embed=self.get_embed("Ganador Establecido", f"El equipo **{user_team['name']}** avanza.", author=ctx.author))
+        await ctx.send(embed=self.get_embed("Ganador Establecido", f"El equipo **{user_team.name}** avanza.", author=ctx.author))
         
-        if all(m['winner_id'] for m in current_matches):
+        if all(m.winner_id for m in current_matches):
             await self.advance_round(ctx, tourney)
 
     async def advance_round(self, ctx, tourney):
-        current_matches = tourney['matches'][tourney['current_round'] - 1]
-        winners = [m['winner_id'] for m in current_matches]
+        current_matches = tourney.matches[tourney.current_round - 1]
+        winners = [m.winner_id for m in current_matches]
         
         if len(winners) == 1:
             winner_team = await DBManager.get_team(winners[0])
             
             if winners[0] == "BYE_SLOT":
+                 if not await DBManager.update_tournament_if_version(tourney.id, tourney.version, {"$set": {"status": "Terminado", "finished_at": datetime.datetime.utcnow()}}, event="finished"):
+                     return
                  await ctx.send(embed=self.get_embed("Torneo Finalizado", "El torneo ha finalizado sin ganador real (Rama vacía).", author=ctx.author))
-                 tourney['status'] = "finished"
-                 await DBManager.update_tournament(tourney['id'], {"status": "Terminado"})
+                 tourney.status = "finished"
                  return 
 
+            # Solo el proceso que consigue cerrar el torneo publica el resultado
+            updated = await DBManager.update_tournament_if_version(
+                tourney.id, tourney.version,
+                {"$set": {"status": "finished", "winner_id": winner_team.id, "finished_at": datetime.datetime.utcnow()}},
+                event="finished"
+            )
+            if not updated:
+                return
+            tourney.version = updated.version
+
             server_name = ctx.guild.name
             
             config = await DBManager.get_guild_config(ctx.guild.id)
-            bracket_channel_id = config.get('bracket_channel_id') if config else None
+            bracket_channel_id = config.bracket_channel_id if config else None
             
             target_channel = ctx.channel
             if bracket_channel_id:
                 bc = ctx.guild.get_channel(bracket_channel_id)
                 if bc: target_channel = bc
 
-            teams_data = await DBManager.get_teams(tourney['id'])
-            team_names = {t['id']: t['name'] for t in teams_data}
+            teams_data = await DBManager.get_teams(tourney.id)
+            team_names = {t.id: t.name for t in teams_data}
             
             async def fetch_image(url):
                 try:
@@ -821,11 +972,11 @@ class Tourney(commands.Cog):
             if tourney.get('image'):
                  tourney_image_bytes = await fetch_image(tourney['image'])
             
-            tourney['winner_id'] = winner_team['id']
+            tourney.winner_id = winner_team.id
             
-            final_bracket_buf = generate_bracket_image(
+            final_bracket_buf = await render_bracket(
                 tourney, 
-                tourney['current_round'], 
+                tourney.current_round, 
                 team_names,
                 server_name=ctx.guild.name,
                 server_icon_bytes=server_icon_bytes,
@@ -836,32 +987,31 @@ class Tourney(commands.Cog):
                 file = discord.File(final_bracket_buf, filename="final_bracket.png")
                 msg = await target_channel.send(content=f"", file=file)
                 if msg.attachments:
-                    await DBManager.update_tournament(tourney['id'], {"last_bracket_url": msg.attachments[0].url})
+                    await DBManager.update_tournament(tourney.id, {"last_bracket_url": msg.attachments[0].url})
 
             if 'matches' in tourney:
-                for round_matches in tourney['matches']:
+                for round_matches in tourney.matches:
                     for m in round_matches:
-                        if m.get('channel_id'):
+                        if m.channel_id:
                             try:
-                                channel = ctx.guild.get_channel(m['channel_id'])
+                                channel = ctx.guild.get_channel(m.channel_id)
                                 if channel:
                                     await channel.delete(reason="Torneo finalizado")
                             except Exception as e:
-                                print(f"Error deleting channel {m['channel_id']}: {e}")
+                                print(f"Error deleting channel {m.channel_id}: {e}")
             
-            tourney['status'] = "finished"
-            tourney['winner_id'] = winner_team['id']
-            await DBManager.update_tournament(tourney['id'], {"status": "finished", "winner_id": winner_team['id']})
-            ENLACE_TORNEO = f"https://tourneydoc.victormenjon.es/tournament?guild={ctx.guild.id}&tourney={tourney['id']}"
+            tourney.status = "finished"
+            tourney.winner_id = winner_team.id
+            ENLACE_TORNEO = f"https://tourneydoc.victormenjon.es/tournament?guild={ctx.guild.id}&tourney={tourney.id}"
             
             embed = discord.Embed(
                 title="¡TORNEO FINALIZADO!",
                 url=ENLACE_TORNEO,
-                description=f"**{tourney.get('name', 'Torneo')}**\n\n{tourney.get('description', '')}",
+                description=f"**{tourney.name}**\n\n{tourney.description}",
                 color=discord.Color.gold()
             )
             
-            thumbnail_url = tourney.get('image_url')
+            thumbnail_url = tourney.image_url
             if not thumbnail_url and ctx.guild.icon:
                 thumbnail_url = ctx.guild.icon.url
             if thumbnail_url:
@@ -869,12 +1019,12 @@ class Tourney(commands.Cog):
             
             embed.add_field(name="Fecha", value=tourney.get('start_date', 'N/A'), inline=True)
             embed.add_field(name="Equipos", value=str(len(teams_data)), inline=True)
-            embed.add_field(name="Rondas", value=str(tourney.get('current_round', 1)), inline=True)
+            embed.add_field(name="Rondas", value=str(tourney.current_round), inline=True)
             
-            embed.add_field(name="EQUIPO CAMPEÓN", value=f"**{winner_team['name']}**", inline=False)
+            embed.add_field(name="EQUIPO CAMPEÓN", value=f"**{winner_team.name}**", inline=False)
             
-            members_mentions = [f"<@{uid}>" for uid in winner_team.get('members', [])]
-            leader_id = winner_team.get('leader_id')
+            members_mentions = [f"<@{uid}>" for uid in winner_team.members]
+            leader_id = winner_team.leader_id
             members_str = "\n".join(members_mentions) if members_mentions else "Sin miembros"
             embed.add_field(name="LÍDER", value=f"<@{leader_id}>" if leader_id else "N/A", inline=True)
             embed.add_field(name="MIEMBROS", value=members_str, inline=True)
@@ -885,17 +1035,16 @@ class Tourney(commands.Cog):
             )
             
             await self.send_log(
-                ctx.guild, tourney['id'],
+                ctx.guild, tourney.id,
                 "🏆 Torneo Finalizado",
-                f"**{tourney['name']}**\n\n**Campeón:** {winner_team['name']}\n**Líder:** <@{leader_id}>\n**Rondas jugadas:** {tourney.get('current_round', 1)}\n**Total equipos:** {len(teams_data)}",
+                f"**{tourney.name}**\n\n**Campeón:** {winner_team.name}\n**Líder:** <@{leader_id}>\n**Rondas jugadas:** {tourney.current_round}\n**Total equipos:** {len(teams_data)}",
                 discord.Color.green()
             )
             
             await target_channel.send(embed=embed)
             
         else:
-            tourney['current_round'] += 1
-            matches = []
+            current_round = tourney.current_round
             matches = []
             for i in range(0, len(winners), 2):
                 if i + 1 < len(winners):
@@ -915,37 +1064,44 @@ class Tourney(commands.Cog):
                 else:
                      pass
             
-            tourney['matches'].append(matches)
-            await DBManager.update_tournament(tourney['id'], {
-                "current_round": tourney['current_round'],
-                "matches": tourney['matches']
-            })
+            def next_round(doc):
+                # Aborta si otro proceso ya avanzó la ronda o cambió sus resultados
+                if doc.current_round != current_round:
+                    return None
+                if [m.winner_id for m in doc.matches[current_round - 1]] != winners:
+                    return None
+                return {"$push": {"matches": matches}, "$set": {"current_round": current_round + 1}}
+
+            updated = await DBManager.modify_tournament(tourney.id, next_round, event="round_advanced")
+            if not updated:
+                return
+            tourney.update(updated)
             
-            prev_round = tourney['current_round'] - 1
-            prev_matches = tourney['matches'][prev_round - 1]
-            team_names = await DBManager.get_teams(tourney['id'])
-            team_map = {t['id']: t['name'] for t in team_names}
+            prev_round = tourney.current_round - 1
+            prev_matches = tourney.matches[prev_round - 1]
+            team_names = await DBManager.get_teams(tourney.id)
+            team_map = {t.id: t.name for t in team_names}
             
             summary_lines = []
             for m in prev_matches:
-                t1_name = team_map.get(m['team1_id'], 'BYE') if m['team1_id'] != "BYE_SLOT" else "BYE"
-                t2_name = team_map.get(m['team2_id'], 'BYE') if m['team2_id'] != "BYE_SLOT" else "BYE"
-                winner_name = team_map.get(m['winner_id'], 'BYE') if m['winner_id'] != "BYE_SLOT" else "BYE"
+                t1_name = team_map.get(m.team1_id, 'BYE') if m.team1_id != "BYE_SLOT" else "BYE"
+                t2_name = team_map.get(m.team2_id, 'BYE') if m.team2_id != "BYE_SLOT" else "BYE"
+                winner_name = team_map.get(m.winner_id, 'BYE') if m.winner_id != "BYE_SLOT" else "BYE"
                 summary_lines.append(f"**{t1_name}** vs **{t2_name}** → 🏆 {winner_name}")
             
             await self.send_log(
-                ctx.guild, tourney['id'],
+                ctx.guild, tourney.id,
                 f"📊 Resumen Ronda {prev_round}",
-                f"**{tourney['name']}**\n\n" + "\n".join(summary_lines) + f"\n\n*Avanzando a Ronda {tourney['current_round']}...*",
+                f"**{tourney.name}**\n\n" + "\n".join(summary_lines) + f"\n\n*Avanzando a Ronda {tourney.current_round}...*",
                 discord.Color.purple()
             )
             
-            await ctx.send(f"¡Ronda {tourney['current_round'] - 1} finalizada! Iniciando Ronda {tourney['current_round']}...")
+            await ctx.send(f"¡Ronda {tourney.current_round - 1} finalizada! Iniciando Ronda {tourney.current_round}...")
             await self.process_round(ctx, tourney)
 
-            new_round_matches = tourney['matches'][-1]
-            if all(m['winner_id'] for m in new_round_matches):
-                await ctx.send(f"¡Ronda {tourney['current_round']} resuelta automáticamente! Avanzando...")
+            new_round_matches = tourney.matches[-1]
+            if all(m.winner_id for m in new_round_matches):
+                await ctx.send(f"¡Ronda {tourney.current_round} resuelta automáticamente! Avanzando...")
                 await self.advance_round(ctx, tourney)
 
 
@@ -1022,31 +1178,79 @@ class Tourney(commands.Cog):
             await ctx.send(embed=self.get_embed("Error", "No se encontró torneo.", author=ctx.author, color=discord.Color.red()))
             return
 
-        ENLACE_TORNEO = f"https://tourneydoc.victormenjon.es/tournament?guild={ctx.guild.id}&tourney={tourney['id']}"
-        embed = self.get_embed(f"Info Torneo: {tourney['name']}", tourney.get('description', ''), author=ctx.author, url=ENLACE_TORNEO)
-        embed.add_field(name="ID", value=tourney['id'], inline=True)
-        embed.add_field(name="Estado", value=tourney['status'], inline=True)
-        embed.add_field(name="Ronda Actual", value=str(tourney.get('current_round', 0)), inline=True)
+        ENLACE_TORNEO = f"https://tourneydoc.victormenjon.es/tournament?guild={ctx.guild.id}&tourney={tourney.id}"
+        embed = self.get_embed(f"Info Torneo: {tourney.name}", tourney.description, author=ctx.author, url=ENLACE_TORNEO)
+        embed.add_field(name="ID", value=tourney.id, inline=True)
+        embed.add_field(name="Estado", value=tourney.status, inline=True)
+        embed.add_field(name="Ronda Actual", value=str(tourney.current_round), inline=True)
         
-        if 'date' in tourney:
-             embed.add_field(name="Fecha Evento", value=tourney['date'], inline=True)
-             embed.add_field(name="Inscripciones", value=f"{tourney.get('registration_start_time','?')} - {tourney.get('registration_end_time','?')}", inline=True)
-             embed.add_field(name="Inicio Torneo", value=tourney.get('start_time','?'), inline=True)
+        if tourney.date:
+             embed.add_field(name="Fecha Evento", value=tourney.date, inline=True)
+             embed.add_field(name="Inscripciones", value=f"{tourney.registration_start_time or '?'} - {tourney.registration_end_time or '?'}", inline=True)
+             embed.add_field(name="Inicio Torneo", value=tourney.start_time or '?', inline=True)
         else:
              embed.add_field(name="Inicio Programado", value=tourney.get('start_date', 'N/A'), inline=False)
         
-        teams = await DBManager.get_teams(tourney['id'])
-        max_teams = tourney.get('max_teams', 'âˆž')
-        embed.add_field(name="Equipos", value=f"{len(teams)} / {max_teams}", inline=True)
-        
-        min_m = tourney.get('min_members', 1)
-        max_m = tourney.get('max_members', 5)
-        embed.add_field(name="Miembros por Equipo", value=f"{min_m} - {max_m}", inline=True)
+        if tourney.get('archived'):
+            teams_count = tourney.get('teams_count', 0)
+        else:
+            teams_count = await DBManager.count_teams(tourney.id)
+        embed.add_field(name="Equipos", value=f"{teams_count} / {tourney.max_teams}", inline=True)
+        embed.add_field(name="Miembros por Equipo", value=f"{tourney.min_members} - {tourney.max_members}", inline=True)
 
-        if tourney.get("image_url"):
-            embed.set_image(url=tourney["image_url"])
+        if tourney.image_url:
+            embed.set_image(url=tourney.image_url)
             
         await ctx.send(embed=embed)
+
+    @tourney.command(name="events")
+    async def tourney_events(self, ctx):
+        """
+        Muestra los últimos eventos del torneo activo
+        """
+        if not await self.admin_check(ctx): return
+
+        tourney = await DBManager.get_active_tournament(ctx.guild.id)
+        if not tourney:
+            await ctx.send(embed=self.get_embed("Error", "No hay torneo activo.", discord.Color.red(), author=ctx.author))
+            return
+
+        events = await DBManager.get_tournament_events(tourney['id'], limit=15)
+        if not events:
+            await ctx.send(embed=self.get_embed("Eventos", "El torneo no tiene eventos registrados.", author=ctx.author))
+            return
+
+        lines = []
+        for event in events:
+            ts = int(event['created_at'].replace(tzinfo=datetime.timezone.utc).timestamp())
+            lines.append(f"`#{event['seq']}` **{event['type']}** <t:{ts}:R>")
+        await ctx.send(embed=self.get_embed(f"Eventos: {tourney['name']}", "\n".join(lines), author=ctx.author))
+
+    @tourney.command(name="rollback")
+    @serialized
+    async def tourney_rollback(self, ctx, seq: int):
+        """
+        Devuelve el torneo activo al estado que tenía tras el evento indicado
+        """
+        if not await self.admin_check(ctx): return
+
+        tourney = await DBManager.get_active_tournament(ctx.guild.id)
+        if not tourney:
+            await ctx.send(embed=self.get_embed("Error", "No hay torneo activo.", discord.Color.red(), author=ctx.author))
+            return
+
+        updated = await DBManager.rollback_tournament(tourney['id'], seq)
+        if not updated:
+            await ctx.send(embed=self.get_embed("Error", f"No se pudo reconstruir el estado del evento #{seq}.", discord.Color.red(), author=ctx.author))
+            return
+
+        await self.send_log(
+            ctx.guild, tourney['id'],
+            "⏪ Torneo Restaurado",
+            f"**{tourney['name']}**\n\n**Evento:** #{seq}\n**Estado:** {updated['status']}\n**Ronda:** {updated.get('current_round', 0)}\n**Restaurado por:** {ctx.author.mention}",
+            discord.Color.orange()
+        )
+        await ctx.send(embed=self.get_embed("Torneo Restaurado", f"El torneo **{tourney['name']}** ha vuelto al estado del evento #{seq}. Los canales de partidos no se modifican.", author=ctx.author))
         
     @tourney.command(name="historial")
     async def tourney_history(self, ctx):
@@ -1055,14 +1259,7 @@ class Tourney(commands.Cog):
         """ 
         if not await self.channel_check(ctx): return
         
-        async def get_history_page(page_num):
-             items_per_page = 1
-             skip = page_num * items_per_page
-             history = await DBManager.get_tournaments_history(ctx.guild.id, skip=skip, limit=items_per_page)
-             total = await DBManager.count_tournaments(ctx.guild.id)
-             return history, total, items_per_page
-             
-        data, total, per_page = await get_history_page(0)
+        data, total = await DBManager.get_history_page(ctx.guild.id, limit=1, with_total=True)
         if not data:
             await ctx.send("No hay historial.")
             return
@@ -1071,7 +1268,7 @@ class Tourney(commands.Cog):
             await ctx.send("No hay historial.")
             return
 
-        async def build_history_embed(t, page, total):
+        def build_history_embed(t, page, total):
             desc = t.get('description', '')
             embed = self.get_embed(f"Historial {page}/{total}: {t['name']}", desc, author=ctx.author)
             
@@ -1080,7 +1277,7 @@ class Tourney(commands.Cog):
             embed.add_field(name="Fecha Inicio", value=t.get('start_date', 'N/A'), inline=True)
             
             if t.get('winner_id'):
-                winner_team = await DBManager.get_team(t['winner_id'])
+                winner_team = t.get('winner_team')
                 w_name = winner_team['name'] if winner_team else "Desconocido"
                 
                 members_str = ""
@@ -1089,39 +1286,47 @@ class Tourney(commands.Cog):
                 
                 embed.add_field(name="Ganador", value=f"**{w_name}** - {members_str}", inline=False)
             
-            teams_count = await DBManager.get_teams(t['id'])
-            embed.add_field(name="Equipos", value=str(len(teams_count)), inline=True)
+            embed.add_field(name="Equipos", value=str(t.get('teams_count', 0)), inline=True)
             
             if t.get('image_url'): embed.set_image(url=t['image_url'])
             return embed
 
-        embed = await build_history_embed(data[0], 1, total)
+        embed = build_history_embed(data[0], 1, total)
 
         class HistoryPaginator(discord.ui.View):
-            def __init__(self, cog, total_pages):
+            """
+            Pagina el historial usando como cursor el (created_at, id) del torneo mostrado.
+            """
+            def __init__(self, cog, total_pages, first):
                 super().__init__(timeout=60)
                 self.cog = cog
                 self.current_page = 0
                 self.total_pages = total_pages
+                self.cursor = DBManager.history_cursor(first)
 
-            async def update_embed(self, interaction):
-                data, _, _ = await get_history_page(self.current_page)
+            async def update_embed(self, interaction, direction):
+                data, _ = await DBManager.get_history_page(ctx.guild.id, cursor=self.cursor, direction=direction, limit=1)
+                if data:
+                    step = 1 if direction == "next" else -1
+                    self.current_page = (self.current_page + step) % self.total_pages
+                else:
+                    data, _ = await DBManager.get_history_page(ctx.guild.id, direction=direction, limit=1)
+                    self.current_page = 0 if direction == "next" else self.total_pages - 1
                 if not data: return
                 t = data[0]
-                embed = await build_history_embed(t, self.current_page + 1, self.total_pages)
+                self.cursor = DBManager.history_cursor(t)
+                embed = build_history_embed(t, self.current_page + 1, self.total_pages)
                 await interaction.response.edit_message(embed=embed)
 
             @discord.ui.button(label="<", style=discord.ButtonStyle.primary)
             async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-                self.current_page = (self.current_page - 1) % self.total_pages
-                await self.update_embed(interaction)
+                await self.update_embed(interaction, "prev")
 
             @discord.ui.button(label=">", style=discord.ButtonStyle.primary)
             async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-                self.current_page = (self.current_page + 1) % self.total_pages
-                await self.update_embed(interaction)
+                await self.update_embed(interaction, "next")
                 
-        await ctx.send(embed=embed, view=HistoryPaginator(self, total))
+        await ctx.send(embed=embed, view=HistoryPaginator(self, total, data[0]))
 
     @tourney.command(name="register")
     async def register_team(self, ctx, name: str, *members: discord.Member):
@@ -1133,57 +1338,59 @@ class Tourney(commands.Cog):
              await ctx.send(embed=self.get_embed("Error", "No hay ningún torneo activo en este servidor para registrarse.", discord.Color.red(), author=ctx.author))
              return
         
-        tourney_id = active_tourney['id']
+        tourney_id = active_tourney.id
 
         if name.startswith("<@") and name.endswith(">"):
              await ctx.send(embed=self.get_embed("Error de Formato", f"Parece que has introducido una mención como nombre de equipo.\nUso correcto: `{PREFIX}tourney register <NombreEquipo> <@Miembros...>`", discord.Color.red(), author=ctx.author))
              return
 
-        if active_tourney['status'] != "open":
+        if active_tourney.status != "open":
              await ctx.send(embed=self.get_embed("Error", "El torneo no está abierto para registros.", discord.Color.red(), author=ctx.author))
              return
              
-        if await DBManager.get_team_by_name(name, tourney_id):
-             await ctx.send(embed=self.get_embed("Error", "Ya existe un equipo con ese nombre.", discord.Color.red(), author=ctx.author))
-             return
-
         all_members = list(set([ctx.author] + list(members)))
         
-        for member in all_members:
-            existing_team = await DBManager.get_team_by_member(member.id, active_tourney['id'])
-            if existing_team:
-                await ctx.send(embed=self.get_embed("Error", f"El usuario {member.mention} ya pertenece al equipo **{existing_team['name']}**.\nNo puede unirse a otro equipo.", discord.Color.red()))
-                return
-        
-        min_m = active_tourney.get('min_members', 1)
-        max_m = active_tourney.get('max_members', 5)
+        min_m = active_tourney.min_members
+        max_m = active_tourney.max_members
         
         if not (min_m <= len(all_members) <= max_m):
              await ctx.send(embed=self.get_embed("Error", f"El equipo debe tener entre {min_m} y {max_m} miembros (incluyendo al líder).\nSe encontraron: **{len(all_members)}** (Recuerda que el primer argumento es el nombre del equipo).", discord.Color.red(), author=ctx.author))
              return
              
-        current_teams_count = len(await DBManager.get_teams(tourney_id))
-        max_t = active_tourney.get('max_teams', 16)
-        if current_teams_count >= max_t:
-             await ctx.send(embed=self.get_embed("Error", "El torneo ha alcanzado el límite de equipos.", discord.Color.red(), author=ctx.author))
-             return
-
         member_ids = [m.id for m in all_members]
         
-        if not hasattr(self, 'pending_teams'):
-            self.pending_teams = {}
+        # Comprobación previa (roster cacheado) para no reservar plaza ni enviar MDs a un equipo que no se podrá crear.
+        # Los índices únicos siguen siendo la garantía final
+        if await DBManager.get_team_by_name(name, tourney_id):
+             await ctx.send(embed=self.get_embed("Error", "Ya existe un equipo con ese nombre.", discord.Color.red(), author=ctx.author))
+             return
+        
+        existing_teams = await DBManager.get_teams_by_members(member_ids, tourney_id)
+        for member in all_members:
+            existing_team = next((t for t in existing_teams if member.id in t.members), None)
+            if existing_team:
+                await ctx.send(embed=self.get_embed("Error", f"El usuario {member.mention} ya pertenece al equipo **{existing_team.name}**.\nNo puede unirse a otro equipo.", discord.Color.red(), author=ctx.author))
+                return
         
+        # La inscripción se guarda antes de reservar: así cada plaza reservada tiene un documento que la respalda
         pending_id = str(uuid.uuid4())
-        self.pending_teams[pending_id] = {
+        expires_at = await DBManager.create_pending_registration({
+            "id": pending_id,
             "tourney_id": tourney_id,
             "name": name,
             "leader_id": ctx.author.id,
             "members": member_ids,
             "confirmed": [ctx.author.id],
+            "channel_id": ctx.channel.id,
             "message_ids": []
-        }
+        })
+        
+        if not await DBManager.reserve_team_slot(tourney_id, pending_id):
+             await DBManager.delete_pending_registration(pending_id)
+             await ctx.send(embed=self.get_embed("Error", "El torneo ha alcanzado el límite de equipos.", discord.Color.red(), author=ctx.author))
+             return
         
-        confirm_view = ConfirmRegistrationView(self.bot, pending_id, self)
+        confirm_view = ConfirmRegistrationView(self.bot, pending_id, self, expires_at)
         
         msgs_sent = 0
         for member in all_members:
@@ -1192,33 +1399,65 @@ class Tourney(commands.Cog):
             
             try:
                 await member.send(
-                    embed=self.get_embed("Invitación a Equipo", f"Has sido invitado al equipo **{name}** para el torneo **{active_tourney['name']}**.\nConfirma para unirte.", author=ctx.author),
+                    embed=self.get_embed("Invitación a Equipo", f"Has sido invitado al equipo **{name}** para el torneo **{active_tourney.name}**.\nConfirma para unirte.", author=ctx.author),
                     view=confirm_view
                 )
                 msgs_sent += 1
                 await self.send_log(
                     ctx.guild, tourney_id,
                     "📩 Invitación Enviada (DM)",
-                    f"**Destinatario:** {member.mention}\n**Equipo:** {name}\n**Torneo:** {active_tourney['name']}",
+                    f"**Destinatario:** {member.mention}\n**Equipo:** {name}\n**Torneo:** {active_tourney.name}",
                     discord.Color(0xFFC0CB)
                 )
             except discord.Forbidden:
                 await ctx.send(f"No pude enviar MD a {member.mention}. Asegúrate de que tengan los MDs abiertos.")
-                del self.pending_teams[pending_id]
+                confirm_view.stop()
+                await DBManager.cancel_pending_registration(pending_id)
                 return
 
         if msgs_sent == 0:
-            await self.create_team_final(pending_id)
+            try:
+                await self.create_team_final(pending_id)
+            except DuplicateTeamError as e:
+                await ctx.send(embed=self.get_embed("Error", self.duplicate_team_message(e), discord.Color.red(), author=ctx.author))
+                return
             await ctx.send(embed=self.get_embed("Registro Completado", f"Equipo **{name}** registrado (Solo tú).", author=ctx.author))
         else:
             await ctx.send(embed=self.get_embed("Solicitud Enviada", f"Se ha enviado petición de confirmación a los miembros. El equipo se creará cuando todos acepten.", author=ctx.author))
 
+    async def notify_registration_failed(self, data: dict, error: DuplicateTeamError):
+        """
+        Avisa al líder (en el canal donde se hizo el registro o por MD) de que el equipo no se pudo crear.
+        """
+        embed = self.get_embed("Registro Fallido", f"No se pudo crear el equipo **{data['name']}**.\n{self.duplicate_team_message(error)}", discord.Color.red())
+        channel = self.bot.get_channel(data.get('channel_id')) if data.get('channel_id') else None
+        if channel:
+            try:
+                await channel.send(content=f"<@{data['leader_id']}>", embed=embed)
+                return
+            except discord.HTTPException:
+                pass
+        try:
+            leader = self.bot.get_user(data['leader_id']) or await self.bot.fetch_user(data['leader_id'])
+            await leader.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Could not notify leader {data['leader_id']} of failed registration: {e}")
+
+    def duplicate_team_message(self, error: DuplicateTeamError):
+        """
+        Obtiene el mensaje de error para un equipo que viola un índice único
+        """
+        if error.field == "name":
+            return "Ya existe un equipo con ese nombre."
+        return "Alguno de los miembros ya pertenece a otro equipo del torneo.\nNo puede unirse a otro equipo."
+
     async def create_team_final(self, pending_id):
         """
-        Crea el equipo en la base de datos
+        Crea el equipo en la base de datos.
+        Si el nombre o algún miembro ya está registrado, libera la plaza y lanza DuplicateTeamError
         """ 
-        if pending_id not in self.pending_teams: return
-        data = self.pending_teams[pending_id]
+        data = await DBManager.claim_pending_registration(pending_id)
+        if not data: return
         
         new_team = {
             "id": str(uuid.uuid4())[:8],
@@ -1227,10 +1466,17 @@ class Tourney(commands.Cog):
             "leader_id": data['leader_id'],
             "tournament_id": data['tourney_id']
         }
-        await DBManager.create_team(new_team)
+        try:
+            await DBManager.create_team(new_team)
+        except DuplicateTeamError:
+            await DBManager.release_team_slot(data['tourney_id'])
+            await DBManager.delete_pending_registration(pending_id)
+            raise
+        # La plaza ya la respalda el equipo
+        await DBManager.delete_pending_registration(pending_id)
         
-        tourney = await DBManager.get_tournament(data['tourney_id'])
-        guild = self.bot.get_guild(tourney['guild_id']) if tourney else None
+        tourney = await DBManager.get_tournament_fields(data['tourney_id'], "guild_id")
+        guild = self.bot.get_guild(tourney.guild_id) if tourney else None
 
         for uid in data['members']:
             user = self.bot.get_user(uid)
@@ -1266,8 +1512,6 @@ class Tourney(commands.Cog):
                 f"**{data['name']}**\n\n**Líder:** <@{data['leader_id']}>\n**Miembros:** {members_str}",
                 discord.Color.blue()
             )
-
-        del self.pending_teams[pending_id]
         
     @tourney.command(name="invite")
     async def invite_member(self, ctx, user: discord.Member):
@@ -1279,42 +1523,43 @@ class Tourney(commands.Cog):
             await ctx.send(embed=self.get_embed("Error", "No hay ningún torneo activo en este servidor.", discord.Color.red(), author=ctx.author))
             return
         
-        if active_tourney['status'] != "open":
+        if active_tourney.status != "open":
             await ctx.send(embed=self.get_embed("Error", "El torneo no está abierto para nuevos miembros.", discord.Color.red(), author=ctx.author))
             return
         
-        team = await DBManager.get_team_by_member(ctx.author.id, active_tourney['id'])
+        related_teams = await DBManager.get_teams_by_members([ctx.author.id, user.id], active_tourney.id)
+        team = next((t for t in related_teams if ctx.author.id in t.members), None)
         if not team:
             await ctx.send(embed=self.get_embed("Error", "No perteneces a ningún equipo en el torneo activo.", discord.Color.red(), author=ctx.author))
             return
             
-        if team['leader_id'] != ctx.author.id:
+        if team.leader_id != ctx.author.id:
             await ctx.send(embed=self.get_embed("Error", "Solo el líder del equipo puede invitar miembros.", discord.Color.red(), author=ctx.author))
             return
         
-        max_m = active_tourney.get('max_members', 5)
-        if len(team['members']) >= max_m:
+        max_m = active_tourney.max_members
+        if len(team.members) >= max_m:
             await ctx.send(embed=self.get_embed("Error", f"El equipo ya tiene el máximo de miembros permitidos ({max_m}).", discord.Color.red(), author=ctx.author))
             return
-             
-        existing_team = await DBManager.get_team_by_member(user.id, team['tournament_id'])
+        
+        existing_team = next((t for t in related_teams if user.id in t.members), None)
         if existing_team:
-             await ctx.send(embed=self.get_embed("Error", f"El usuario {user.mention} ya está en el equipo **{existing_team['name']}**.", discord.Color.red(), author=ctx.author))
-             return
+            await ctx.send(embed=self.get_embed("Error", f"El usuario {user.mention} ya está en el equipo **{existing_team.name}**.", discord.Color.red(), author=ctx.author))
+            return
 
-        view = ConfirmInviteView(self.bot, team['id'], user.id, self)
+        view = ConfirmInviteView(self.bot, team.id, user.id, self)
         try:
             await user.send(
-                embed=self.get_embed("Invitación", f"Te han invitado a unirte al equipo **{team['name']}** en el torneo **{active_tourney['name']}**.", author=ctx.author),
+                embed=self.get_embed("Invitación", f"Te han invitado a unirte al equipo **{team.name}** en el torneo **{active_tourney.name}**.", author=ctx.author),
                 view=view
             )
             await self.send_log(
-                ctx.guild, active_tourney['id'],
+                ctx.guild, active_tourney.id,
                 "📩 Invitación a Unirse (DM)",
-                f"**Destinatario:** {user.mention}\n**Equipo:** {team['name']}\n**Enviado por:** {ctx.author.mention}",
+                f"**Destinatario:** {user.mention}\n**Equipo:** {team.name}\n**Enviado por:** {ctx.author.mention}",
                 discord.Color(0xFFC0CB)
             )
-            await ctx.send(embed=self.get_embed("Invitación Enviada", f"Se ha enviado invitación a {user.mention} para unirse al equipo **{team['name']}**.", author=ctx.author))
+            await ctx.send(embed=self.get_embed("Invitación Enviada", f"Se ha enviado invitación a {user.mention} para unirse al equipo **{team.name}**.", author=ctx.author))
         except:
              await ctx.send(embed=self.get_embed("Error", f"No se pudo enviar MD a {user.mention}. Asegúrate de que tenga los MDs abiertos.", discord.Color.red(), author=ctx.author))
 
@@ -1328,48 +1573,50 @@ class Tourney(commands.Cog):
              await ctx.send(embed=self.get_embed("Error", "No hay torneo activo.", discord.Color.red(), author=ctx.author))
              return
         
-        if active_tourney['status'] != 'open':
+        if active_tourney.status != 'open':
              await ctx.send(embed=self.get_embed("Error", "El torneo no está abierto.", discord.Color.red(), author=ctx.author))
              return
              
-        team = await DBManager.get_team_by_member(ctx.author.id, active_tourney['id'])
+        team = await DBManager.get_team_by_member(ctx.author.id, active_tourney.id, fresh=True)
         if not team:
             await ctx.send(embed=self.get_embed("Error", "No perteneces a ningún equipo.", discord.Color.red(), author=ctx.author))
             return
             
-        if len(team['members']) == 1:
-            await DBManager.delete_team(team['id'])
+        if len(team.members) == 1:
+            await DBManager.release_team_slot(active_tourney.id)
+            await DBManager.delete_team(team.id)
             await self.send_log(
-                ctx.guild, active_tourney['id'],
+                ctx.guild, active_tourney.id,
                 "🗑️ Equipo Disuelto",
-                f"**{team['name']}** ha sido eliminado porque su único miembro {ctx.author.mention} lo abandonó.",
+                f"**{team.name}** ha sido eliminado porque su único miembro {ctx.author.mention} lo abandonó.",
                 discord.Color.orange()
             )
-            await ctx.send(embed=self.get_embed("Equipo Abandonado", f"Has abandonado el equipo **{team['name']}**. Al ser el último miembro, el equipo ha sido eliminado.", author=ctx.author))
+            await ctx.send(embed=self.get_embed("Equipo Abandonado", f"Has abandonado el equipo **{team.name}**. Al ser el último miembro, el equipo ha sido eliminado.", author=ctx.author))
             return
             
-        team['members'].remove(ctx.author.id)
-        update_data = {"members": team['members']}
+        team.members.remove(ctx.author.id)
+        update_data = {"members": team.members}
         msg_extra = ""
         
-        if team['leader_id'] == ctx.author.id:
-            new_leader_id = team['members'][0]
-            team['leader_id'] = new_leader_id
+        if team.leader_id == ctx.author.id:
+            new_leader_id = team.members[0]
+            team.leader_id = new_leader_id
             update_data['leader_id'] = new_leader_id
             msg_extra = f"\nEl liderazgo ha pasado a <@{new_leader_id}>."
             
-        await DBManager.update_team(team['id'], update_data)
+        await DBManager.update_team(team.id, update_data)
         
         await self.send_log(
-            ctx.guild, active_tourney['id'],
+            ctx.guild, active_tourney.id,
             "👋 Miembro Salió",
-            f"**{ctx.author.mention}** abandonó el equipo **{team['name']}**.{msg_extra}",
+            f"**{ctx.author.mention}** abandonó el equipo **{team.name}**.{msg_extra}",
             discord.Color.orange()
         )
         
-        await ctx.send(embed=self.get_embed("Equipo Abandonado", f"Has abandonado el equipo **{team['name']}**.{msg_extra}", author=ctx.author))
+        await ctx.send(embed=self.get_embed("Equipo Abandonado", f"Has abandonado el equipo **{team.name}**.{msg_extra}", author=ctx.author))
 
     @tourney.command(name="kick")
+    @serialized
     async def kick_team(self, ctx, target: str):
         """
         Expulsa a un equipo del torneo
@@ -1383,13 +1630,13 @@ class Tourney(commands.Cog):
         
         team = None
         
-        if tourney['status'] == 'active':
+        if tourney.status == 'active':
             await ctx.send(embed=self.get_embed("Error", "El torneo ya está en curso.", discord.Color.red(), author=ctx.author))
             return
 
-        team = await DBManager.get_team(target)
+        team = await DBManager.get_team(target, fresh=True)
         
-        if team and team['tournament_id'] != tourney['id']:
+        if team and team.tournament_id != tourney.id:
             team = None
             
         if not team:
@@ -1406,18 +1653,19 @@ class Tourney(commands.Cog):
                     pass
             
             if user_id:
-                team = await DBManager.get_team_by_member(user_id, tourney['id'])
+                team = await DBManager.get_team_by_member(user_id, tourney.id, fresh=True)
 
         if not team:
             await ctx.send(embed=self.get_embed("Error", "No se encontró el equipo. Asegúrate de usar el ID del equipo o mencionar a un miembro válido.", discord.Color.red(), author=ctx.author))
             return
         
-        team_name = team['name']
-        team_id = team['id']
+        team_name = team.name
+        team_id = team.id
+        await DBManager.release_team_slot(tourney.id)
         await DBManager.delete_team(team_id)
         
         await self.send_log(
-            ctx.guild, tourney['id'],
+            ctx.guild, tourney.id,
             "🗑️ Equipo Eliminado",
             f"**{team_name}**\n\n**Eliminado por:** {ctx.author.mention}",
             discord.Color.orange()
@@ -1432,7 +1680,7 @@ class Tourney(commands.Cog):
         """ 
         if not tourney_id:
              t = await DBManager.get_active_tournament(ctx.guild.id)
-             if t: tourney_id = t['id']
+             if t: tourney_id = t.id
         
         if not tourney_id:
              await ctx.send(embed=self.get_embed("Error", "Especifica ID de torneo o ten uno activo.", discord.Color.red(), author=ctx.author))
@@ -1445,8 +1693,8 @@ class Tourney(commands.Cog):
              
         desc = ""
         for team in teams:
-            leader_name = f"<@{team['leader_id']}>"
-            desc += f"**{team['name']}** (ID: `{team['id']}`) - Líder: {leader_name} - Miembros: {len(team['members'])}\n"
+            leader_name = f"<@{team.leader_id}>"
+            desc += f"**{team.name}** (ID: `{team.id}`) - Líder: {leader_name} - Miembros: {len(team.members)}\n"
             
         await ctx.send(embed=self.get_embed(f"Equipos Registrados ({len(teams)})", desc, author=ctx.author))
 
@@ -1474,7 +1722,7 @@ class Tourney(commands.Cog):
         if not team and user_id:
             active_t = await DBManager.get_active_tournament(ctx.guild.id)
             if active_t:
-                team = await DBManager.get_team_by_member(user_id, active_t['id'])
+                team = await DBManager.get_team_by_member(user_id, active_t.id)
         
         if not team:
             msg = "Equipo no encontrado o usuario no está en un equipo del torneo activo."
@@ -1483,8 +1731,8 @@ class Tourney(commands.Cog):
             await ctx.send(embed=self.get_embed("Error", msg, discord.Color.red(), author=ctx.author))
             return
             
-        members_str = ", ".join([f"<@{m}>" for m in team['members']])
-        embed = self.get_embed(f"Info Equipo: {team['name']}", f"ID: {team['id']}\nLíder: <@{team['leader_id']}>", author=ctx.author)
+        members_str = ", ".join([f"<@{m}>" for m in team.members])
+        embed = self.get_embed(f"Info Equipo: {team.name}", f"ID: {team.id}\nLíder: <@{team.leader_id}>", author=ctx.author)
         embed.add_field(name="Miembros", value=members_str)
         
         await ctx.send(embed=embed)
@@ -1531,35 +1779,41 @@ class Tourney(commands.Cog):
 
 
 class ConfirmRegistrationView(discord.ui.View):
-    def __init__(self, bot, pending_id, cog):
-        super().__init__(timeout=300)
+    def __init__(self, bot, pending_id, cog, expires_at: datetime.datetime):
+        # La vista caduca a la vez que la inscripción guardada
+        remaining = (expires_at - datetime.datetime.utcnow()).total_seconds()
+        super().__init__(timeout=max(1, remaining))
         self.bot = bot
         self.pending_id = pending_id
         self.cog = cog
 
+    async def on_timeout(self):
+        """
+        Libera la plaza reservada si la invitación expira sin que el equipo se haya formado.
+        El barrido periódico (release_expired_registrations) hace lo mismo si este proceso ya no existe
+        """
+        await DBManager.cancel_pending_registration(self.pending_id)
+
     @discord.ui.button(label="Aceptar", style=discord.ButtonStyle.green, emoji="✅")
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if self.pending_id not in self.cog.pending_teams:
+        data, confirmed_count, added = await DBManager.confirm_pending_member(self.pending_id, interaction.user.id)
+        if not data:
             await interaction.response.send_message("Esta invitación ha expirado o el equipo ya se formó/canceló.", ephemeral=True)
             return
 
-        data = self.cog.pending_teams[self.pending_id]
-        if interaction.user.id in data['confirmed']:
+        if not added:
             await interaction.response.send_message("Ya has confirmado.", ephemeral=True)
             return
 
-        existing = await DBManager.get_team_by_member(interaction.user.id, data['tourney_id'])
-        if existing:
-             await interaction.response.send_message(f"Ya perteneces al equipo **{existing['name']}**. No puedes unirte a este.", ephemeral=True)
-             return
-
-        data['confirmed'].append(interaction.user.id)
         await interaction.response.send_message("Has aceptado unirte al equipo.", ephemeral=True)
         
-        if all(uid in data['confirmed'] for uid in data['members']):
+        if confirmed_count >= len(data['members']):
             self.stop()
             try:
                 await self.cog.create_team_final(self.pending_id)
+            except DuplicateTeamError as e:
+                await interaction.followup.send(f"No se pudo crear el equipo **{data['name']}**. {self.cog.duplicate_team_message(e)}", ephemeral=True)
+                await self.cog.notify_registration_failed(data, e)
             except Exception as e:
                 import traceback
                 traceback.print_exc()
@@ -1582,31 +1836,30 @@ class ConfirmInviteView(discord.ui.View):
             await interaction.response.send_message("El equipo ya no existe.", ephemeral=True)
             return
             
-        if interaction.user.id in team['members']:
+        if interaction.user.id in team.members:
              await interaction.response.send_message("Ya estás en el equipo.", ephemeral=True)
              return
              
-        existing = await DBManager.get_team_by_member(interaction.user.id, team['tournament_id'])
-        if existing:
-             await interaction.response.send_message(f"Ya perteneces al equipo **{existing['name']}**. No puedes unirte a este.", ephemeral=True)
+        try:
+            await DBManager.add_team_member(self.team_id, interaction.user.id)
+        except DuplicateTeamError:
+             await interaction.response.send_message("Ya perteneces a otro equipo de este torneo. No puedes unirte a este.", ephemeral=True)
              return
              
-        team['members'].append(interaction.user.id)
-        from utils.db import teams_collection
-        await teams_collection.update_one({"id": self.team_id}, {"$set": {"members": team['members']}})
+        team.members.append(interaction.user.id)
         
-        tourney = await DBManager.get_tournament(team['tournament_id'])
+        tourney = await DBManager.get_tournament_fields(team.tournament_id, "guild_id")
         if tourney:
-            guild = self.bot.get_guild(tourney['guild_id'])
+            guild = self.bot.get_guild(tourney.guild_id)
             if guild:
                 await self.cog.send_log(
-                    guild, team['tournament_id'],
+                    guild, team.tournament_id,
                     "➕ Miembro Unido",
-                    f"**{team['name']}**\n\n**Nuevo miembro:** {interaction.user.mention}\n**Total miembros:** {len(team['members'])}",
+                    f"**{team.name}**\n\n**Nuevo miembro:** {interaction.user.mention}\n**Total miembros:** {len(team.members)}",
                     discord.Color.blue()
                 )
         
-        await interaction.response.send_message(f"Te has unido a **{team['name']}**!", ephemeral=True)
+        await interaction.response.send_message(f"Te has unido a **{team.name}**!", ephemeral=True)
         self.stop()
 
 
@@ -5,6 +5,14 @@ load_dotenv()
 
 #BASES DE DATOS
 URL_BASE_1: str = os.getenv("URL_BASE_1")
+# "mongo" (MongoDB vía Motor) o "memory" (en memoria, para pruebas de carga y CI)
+STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "mongo")
+MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_READ_PREFERENCE: str = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Lista separada por comas, p. ej. "zstd,snappy" (requiere los paquetes zstandard / python-snappy)
+MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "")
 
 #TOKEN
 BOT: str = os.getenv("DISCORD_BOT_TOKEN")
@@ -17,6 +25,60 @@ LOG_CHANNEL: int = int(os.getenv("LOG_CHANNEL_ID"))
 BUG_CHANNEL: int = int(os.getenv("BUG_CHANNEL_ID"))
 SERVER_LOG_CHANNEL: int = int(os.getenv("SERVER_LOG_CHANNEL_ID"))
 
+#CACHE
+GUILD_CONFIG_CACHE_TTL: int = int(os.getenv("GUILD_CONFIG_CACHE_TTL", "60"))
+GUILD_CONFIG_CACHE_SIZE: int = int(os.getenv("GUILD_CONFIG_CACHE_SIZE", "1000"))
+ACTIVE_TOURNAMENT_CACHE_TTL: int = int(os.getenv("ACTIVE_TOURNAMENT_CACHE_TTL", "300"))
+ACTIVE_TOURNAMENT_CACHE_SIZE: int = int(os.getenv("ACTIVE_TOURNAMENT_CACHE_SIZE", "1000"))
+ROSTER_CACHE_TTL: int = int(os.getenv("ROSTER_CACHE_TTL", "300"))
+ROSTER_CACHE_SIZE: int = int(os.getenv("ROSTER_CACHE_SIZE", "500"))
+
+#CONCURRENCIA
+TOURNAMENT_CAS_RETRIES: int = int(os.getenv("TOURNAMENT_CAS_RETRIES", "5"))
+TOURNAMENT_LOCKS_MAX: int = int(os.getenv("TOURNAMENT_LOCKS_MAX", "1000"))
+TOURNAMENT_LOCK_IDLE_TTL: int = int(os.getenv("TOURNAMENT_LOCK_IDLE_TTL", "600"))
+
+#HISTORIAL DE EVENTOS
+TOURNAMENT_SNAPSHOT_INTERVAL: int = int(os.getenv("TOURNAMENT_SNAPSHOT_INTERVAL", "20"))
+
+#ARCHIVO
+ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_HOURS: float = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+#FUENTES
+# Rutas candidatas separadas por comas; se usa la primera que se pueda cargar
+BRACKET_FONT_REGULAR: str = os.getenv("BRACKET_FONT_REGULAR", "arial.ttf,/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+BRACKET_FONT_BOLD: str = os.getenv("BRACKET_FONT_BOLD", "arialbd.ttf,/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf")
+# El título usa arial normal o, si no está, DejaVu en negrita (como siempre se ha dibujado)
+BRACKET_FONT_TITLE: str = os.getenv("BRACKET_FONT_TITLE", "arial.ttf,/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf")
+
+#CACHE DE BRACKETS
+BRACKET_CACHE_MAX_BYTES: int = int(os.getenv("BRACKET_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Carpeta para guardar también las imágenes en disco (vacío para desactivarlo)
+BRACKET_CACHE_DIR: str = os.getenv("BRACKET_CACHE_DIR", "")
+BRACKET_CACHE_DISK_MAX_BYTES: int = int(os.getenv("BRACKET_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+#RENDER DE BRACKETS
+# "process" (un proceso por núcleo) o "thread"
+BRACKET_RENDER_EXECUTOR: str = os.getenv("BRACKET_RENDER_EXECUTOR", "process")
+# 0 para usar tantos workers como núcleos
+BRACKET_RENDER_WORKERS: int = int(os.getenv("BRACKET_RENDER_WORKERS", "0"))
+# Renders enviados al pool a la vez; el resto espera su turno
+BRACKET_RENDER_QUEUE_SIZE: int = int(os.getenv("BRACKET_RENDER_QUEUE_SIZE", "8"))
+# Capas estáticas (esqueletos) de bracket guardadas por proceso; cada una ocupa ~2.7 MB
+BRACKET_SKELETON_CACHE_SIZE: int = int(os.getenv("BRACKET_SKELETON_CACHE_SIZE", "16"))
+
+#COPIAS DE SEGURIDAD
+BACKUP_BATCH_SIZE: int = int(os.getenv("BACKUP_BATCH_SIZE", "500"))
+
+#INSCRIPCIONES
+PENDING_REGISTRATION_TTL: int = int(os.getenv("PENDING_REGISTRATION_TTL", "300"))
+# Cada cuánto se liberan las plazas de las inscripciones caducadas (en cualquier proceso)
+PENDING_REGISTRATION_SWEEP_INTERVAL: int = int(os.getenv("PENDING_REGISTRATION_SWEEP_INTERVAL", "60"))
+# Margen del índice TTL: solo borra las inscripciones que el barrido no haya procesado
+PENDING_REGISTRATION_TTL_MARGIN: int = int(os.getenv("PENDING_REGISTRATION_TTL_MARGIN", "3600"))
+
 #DOCUMENTACION
 DOC_URL: str = os.getenv("DOC_URL")
 OWNER = [int(os.getenv("OWNER_ID"))]
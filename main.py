@@ -129,6 +129,25 @@ async def main():
     Función principal que inicia el bot.
     """
     async with bot:
+        try:
+            latency = await DBManager.ping()
+        except Exception as e:
+            print(f"Database not reachable: {e}")
+            raise
+        print(f"Database reachable ({latency:.1f} ms)")
+
+        errors = await DBManager.ensure_indexes()
+        for index_name, error in errors.items():
+            print(f"Could not create index {index_name}: {error}")
+
+        report = await DBManager.check_indexes(with_usage=False)
+        for collection_name, info in report.items():
+            if info['missing']:
+                print(f"Missing indexes in {collection_name}: {', '.join(info['missing'])}")
+
+        warmed = await DBManager.warm_active_tournaments()
+        print(f"Active tournaments cached: {warmed}")
+
         await load_extensions()
         await bot.start(BOT)
 
@@ -0,0 +1,48 @@
+import datetime
+import asyncio
+import uuid
+import sys
+import os
+
+# Las pruebas usan el backend en memoria: no hace falta MongoDB ni Discord
+os.environ["STORAGE_BACKEND"] = "memory"
+for name in ("ERROR_CHANNEL_ID", "LOG_CHANNEL_ID", "BUG_CHANNEL_ID", "SERVER_LOG_CHANNEL_ID", "OWNER_ID"):
+    os.environ.setdefault(name, "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from utils.db import DBManager
+
+@pytest.fixture(scope="session", autouse=True)
+def indexes():
+    asyncio.run(DBManager.ensure_indexes())
+
+@pytest.fixture
+def run():
+    """
+    Ejecuta una corrutina en un bucle de eventos nuevo
+    """
+    return asyncio.run
+
+@pytest.fixture
+def make_tournament(run):
+    """
+    Crea un torneo abierto con un id único y devuelve su id
+    """
+    def make(**fields):
+        tournament = {
+            "id": uuid.uuid4().hex[:8],
+            "name": "Torneo",
+            "guild_id": uuid.uuid4().int >> 80,
+            "status": "open",
+            "current_round": 0,
+            "matches": [],
+            "created_at": datetime.datetime.utcnow(),
+            "max_teams": 4,
+            "reserved_slots": 0,
+            "version": 0
+        }
+        tournament.update(fields)
+        run(DBManager.create_tournament(tournament))
+        return tournament['id']
+    return make
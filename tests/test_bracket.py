@@ -0,0 +1,22 @@
+from utils.db import encode_bracket, decode_bracket, BYE_SLOT
+
+def test_bracket_round_trip():
+    matches = [
+        [
+            {"team1_id": "a", "team2_id": "b", "winner_id": "b", "channel_id": 10},
+            {"team1_id": "c", "team2_id": BYE_SLOT, "winner_id": "c", "channel_id": None},
+            {"team1_id": "d", "team2_id": None, "winner_id": None, "channel_id": 12},
+            {"team1_id": None, "team2_id": None, "winner_id": None, "channel_id": None}
+        ],
+        [
+            {"team1_id": "b", "team2_id": "c", "winner_id": None, "channel_id": None},
+            {"team1_id": "d", "team2_id": None, "winner_id": None, "channel_id": None}
+        ]
+    ]
+    bracket = encode_bracket(matches)
+    assert bracket['teams'] == ["a", "b", "c", "d"]
+    assert decode_bracket(bracket) == matches
+
+def test_bracket_round_trip_empty_slot_winner():
+    matches = [[{"team1_id": None, "team2_id": "a", "winner_id": "a", "channel_id": None}]]
+    assert decode_bracket(encode_bracket(matches)) == matches
@@ -0,0 +1,156 @@
+import asyncio
+import pytest
+from utils.db import DBManager, DuplicateTeamError, tournaments_collection, teams_collection
+
+def start(run, tournament_id, names):
+    """
+    Registra los equipos y empieza el torneo con una primera ronda de partidos.
+    Devuelve los ids de los equipos
+    """
+    team_ids = [f"{tournament_id}-{name}" for name in names]
+    for member, team_id in enumerate(team_ids, 1):
+        run(DBManager.create_team({"id": team_id, "name": team_id, "members": [member], "leader_id": member, "tournament_id": tournament_id}))
+    round_matches = [
+        {"team1_id": team_ids[i], "team2_id": team_ids[i + 1], "winner_id": None, "channel_id": None}
+        for i in range(0, len(team_ids), 2)
+    ]
+    run(DBManager.update_tournament(tournament_id, {"status": "active", "current_round": 1, "matches": [round_matches]}))
+    return team_ids
+
+def reserve(run, tournament_id, pending_id):
+    """
+    Reserva una plaza para una inscripción pendiente ya guardada, como hace el comando register
+    """
+    run(DBManager.create_pending_registration({"id": pending_id, "tourney_id": tournament_id, "members": [1], "confirmed": [1]}))
+    return run(DBManager.reserve_team_slot(tournament_id, pending_id))
+
+def test_reserve_team_slot_respects_capacity(run, make_tournament):
+    tournament_id = make_tournament(max_teams=2)
+    assert reserve(run, tournament_id, tournament_id + "-p1")
+    assert reserve(run, tournament_id, tournament_id + "-p2")
+    assert not reserve(run, tournament_id, tournament_id + "-p3")
+    run(DBManager.delete_pending_registration(tournament_id + "-p3"))
+    assert run(DBManager.cancel_pending_registration(tournament_id + "-p1"))
+    assert reserve(run, tournament_id, tournament_id + "-p4")
+
+def test_reserve_team_slot_reconciles_unbacked_slots(run, make_tournament):
+    tournament_id = make_tournament(max_teams=2, reserved_slots=2)
+    assert reserve(run, tournament_id, tournament_id + "-p1")
+    tournament = run(DBManager.get_tournament(tournament_id))
+    assert tournament.reserved_slots == 1
+
+def test_reserve_team_slot_requires_open_tournament(run, make_tournament):
+    tournament_id = make_tournament(status="closed")
+    assert not run(DBManager.reserve_team_slot(tournament_id))
+
+def test_duplicate_team_name_is_case_insensitive(run, make_tournament):
+    tournament_id = make_tournament()
+    run(DBManager.create_team({"id": "a1", "name": "Los Tigres", "members": [1], "leader_id": 1, "tournament_id": tournament_id}))
+    with pytest.raises(DuplicateTeamError) as error:
+        run(DBManager.create_team({"id": "a2", "name": "los tigres", "members": [2], "leader_id": 2, "tournament_id": tournament_id}))
+    assert error.value.field == "name"
+
+def test_duplicate_team_member(run, make_tournament):
+    tournament_id = make_tournament()
+    run(DBManager.create_team({"id": "b1", "name": "Uno", "members": [1, 2], "leader_id": 1, "tournament_id": tournament_id}))
+    with pytest.raises(DuplicateTeamError) as error:
+        run(DBManager.create_team({"id": "b2", "name": "Dos", "members": [2, 3], "leader_id": 3, "tournament_id": tournament_id}))
+    assert error.value.field == "members"
+
+def test_set_match_winner_is_idempotent(run, make_tournament):
+    tournament_id = make_tournament()
+    w, x, y, z = start(run, tournament_id, ["w", "x", "y", "z"])
+    first = run(DBManager.set_match_winner(tournament_id, 0, 0, w))
+    assert first.matches[0][0].winner_id == w
+    assert run(DBManager.set_match_winner(tournament_id, 0, 0, x)) is None
+    assert run(DBManager.set_match_winner(tournament_id, 0, 0, w)) is None
+    tournament = run(DBManager.get_tournament(tournament_id))
+    assert tournament.matches[0][0].winner_id == w
+    assert tournament.version == first.version
+
+def test_modify_tournament_aborts_on_version_mismatch(run, make_tournament, monkeypatch):
+    tournament_id = make_tournament()
+    find_one = tournaments_collection.find_one
+
+    async def slow_find_one(*args, **kwargs):
+        # Cede el control tras leer, para que las dos modificaciones lean la misma versión
+        doc = await find_one(*args, **kwargs)
+        await asyncio.sleep(0)
+        return doc
+
+    monkeypatch.setattr(tournaments_collection, "find_one", slow_find_one)
+
+    async def both():
+        return await asyncio.gather(
+            DBManager.modify_tournament(tournament_id, lambda t: {"$set": {"status": "closed"}}, retries=1),
+            DBManager.modify_tournament(tournament_id, lambda t: {"$set": {"status": "active"}}, retries=1)
+        )
+
+    first, second = run(both())
+    assert first is not None and first.status == "closed"
+    assert second is None
+    monkeypatch.undo()
+    tournament = run(DBManager.get_tournament(tournament_id))
+    assert tournament.status == "closed"
+    assert tournament.version == 1
+
+def test_rollback_keeps_round_channels(run, make_tournament):
+    tournament_id = make_tournament()
+    w, x, y, z = start(run, tournament_id, ["w", "x", "y", "z"])
+    run(DBManager.update_match(tournament_id, 0, 0, {"channel_id": 111}))
+    run(DBManager.update_match(tournament_id, 0, 1, {"channel_id": 222}))
+    run(DBManager.set_match_winner(tournament_id, 0, 0, w))
+
+    async def events():
+        return [event async for event in DBManager.tournament_events_stream(tournament_id)]
+
+    seqs = {event['type']: event['seq'] for event in run(events())}
+    # Antes de asignar los canales y antes del ganador
+    for seq in (seqs['status_changed'], seqs['winner_set'] - 1):
+        tournament = run(DBManager.rollback_tournament(tournament_id, seq))
+        assert [m.channel_id for m in tournament.matches[0]] == [111, 222]
+        assert tournament.matches[0][0].winner_id is None
+
+def test_guild_config_miss_is_cached(run):
+    guild_id = 987654321
+    misses = DBManager.get_guild_config_cache_stats()['misses']
+    assert run(DBManager.get_guild_config(guild_id)) is None
+    assert run(DBManager.get_guild_config(guild_id)) is None
+    assert DBManager.get_guild_config_cache_stats()['misses'] == misses + 1
+    run(DBManager.update_guild_config_field(guild_id, "prefix", "!"))
+    assert run(DBManager.get_guild_config(guild_id)).prefix == "!"
+
+def test_fresh_tournament_reads_see_writes_from_another_process(run, make_tournament):
+    tournament_id = make_tournament()
+    guild_id = run(DBManager.get_tournament(tournament_id)).guild_id
+    w, x, y, z = start(run, tournament_id, ["w", "x", "y", "z"])
+    # Escrituras de otro proceso: no pasan por las cachés de este
+    run(tournaments_collection.update_one({"id": tournament_id}, {"$set": {"bracket.rounds.0.channels.0": 5}, "$inc": {"version": 1}}))
+    assert run(DBManager.get_active_tournament(guild_id)).matches[0][0].channel_id is None
+    assert run(DBManager.get_active_tournament(guild_id, fresh=True)).matches[0][0].channel_id == 5
+    assert run(DBManager.get_tournament(tournament_id)).matches[0][0].channel_id == 5
+
+def test_fresh_team_reads_see_writes_from_another_process(run, make_tournament):
+    tournament_id = make_tournament()
+    w, x = start(run, tournament_id, ["w", "x"])
+    run(DBManager.get_teams(tournament_id))
+    run(teams_collection.update_one({"id": w}, {"$push": {"members": 99}}))
+    assert 99 not in run(DBManager.get_team(w)).members
+    assert 99 in run(DBManager.get_team(w, fresh=True)).members
+    # La lectura fresca ha invalidado el roster desactualizado
+    assert run(DBManager.get_team_by_member(99, tournament_id)).id == w
+
+def test_event_seq_comes_from_the_tournament_counter(run, make_tournament):
+    tournament_id = make_tournament()
+    start(run, tournament_id, ["w", "x"])
+    # Torneo anterior al contador: sin 'event_seq' aunque ya tiene eventos
+    run(tournaments_collection.update_one({"id": tournament_id}, {"$unset": {"event_seq": ""}}))
+    run(DBManager.update_tournament(tournament_id, {"status": "closed"}))
+    run(DBManager.update_tournament(tournament_id, {"status": "active"}))
+
+    async def events():
+        return [event async for event in DBManager.tournament_events_stream(tournament_id)]
+
+    seqs = [event['seq'] for event in run(events())]
+    assert seqs == list(range(1, len(seqs) + 1))
+    assert run(tournaments_collection.find_one({"id": tournament_id}))['event_seq'] == seqs[-1]
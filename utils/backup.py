@@ -0,0 +1,87 @@
+from bson import json_util
+from config import BACKUP_BATCH_SIZE
+from utils.db import DBManager
+import itertools
+import argparse
+import asyncio
+import gzip
+
+# Formato: JSONL comprimido con gzip, una línea por documento: {"collection": nombre, "doc": documento}.
+# Se usa el JSON extendido de MongoDB (modo relajado) para conservar fechas y otros tipos BSON.
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+async def export_guild(guild_id: int, path: str, batch_size: int = BACKUP_BATCH_SIZE):
+    """
+    Exporta los torneos, equipos y configuración de un servidor a un fichero .jsonl.gz.
+    Escribe por lotes, así que la memoria usada no depende del tamaño del servidor.
+    Devuelve el número de documentos exportados por colección
+    """
+    counts = {}
+    lines = []
+    with gzip.open(path, "wt", encoding="utf-8") as fp:
+        async for collection_name, doc in DBManager.export_guild_documents(guild_id, batch_size):
+            lines.append(json_util.dumps({"collection": collection_name, "doc": doc}, json_options=JSON_OPTIONS))
+            counts[collection_name] = counts.get(collection_name, 0) + 1
+            if len(lines) >= batch_size:
+                await asyncio.to_thread(fp.write, "\n".join(lines) + "\n")
+                lines = []
+        if lines:
+            await asyncio.to_thread(fp.write, "\n".join(lines) + "\n")
+    return counts
+
+async def import_guild(path: str, batch_size: int = BACKUP_BATCH_SIZE):
+    """
+    Importa un fichero generado por export_guild insertando los documentos por lotes con insert_many.
+    Los documentos que ya existen (misma clave única) se omiten.
+    Devuelve {colección: (insertados, omitidos)}
+    """
+    counts = {}
+    pending = {}
+
+    async def flush(collection_name: str):
+        inserted, skipped = await DBManager.import_documents(collection_name, pending.pop(collection_name, []))
+        total_inserted, total_skipped = counts.get(collection_name, (0, 0))
+        counts[collection_name] = (total_inserted + inserted, total_skipped + skipped)
+
+    with gzip.open(path, "rt", encoding="utf-8") as fp:
+        while True:
+            lines = await asyncio.to_thread(lambda: list(itertools.islice(fp, batch_size)))
+            if not lines:
+                break
+            for line in lines:
+                if not line.strip():
+                    continue
+                entry = json_util.loads(line)
+                batch = pending.setdefault(entry['collection'], [])
+                batch.append(entry['doc'])
+                if len(batch) >= batch_size:
+                    await flush(entry['collection'])
+    for collection_name in list(pending):
+        await flush(collection_name)
+    return counts
+
+async def main():
+    parser = argparse.ArgumentParser(description="Copias de seguridad de los torneos de un servidor")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Exporta un servidor a un fichero .jsonl.gz")
+    export_parser.add_argument("guild_id", type=int)
+    export_parser.add_argument("path")
+
+    import_parser = subparsers.add_parser("import", help="Importa un fichero .jsonl.gz")
+    import_parser.add_argument("path")
+
+    parser.add_argument("--batch-size", type=int, default=BACKUP_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        counts = await export_guild(args.guild_id, args.path, args.batch_size)
+        for collection_name, count in counts.items():
+            print(f"{collection_name}: {count}")
+    else:
+        counts = await import_guild(args.path, args.batch_size)
+        for collection_name, (inserted, skipped) in counts.items():
+            print(f"{collection_name}: {inserted} insertados, {skipped} omitidos")
+
+if __name__ == "__main__":
+    asyncio.run(main())
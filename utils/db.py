@@ -1,65 +1,596 @@
-import motor.motor_asyncio
-from config import URL_BASE_1
-from dataclasses import dataclass, asdict
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from config import (
+    URL_BASE_1, STORAGE_BACKEND, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_READ_PREFERENCE, MONGO_COMPRESSORS,
+    GUILD_CONFIG_CACHE_TTL, GUILD_CONFIG_CACHE_SIZE,
+    ACTIVE_TOURNAMENT_CACHE_TTL, ACTIVE_TOURNAMENT_CACHE_SIZE,
+    ROSTER_CACHE_TTL, ROSTER_CACHE_SIZE, PENDING_REGISTRATION_TTL, PENDING_REGISTRATION_TTL_MARGIN, TOURNAMENT_CAS_RETRIES,
+    TOURNAMENT_SNAPSHOT_INTERVAL, ARCHIVE_BATCH_SIZE, BACKUP_BATCH_SIZE
+)
+from dataclasses import dataclass, field, fields
 from typing import List, Optional, Dict
+from collections import OrderedDict
 import datetime
+import asyncio
+import copy
+import time
 
-# Conexión a MongoDB
-client = motor.motor_asyncio.AsyncIOMotorClient(URL_BASE_1)
-db = client['tourney_bot']
+from utils.storage import create_backend, apply_update
+
+# Backend de almacenamiento (MongoDB o en memoria según STORAGE_BACKEND).
+# El cliente de MongoDB se crea en el primer uso
+db = create_backend(
+    STORAGE_BACKEND, URL_BASE_1, 'tourney_bot',
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    readPreference=MONGO_READ_PREFERENCE,
+    compressors=MONGO_COMPRESSORS
+)
 tournaments_collection = db['tournaments']
 teams_collection = db['teams']
 guilds_config_collection = db['guild_config']
+pending_registrations_collection = db['pending_registrations']
+tournament_events_collection = db['tournament_events']
+tournament_snapshots_collection = db['tournament_snapshots']
+tournaments_archive_collection = db['tournaments_archive']
+
+# Colecciones incluidas en las copias de seguridad de un servidor
+BACKUP_COLLECTIONS = {
+    "guild_config": guilds_config_collection,
+    "tournaments": tournaments_collection,
+    "tournaments_archive": tournaments_archive_collection,
+    "teams": teams_collection,
+    "tournament_events": tournament_events_collection,
+    "tournament_snapshots": tournament_snapshots_collection,
+}
+
+# Estados en los que un torneo se considera activo
+ACTIVE_STATUSES = ["open", "active", "pending"]
+
+# Estados en los que un torneo se considera finalizado
+FINISHED_STATUSES = ["finished", "Terminado"]
+
+# Campos de estado del torneo: cambiarlos incrementa 'version' (control de concurrencia optimista)
+VERSIONED_FIELDS = ("status", "current_round", "matches", "bracket", "winner_id")
+
+# Collation para comparar nombres de equipo sin distinguir mayúsculas
+NAME_COLLATION = {"locale": "en", "strength": 2}
+
+# Índices necesarios por colección: (nombre, claves, opciones)
+INDEXES = {
+    "tournaments": [
+        ("id_unique", [("id", 1)], {"unique": True}),
+        ("guild_status", [("guild_id", 1), ("status", 1)], {}),
+        ("guild_created_at_id", [("guild_id", 1), ("created_at", -1), ("id", -1)], {}),
+        # Torneos finalizados pendientes de archivar (archive_finished_tournaments)
+        ("status_finished_at", [("status", 1), ("finished_at", 1)], {}),
+    ],
+    "teams": [
+        ("id_unique", [("id", 1)], {"unique": True}),
+        ("tournament_members_unique", [("tournament_id", 1), ("members", 1)], {"unique": True}),
+        ("tournament_name_unique", [("tournament_id", 1), ("name", 1)], {"unique": True, "collation": NAME_COLLATION}),
+        ("members_tournament", [("members", 1), ("tournament_id", 1)], {}),
+    ],
+    "guild_config": [
+        ("guild_id_unique", [("guild_id", 1)], {"unique": True}),
+    ],
+    "pending_registrations": [
+        ("id_unique", [("id", 1)], {"unique": True}),
+        # Respaldo: las inscripciones caducadas las libera y borra release_expired_registrations
+        ("expires_at_ttl_backstop", [("expires_at", 1)], {"expireAfterSeconds": PENDING_REGISTRATION_TTL_MARGIN}),
+    ],
+    "tournament_events": [
+        ("tournament_seq_unique", [("tournament_id", 1), ("seq", 1)], {"unique": True}),
+    ],
+    "tournament_snapshots": [
+        ("tournament_seq_unique", [("tournament_id", 1), ("seq", 1)], {"unique": True}),
+    ],
+    "tournaments_archive": [
+        ("id_unique", [("id", 1)], {"unique": True}),
+        ("guild_created_at_id", [("guild_id", 1), ("created_at", -1), ("id", -1)], {}),
+    ],
+}
+
+# Índices sustituidos por otros: ensure_indexes los elimina si existen
+OBSOLETE_INDEXES = {
+    # El TTL sin margen borraba la inscripción antes de que se liberase su plaza
+    "pending_registrations": ["expires_at_ttl"],
+}
+
+class DuplicateTeamError(Exception):
+    """
+    Se lanza cuando un equipo o miembro viola un índice único.
+    'field' es "name" si el nombre ya existe en el torneo o "members" si un miembro ya tiene equipo
+    """
+    def __init__(self, field: str):
+        super().__init__(f"Duplicate team {field}")
+        self.field = field
+
+    @classmethod
+    def from_error(cls, error: DuplicateKeyError):
+        key_pattern = (error.details or {}).get('keyPattern', {})
+        if 'name' in key_pattern or "tournament_name_unique" in str(error):
+            return cls("name")
+        return cls("members")
+
+def event_changes(update: dict):
+    """
+    Convierte un update de MongoDB en la lista de cambios que se guarda en un evento
+    (sin los incrementos de 'version', que se guarda aparte, y 'event_seq')
+    """
+    return [
+        {"op": op, "path": path, "value": value}
+        for op, fields in update.items()
+        for path, value in fields.items()
+        if not (op == "$inc" and path in ("version", "event_seq"))
+    ]
+
+def with_event_seq(update: dict):
+    """
+    Añade al update el incremento de 'event_seq', el contador de eventos del torneo:
+    el número del evento que registra el update se obtiene en la misma operación
+    """
+    update = dict(update)
+    update["$inc"] = dict(update.get("$inc", {}), event_seq=1)
+    return update
+
+def apply_event(state: Optional[dict], event: dict):
+    """
+    Aplica un evento al estado de un torneo y devuelve el nuevo estado
+    """
+    if event['type'] == "created":
+        state = copy.deepcopy(event['data']['tournament'])
+    elif state is None:
+        return None
+    for change in event.get('changes', []):
+        apply_update(state, {change['op']: {change['path']: change['value']}})
+    if event.get('version') is not None:
+        state['version'] = event['version']
+    return state
+
+# --- Codificación compacta del bracket ---
+#
+# En lugar de guardar cada partido como {"team1_id", "team2_id", "winner_id", "channel_id"}
+# el torneo guarda 'bracket':
+#   {"teams": [id, ...],
+#    "rounds": [{"slots": [eq1, eq2, eq1, eq2, ...], "decided": bits, "team2_won": bits, "channels": [...]}]}
+# 'slots' son índices en 'teams' (-1 hueco vacío, -2 BYE). El bit i de 'decided' indica que el partido i
+# tiene ganador y el de 'team2_won' que ganó el segundo equipo. max_teams <= 64, así que caben en un int64.
+# Los torneos antiguos con 'matches' se siguen leyendo tal cual.
+
+BYE_SLOT = "BYE_SLOT"
+EMPTY_SLOT_INDEX = -1
+BYE_SLOT_INDEX = -2
+
+def _slot_index(team_id: Optional[str], team_index: Dict[str, int]):
+    if team_id is None:
+        return EMPTY_SLOT_INDEX
+    if team_id == BYE_SLOT:
+        return BYE_SLOT_INDEX
+    return team_index[team_id]
+
+def _slot_team(index: int, teams: List[str]):
+    if index == EMPTY_SLOT_INDEX:
+        return None
+    if index == BYE_SLOT_INDEX:
+        return BYE_SLOT
+    return teams[index]
+
+def winner_slot(match: dict, winner_id: str):
+    """
+    Devuelve 1 o 2 según qué hueco del partido gana (un hueco vacío gana como BYE).
+    Lanza ValueError si 'winner_id' no juega ese partido
+    """
+    team1_id, team2_id = match.get('team1_id'), match.get('team2_id')
+    if team1_id is not None and winner_id == team1_id:
+        return 1
+    if team2_id is not None and winner_id == team2_id:
+        return 2
+    if winner_id == BYE_SLOT and team1_id is None:
+        return 1
+    if winner_id == BYE_SLOT and team2_id is None:
+        return 2
+    raise ValueError(f"{winner_id} no juega este partido")
+
+def encode_round(round_matches: List[dict], team_index: Dict[str, int]):
+    """
+    Codifica una ronda de partidos con los índices de 'team_index'
+    """
+    slots, channels = [], []
+    decided = team2_won = 0
+    for i, match in enumerate(round_matches):
+        slots.append(_slot_index(match.get('team1_id'), team_index))
+        slots.append(_slot_index(match.get('team2_id'), team_index))
+        channels.append(match.get('channel_id'))
+        if match.get('winner_id') is not None:
+            decided |= 1 << i
+            if winner_slot(match, match['winner_id']) == 2:
+                team2_won |= 1 << i
+    return {"slots": slots, "decided": decided, "team2_won": team2_won, "channels": channels}
+
+def encode_bracket(matches: List[List[dict]]):
+    """
+    Codifica todas las rondas de 'matches' en el formato compacto
+    """
+    teams, team_index = [], {}
+    for round_matches in matches:
+        for match in round_matches:
+            for team_id in (match.get('team1_id'), match.get('team2_id')):
+                if team_id is not None and team_id != BYE_SLOT and team_id not in team_index:
+                    team_index[team_id] = len(teams)
+                    teams.append(team_id)
+    return {"teams": teams, "rounds": [encode_round(r, team_index) for r in matches]}
+
+def decode_bracket(bracket: dict):
+    """
+    Expande el formato compacto a la lista de rondas de partidos que usan el cog y generate_bracket_image
+    """
+    teams = bracket.get('teams', [])
+    matches = []
+    for encoded in bracket.get('rounds', []):
+        slots = encoded['slots']
+        channels = encoded.get('channels') or []
+        round_matches = []
+        for i in range(len(slots) // 2):
+            team1_id = _slot_team(slots[2 * i], teams)
+            team2_id = _slot_team(slots[2 * i + 1], teams)
+            winner_id = None
+            if encoded['decided'] >> i & 1:
+                winner_id = team2_id if encoded['team2_won'] >> i & 1 else team1_id
+                if winner_id is None:
+                    winner_id = BYE_SLOT
+            round_matches.append({
+                "team1_id": team1_id,
+                "team2_id": team2_id,
+                "winner_id": winner_id,
+                "channel_id": channels[i] if i < len(channels) else None
+            })
+        matches.append(round_matches)
+    return matches
+
+def expand_tournament(tournament: Optional[dict]):
+    """
+    Añade 'matches' expandido a un torneo guardado en formato compacto (los antiguos no cambian)
+    """
+    if tournament and tournament.get('bracket') is not None:
+        tournament['matches'] = decode_bracket(tournament['bracket'])
+    return tournament
+
+def storage_state(tournament: dict):
+    """
+    Copia del torneo tal como se guarda (sin '_id' ni el 'matches' derivado del bracket compacto)
+    """
+    skip = ('_id', 'matches') if tournament.get('bracket') is not None else ('_id',)
+    return {k: v for k, v in tournament.items() if k not in skip}
+
+def keep_live_channels(stored: dict, current: dict):
+    """
+    Copia en un estado reconstruido los canales de partido del torneo actual.
+    Los canales existen en Discord aunque se deshaga el evento en que se asignaron,
+    así que un rollback no debe perder sus ids
+    """
+    if stored.get('bracket') is not None and current.get('bracket') is not None:
+        for stored_round, current_round in zip(stored['bracket'].get('rounds', []), current['bracket'].get('rounds', [])):
+            live = current_round.get('channels') or []
+            channels = list(stored_round.get('channels') or [None] * len(live))
+            for i, channel_id in enumerate(live[:len(channels)]):
+                if channel_id is not None:
+                    channels[i] = channel_id
+            stored_round['channels'] = channels
+    elif stored.get('matches') is not None and current.get('matches') is not None:
+        for stored_round, current_round in zip(stored['matches'], current['matches']):
+            for stored_match, current_match in zip(stored_round, current_round):
+                if current_match.get('channel_id') is not None:
+                    stored_match['channel_id'] = current_match['channel_id']
+    return stored
+
+def storage_update(update: dict, bracket: Optional[dict]):
+    """
+    Traduce un update expresado sobre 'matches' al formato compacto:
+    {"$set": {"matches": ...}} guarda el bracket compacto y {"$push": {"matches": ronda}} añade una ronda
+    codificada si el torneo ya lo usa ('bracket' es el bracket guardado o None)
+    """
+    update = {op: dict(fields) for op, fields in update.items()}
+    if "matches" in update.get("$set", {}):
+        update["$set"]["bracket"] = encode_bracket(update["$set"].pop("matches"))
+        update.setdefault("$unset", {})["matches"] = ""
+    if bracket is not None and "matches" in update.get("$push", {}):
+        team_index = {team_id: i for i, team_id in enumerate(bracket.get('teams', []))}
+        update["$push"]["bracket.rounds"] = encode_round(update["$push"].pop("matches"), team_index)
+    return {op: fields for op, fields in update.items() if fields}
+
+class TTLCache:
+    """
+    Caché en memoria con tiempo de expiración y tamaño máximo (LRU)
+    """
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Obtiene un valor de la caché o 'default' si no existe o ha expirado
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Guarda un valor en la caché, expulsando el más antiguo si está llena
+        """
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def peek(self, key, default=None):
+        """
+        Obtiene un valor de la caché sin contar acierto/fallo ni renovar su posición
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return default
+        return entry[1]
+
+    def invalidate(self, key):
+        """
+        Elimina un valor de la caché
+        """
+        self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Vacía la caché
+        """
+        self._data.clear()
+
+    def stats(self):
+        """
+        Obtiene las estadísticas de uso de la caché
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl}
+
+class TeamRoster:
+    """
+    Equipos (Team) de un torneo indexados por ID, por miembro y por nombre
+    """
+    def __init__(self, teams: List["Team"]):
+        self.teams = {}
+        self.members = {}
+        self.names = {}
+        for team in teams:
+            self.add(team)
+
+    def add(self, team: "Team"):
+        """
+        Añade un equipo al roster
+        """
+        self.teams[team.id] = team
+        self.names[team.name.casefold()] = team.id
+        for uid in team.members:
+            self.members[uid] = team.id
+
+    def remove(self, team_id: str):
+        """
+        Elimina un equipo del roster y devuelve el equipo eliminado
+        """
+        team = self.teams.pop(team_id, None)
+        if not team:
+            return None
+        if self.names.get(team.name.casefold()) == team_id:
+            del self.names[team.name.casefold()]
+        for uid in team.members:
+            if self.members.get(uid) == team_id:
+                del self.members[uid]
+        return team
+
+    def update(self, team_id: str, data: dict):
+        """
+        Aplica cambios a un equipo del roster, reindexando miembros y nombre
+        """
+        team = self.remove(team_id)
+        if team:
+            team.update(data)
+            self.add(team)
+
+    def by_member(self, user_id: int):
+        """
+        Obtiene el equipo de un miembro
+        """
+        team_id = self.members.get(user_id)
+        return self.teams.get(team_id) if team_id else None
+
+    def by_name(self, name: str):
+        """
+        Obtiene un equipo por su nombre
+        """
+        team_id = self.names.get(name.casefold())
+        return self.teams.get(team_id) if team_id else None
+
+# --- Cachés ---
+#
+# Las cachés son de cada proceso y solo las invalidan las escrituras del propio proceso. Con varios procesos
+# (p. ej. varios shards contra la misma base de datos) una lectura cacheada puede ir hasta su TTL por detrás
+# de lo que ha escrito otro proceso. Para mostrar información se acepta; las rutas que modifican datos leen
+# con fresh=True: get_tournament / get_active_tournament comprueban el 'version' guardado (toda escritura
+# del estado del torneo, incluidos los canales de los partidos, lo incrementa) y get_team / get_team_by_member
+# leen el equipo de la base de datos e invalidan el roster si no coincide.
+
+# Configuración por servidor (None si el servidor no tiene configuración guardada)
+guild_config_cache = TTLCache(GUILD_CONFIG_CACHE_TTL, GUILD_CONFIG_CACHE_SIZE)
+
+# Roster de equipos por torneo
+roster_cache = TTLCache(ROSTER_CACHE_TTL, ROSTER_CACHE_SIZE)
+# Torneo al que pertenece cada equipo guardado en roster_cache
+roster_team_tournaments = {}
+
+# Torneo activo por servidor (None si el servidor no tiene torneo activo)
+active_tournament_cache = TTLCache(ACTIVE_TOURNAMENT_CACHE_TTL, ACTIVE_TOURNAMENT_CACHE_SIZE)
+# Servidor al que pertenece cada torneo guardado en active_tournament_cache
+active_tournament_guilds = {}
+_MISSING = object()
+
+# --- Modelos ---
+#
+# Los documentos se cargan en dataclasses con __slots__ (menos memoria por torneo/equipo cacheado y
+# acceso por atributo). from_doc acepta documentos parciales (con proyección): solo los campos presentes
+# se marcan como cargados y to_doc devuelve únicamente esos. Los campos desconocidos se guardan en 'extra'
+# (None si no hay ninguno).
+# Los comandos frecuentes del cog (registro, invitaciones, equipos, info y rondas) usan atributos; el acceso tipo
+# diccionario se mantiene para los comandos de configuración y administración y para los campos de 'extra'.
+
+_MODEL_FIELDS = {}
+
+@dataclass(slots=True, kw_only=True)
+class Model:
+    extra: Optional[Dict] = field(default=None, repr=False, compare=False)
+    loaded: Optional[frozenset] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def field_names(cls):
+        """
+        Campos del documento que representa el modelo
+        """
+        names = _MODEL_FIELDS.get(cls)
+        if names is None:
+            names = _MODEL_FIELDS[cls] = tuple(f.name for f in fields(cls) if f.name not in ('extra', 'loaded'))
+        return names
+
+    @classmethod
+    def from_doc(cls, doc: Optional[dict]):
+        """
+        Crea el modelo a partir de un documento de MongoDB (None si el documento es None)
+        """
+        if doc is None or isinstance(doc, cls):
+            return doc
+        names = cls.field_names()
+        values = {name: doc[name] for name in names if name in doc}
+        model = cls(**cls._load(values))
+        model.extra = {k: v for k, v in doc.items() if k not in values and k != '_id'} or None
+        model.loaded = frozenset(values)
+        return model
+
+    @classmethod
+    def _load(cls, values: dict):
+        return values
+
+    def _dump(self, doc: dict):
+        return doc
 
-@dataclass
-class GuildConfig:
-    guild_id: int
+    def to_doc(self):
+        """
+        Convierte el modelo en documento (solo con los campos cargados si vino de una proyección)
+        """
+        names = self.field_names() if self.loaded is None else [n for n in self.field_names() if n in self.loaded]
+        doc = self._dump({name: getattr(self, name) for name in names})
+        if self.extra:
+            doc.update(self.extra)
+        return doc
+
+    def _has(self, key: str):
+        return key in self.field_names() and (self.loaded is None or key in self.loaded)
+
+    # Acceso tipo diccionario (compatibilidad)
+
+    def __getitem__(self, key: str):
+        if self._has(key):
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key in self.field_names():
+            setattr(self, key, self._load({key: value})[key])
+            if self.loaded is not None:
+                self.loaded = self.loaded | {key}
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str):
+        return self._has(key) or bool(self.extra and key in self.extra)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, other):
+        """
+        Copia los campos de otro modelo o documento
+        """
+        if isinstance(other, type(self)):
+            names = other.field_names() if other.loaded is None else other.loaded
+            for name in names:
+                setattr(self, name, getattr(other, name))
+            if self.loaded is not None:
+                self.loaded = self.loaded | set(names)
+            if other.extra:
+                self.extra = {**(self.extra or {}), **other.extra}
+            return
+        for key, value in other.items():
+            if key != '_id':
+                self[key] = value
+
+@dataclass(slots=True, kw_only=True)
+class GuildConfig(Model):
+    guild_id: int = 0
     category_id: Optional[int] = None
     bracket_channel_id: Optional[int] = None
     lobby_channel_id: Optional[int] = None
     bot_admin_channel_id: Optional[int] = None
     tourney_log_channel_id: Optional[int] = None
-    tourney_logs: Optional[bool] = None
+    tourney_logs_enabled: Optional[bool] = None
     prefix: Optional[str] = None
-    admin_roles: List[str] = None
+    admin_roles: List[str] = field(default_factory=list)
     invite_url: Optional[str] = None
-    
-    def to_dict(self):
-        return asdict(self)
-
-@dataclass
-class Team:
-    id: str
-    name: str
-    members: List[int]
-    leader_id: int
-    tournament_id: str
-    
-    def to_dict(self):
-        return asdict(self)
 
-@dataclass
-class Match:
-    team1_id: Optional[str]
-    team2_id: Optional[str]
+@dataclass(slots=True, kw_only=True)
+class Team(Model):
+    id: str = ""
+    name: str = ""
+    members: List[int] = field(default_factory=list)
+    leader_id: Optional[int] = None
+    tournament_id: str = ""
+
+@dataclass(slots=True, kw_only=True)
+class Match(Model):
+    team1_id: Optional[str] = None
+    team2_id: Optional[str] = None
     winner_id: Optional[str] = None
     channel_id: Optional[int] = None
-    
-    def to_dict(self):
-        return asdict(self)
-
-@dataclass
-class Tournament:
-    id: str
-    name: str
-    guild_id: int
-    settings: Dict
-    status: str
-    current_round: int
-    matches: List[List[Dict]]
-    created_at: datetime.datetime
+
+@dataclass(slots=True, kw_only=True)
+class Tournament(Model):
+    id: str = ""
+    name: str = ""
+    guild_id: int = 0
+    settings: Optional[Dict] = None
+    status: str = ""
+    current_round: int = 0
+    matches: List[List[Match]] = field(default_factory=list)
+    created_at: Optional[datetime.datetime] = None
     description: str = ""
     date: str = ""
+    registration_start_time: str = ""
     registration_end_time: str = ""
     start_time: str = ""
     max_teams: int = 16
@@ -68,79 +599,735 @@ class Tournament:
     image_url: Optional[str] = None
     winner_id: Optional[str] = None
     last_bracket_url: Optional[str] = None
+    finished_at: Optional[datetime.datetime] = None
+    reserved_slots: int = 0
+    version: int = 0
+    event_seq: int = 0
+    bracket: Optional[Dict] = None
 
-    def to_dict(self):
-        return asdict(self)
+    @classmethod
+    def _load(cls, values: dict):
+        if 'matches' in values:
+            values['matches'] = [[Match.from_doc(m) for m in round_matches] for round_matches in values['matches'] or []]
+        return values
+
+    def _dump(self, doc: dict):
+        if 'matches' in doc:
+            doc['matches'] = [[m.to_doc() for m in round_matches] for round_matches in doc['matches']]
+        return doc
 
 class DBManager:
+    @staticmethod
+    async def ping():
+        """
+        Comprueba la conexión con la base de datos y devuelve el tiempo de respuesta en milisegundos
+        """
+        start = time.perf_counter()
+        await db.ping()
+        return (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    async def ensure_indexes():
+        """
+        Crea los índices necesarios para las consultas del bot y devuelve los que no se pudieron crear
+        """
+        errors = {}
+        for collection_name, names in OBSOLETE_INDEXES.items():
+            collection = db[collection_name]
+            existing = await collection.index_information()
+            for name in names:
+                if name in existing:
+                    try:
+                        await collection.drop_index(name)
+                    except Exception as e:
+                        errors[f"{collection_name}.{name}"] = str(e)
+        for collection_name, indexes in INDEXES.items():
+            collection = db[collection_name]
+            for name, keys, options in indexes:
+                try:
+                    await collection.create_index(keys, name=name, **options)
+                except Exception as e:
+                    errors[f"{collection_name}.{name}"] = str(e)
+        return errors
+
+    @staticmethod
+    async def check_indexes(with_usage: bool = True):
+        """
+        Comprueba los índices de cada colección.
+        Devuelve, por colección, los índices declarados que faltan, los existentes sin uso y los no declarados.
+        El uso sale de $indexStats, que requiere el privilegio indexStats: si no se pide o no está permitido, 'unused' es None
+        """
+        report = {}
+        for collection_name, indexes in INDEXES.items():
+            collection = db[collection_name]
+            existing = await collection.index_information()
+            declared = [name for name, _, _ in indexes]
+            missing = [name for name in declared if name not in existing]
+            undeclared = [name for name in existing if name != "_id_" and name not in declared]
+
+            unused = None
+            if with_usage:
+                try:
+                    unused = []
+                    async for stat in collection.aggregate([{"$indexStats": {}}]):
+                        if stat['name'] == "_id_":
+                            continue
+                        if stat.get('accesses', {}).get('ops', 0) == 0:
+                            unused.append(stat['name'])
+                except OperationFailure as e:
+                    print(f"Could not read index usage for {collection_name}: {e}")
+                    unused = None
+
+            report[collection_name] = {"missing": missing, "unused": unused, "undeclared": undeclared}
+        return report
+
+    @staticmethod
+    def _cache_active_tournament(guild_id: int, tournament):
+        """
+        Guarda el torneo activo de un servidor en la caché como Tournament (None si no tiene)
+        """
+        previous = active_tournament_cache.peek(guild_id)
+        if previous:
+            active_tournament_guilds.pop(previous.id, None)
+        tournament = Tournament.from_doc(tournament)
+        if tournament and tournament.status in ACTIVE_STATUSES:
+            active_tournament_cache.set(guild_id, tournament)
+            active_tournament_guilds[tournament.id] = guild_id
+        else:
+            active_tournament_cache.set(guild_id, None)
+
+    @staticmethod
+    def _cached_tournament(tournament_id: str):
+        """
+        Obtiene el documento cacheado de un torneo activo, o None si no está en caché
+        """
+        guild_id = active_tournament_guilds.get(tournament_id)
+        if guild_id is None:
+            return None
+        cached = active_tournament_cache.peek(guild_id)
+        if not cached or cached.id != tournament_id:
+            active_tournament_guilds.pop(tournament_id, None)
+            return None
+        return cached
+
+    @staticmethod
+    def _invalidate_tournament(tournament_id: str):
+        """
+        Elimina de la caché el torneo indicado
+        """
+        guild_id = active_tournament_guilds.pop(tournament_id, None)
+        if guild_id is not None:
+            active_tournament_cache.invalidate(guild_id)
+
+    @staticmethod
+    async def warm_active_tournaments():
+        """
+        Carga en la caché los torneos abiertos, activos o pendientes de todos los servidores
+        """
+        count = 0
+        async for tournament in tournaments_collection.find({"status": {"$in": ACTIVE_STATUSES}}):
+            DBManager._cache_active_tournament(tournament['guild_id'], expand_tournament(tournament))
+            count += 1
+        return count
+
+    @staticmethod
+    def get_active_tournament_cache_stats():
+        """
+        Obtiene las estadísticas (aciertos/fallos) de la caché de torneos activos
+        """
+        return active_tournament_cache.stats()
+
     @staticmethod
     async def create_tournament(data: dict):
         """
         Crea un nuevo torneo
         """
+        data['event_seq'] = 1
         result = await tournaments_collection.insert_one(data)
+        DBManager._cache_active_tournament(data['guild_id'], expand_tournament(copy.deepcopy(data)))
+        tournament = storage_state(data)
+        await DBManager._record_event(data['id'], "created", data={"tournament": tournament}, state=tournament, seq=1)
         return result.inserted_id
 
     @staticmethod
-    async def get_tournament(tournament_id: str):
+    async def get_tournament(tournament_id: str, fresh: bool = False):
         """
-        Obtiene un torneo por su ID
+        Obtiene un torneo por su ID.
+        Con fresh=True la copia cacheada solo se usa si su versión coincide con la guardada (ver Cachés)
         """
-        return await tournaments_collection.find_one({"id": tournament_id})
+        cached = DBManager._cached_tournament(tournament_id)
+        if cached and fresh:
+            current = await tournaments_collection.find_one({"id": tournament_id}, {"version": 1})
+            if not current or current.get('version') != cached.version:
+                DBManager._invalidate_tournament(tournament_id)
+                cached = None
+        if cached:
+            return copy.deepcopy(cached)
+        tournament = await tournaments_collection.find_one({"id": tournament_id})
+        if not tournament:
+            tournament = await tournaments_archive_collection.find_one({"id": tournament_id}, {"teams": 0})
+        return Tournament.from_doc(expand_tournament(tournament))
 
     @staticmethod
-    async def get_active_tournament(guild_id: int):
+    async def get_tournament_fields(tournament_id: str, *names: str):
         """
-        Obtiene el torneo activo de un servidor
+        Obtiene solo algunos campos de un torneo (proyección); el resto del Tournament no se marca como cargado
         """
-        return await tournaments_collection.find_one({"guild_id": guild_id, "status": {"$in": ["open", "active", "pending"]}})
+        cached = DBManager._cached_tournament(tournament_id)
+        if cached:
+            return Tournament.from_doc({name: copy.deepcopy(cached[name]) for name in names if name in cached})
+        projection = {name: 1 for name in names}
+        if 'matches' in projection:
+            projection['bracket'] = 1
+        return Tournament.from_doc(expand_tournament(await tournaments_collection.find_one({"id": tournament_id}, projection)))
 
     @staticmethod
-    async def update_tournament(tournament_id: str, update_data: dict):
+    async def get_active_tournament(guild_id: int, fresh: bool = False):
         """
-        Actualiza un torneo
+        Obtiene el torneo activo de un servidor (usa la caché si está disponible).
+        Con fresh=True comprueba antes qué torneo está activo y con qué versión, y solo usa la caché si coinciden (ver Cachés)
         """
+        cached = active_tournament_cache.get(guild_id, _MISSING)
+        if cached is not _MISSING and fresh:
+            current = await tournaments_collection.find_one(
+                {"guild_id": guild_id, "status": {"$in": ACTIVE_STATUSES}}, {"id": 1, "version": 1}
+            )
+            current_key = (current['id'], current.get('version')) if current else None
+            cached_key = (cached.id, cached.version) if cached else None
+            if current_key != cached_key:
+                cached = _MISSING
+        if cached is _MISSING:
+            cached = Tournament.from_doc(expand_tournament(
+                await tournaments_collection.find_one({"guild_id": guild_id, "status": {"$in": ACTIVE_STATUSES}})
+            ))
+            DBManager._cache_active_tournament(guild_id, cached)
+        return copy.deepcopy(cached)
+
+    @staticmethod
+    async def update_tournament(tournament_id: str, update_data: dict, event: str = None):
+        """
+        Actualiza un torneo (si cambia algún campo de estado incrementa su versión y registra el evento)
+        """
+        if any(field in update_data for field in VERSIONED_FIELDS):
+            update = with_event_seq(storage_update({"$set": update_data, "$inc": {"version": 1}}, None))
+            updated = await tournaments_collection.find_one_and_update(
+                {"id": tournament_id}, update, return_document=ReturnDocument.AFTER
+            )
+            if updated:
+                updated = expand_tournament(updated)
+                DBManager._cache_active_tournament(updated['guild_id'], copy.deepcopy(updated))
+                event = event or ("status_changed" if "status" in update_data else "updated")
+                await DBManager._record_event(tournament_id, event, update, state=updated, seq=updated['event_seq'])
+            return
+
         await tournaments_collection.update_one({"id": tournament_id}, {"$set": update_data})
+        cached = DBManager._cached_tournament(tournament_id)
+        if cached:
+            cached.update(copy.deepcopy(update_data))
+
+    @staticmethod
+    async def update_tournament_if_version(tournament_id: str, version: int, update: dict, event: str = "updated"):
+        """
+        Aplica 'update' (documento con operadores, p. ej. {"$set": {...}, "$push": {...}})
+        solo si el torneo sigue en la versión indicada, incrementa la versión y registra el evento.
+        Los cambios sobre 'matches' se guardan en el formato compacto (ver storage_update).
+        Devuelve el torneo actualizado o None si otro proceso lo modificó antes
+        """
+        version_filter = version if version else {"$in": [0, None]}
+        bracket = await DBManager._stored_bracket(tournament_id) if "matches" in update.get("$push", {}) else None
+        update = storage_update(update, bracket)
+        update["$inc"] = dict(update.get("$inc", {}), version=1)
+        update = with_event_seq(update)
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id, "version": version_filter},
+            update,
+            return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            updated = expand_tournament(updated)
+            DBManager._cache_active_tournament(updated['guild_id'], copy.deepcopy(updated))
+            await DBManager._record_event(tournament_id, event, update, state=updated, seq=updated['event_seq'])
+        else:
+            DBManager._invalidate_tournament(tournament_id)
+        return Tournament.from_doc(updated)
+
+    @staticmethod
+    async def modify_tournament(tournament_id: str, mutator, retries: int = TOURNAMENT_CAS_RETRIES, event: str = "updated"):
+        """
+        Lee el torneo desde la base de datos y aplica el update que devuelve mutator(torneo) con
+        update_tournament_if_version, reintentando si hay conflicto de versión.
+        Si mutator devuelve None no se modifica nada.
+        Devuelve el torneo actualizado o None si se abortó o se agotaron los reintentos
+        """
+        for attempt in range(retries):
+            tournament = Tournament.from_doc(expand_tournament(await tournaments_collection.find_one({"id": tournament_id})))
+            if not tournament:
+                return None
+            update = mutator(tournament)
+            if update is None:
+                return None
+            updated = await DBManager.update_tournament_if_version(tournament_id, tournament.version, update, event)
+            if updated:
+                return updated
+            await asyncio.sleep(0.05 * (attempt + 1))
+        return None
+
+    @staticmethod
+    async def reserve_team_slot(tournament_id: str, pending_id: str = None):
+        """
+        Reserva de forma atómica una plaza de equipo si el torneo está abierto y no ha alcanzado max_teams.
+        Si no hay plaza, recalcula el contador (reconcile_team_slots) y lo vuelve a intentar una vez.
+        'pending_id' es la inscripción pendiente para la que se reserva (ya guardada, no se cuenta dos veces).
+        Devuelve True si se ha reservado
+        """
+        cached = DBManager._cached_tournament(tournament_id)
+        if cached is None or 'reserved_slots' not in cached:
+            await tournaments_collection.update_one(
+                {"id": tournament_id, "reserved_slots": {"$exists": False}},
+                {"$set": {"reserved_slots": await teams_collection.count_documents({"tournament_id": tournament_id})}}
+            )
+
+        for attempt in range(2):
+            updated = await tournaments_collection.find_one_and_update(
+                {
+                    "id": tournament_id,
+                    "status": "open",
+                    "$expr": {"$lt": ["$reserved_slots", {"$ifNull": ["$max_teams", 16]}]}
+                },
+                {"$inc": {"reserved_slots": 1}},
+                projection={"reserved_slots": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            DBManager._set_cached_slots(tournament_id, updated)
+            if updated is not None:
+                return True
+            if attempt == 0 and not await DBManager.reconcile_team_slots(tournament_id, exclude_pending=pending_id):
+                break
+        return False
+
+    @staticmethod
+    async def reconcile_team_slots(tournament_id: str, exclude_pending: str = None):
+        """
+        Recalcula 'reserved_slots' como equipos + inscripciones pendientes del torneo, para recuperar
+        las plazas que se quedaron reservadas (p. ej. si el proceso que las tenía se reinició).
+        Cada plaza debe estar siempre respaldada por un documento: se reserva después de guardar la
+        inscripción y se libera antes de borrar el equipo o la inscripción, así el recuento nunca se queda corto.
+        Devuelve True si el contador ha bajado
+        """
+        tournament = await tournaments_collection.find_one({"id": tournament_id, "status": "open"}, {"reserved_slots": 1})
+        if not tournament:
+            return False
+        pending_query = {"tourney_id": tournament_id}
+        if exclude_pending:
+            pending_query["id"] = {"$ne": exclude_pending}
+        held = await teams_collection.count_documents({"tournament_id": tournament_id})
+        held += await pending_registrations_collection.count_documents(pending_query)
+        if held >= tournament.get('reserved_slots', 0):
+            return False
+
+        # Solo se corrige si nadie ha cambiado el contador mientras se contaba
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id, "reserved_slots": tournament.get('reserved_slots', 0)},
+            {"$set": {"reserved_slots": held}},
+            projection={"reserved_slots": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            DBManager._invalidate_tournament(tournament_id)
+            return True
+        print(f"Reconciled reserved slots of {tournament_id}: {tournament.get('reserved_slots', 0)} -> {held}")
+        DBManager._set_cached_slots(tournament_id, updated)
+        return True
+
+    @staticmethod
+    async def release_team_slot(tournament_id: str):
+        """
+        Libera una plaza de equipo reservada
+        """
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id, "reserved_slots": {"$gt": 0}},
+            {"$inc": {"reserved_slots": -1}},
+            projection={"reserved_slots": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        DBManager._set_cached_slots(tournament_id, updated)
+
+    @staticmethod
+    def _set_cached_slots(tournament_id: str, updated: Optional[dict]):
+        """
+        Actualiza el contador de plazas del torneo cacheado
+        """
+        cached = DBManager._cached_tournament(tournament_id)
+        if not cached:
+            return
+        if updated:
+            cached.reserved_slots = updated['reserved_slots']
+        else:
+            DBManager._invalidate_tournament(tournament_id)
+
+    @staticmethod
+    async def update_match(tournament_id: str, round_idx: int, match_idx: int, data: dict):
+        """
+        Actualiza campos de un único partido (matches.<ronda>.<índice>.<campo>) e incrementa la versión del torneo.
+        En el formato compacto solo se puede cambiar 'channel_id' (el ganador se establece con set_match_winner).
+        Devuelve el torneo actualizado o None si no existe
+        """
+        if await DBManager._stored_bracket(tournament_id) is not None:
+            if set(data) - {"channel_id"}:
+                raise ValueError("En el bracket compacto solo se puede actualizar channel_id")
+            update = {"$set": {f"bracket.rounds.{round_idx}.channels.{match_idx}": data['channel_id']}}
+        else:
+            update = {"$set": {f"matches.{round_idx}.{match_idx}.{field}": value for field, value in data.items()}}
+        update["$inc"] = {"version": 1}
+        update = with_event_seq(update)
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id}, update, return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            updated = expand_tournament(updated)
+            DBManager._cache_active_tournament(updated['guild_id'], copy.deepcopy(updated))
+            await DBManager._record_event(tournament_id, "match_updated", update, state=updated, seq=updated['event_seq'])
+        else:
+            DBManager._invalidate_tournament(tournament_id)
+        return Tournament.from_doc(updated)
+
+    @staticmethod
+    async def set_match_winner(tournament_id: str, round_idx: int, match_idx: int, winner_id: str):
+        """
+        Establece el ganador de un partido de la ronda actual solo si aún no tiene uno.
+        En el formato compacto solo se activan los bits del partido en 'decided' y 'team2_won'.
+        Devuelve el torneo actualizado o None si no se ha podido establecer
+        """
+        tournament = await DBManager.get_tournament(tournament_id, fresh=True)
+        if not tournament:
+            return None
+        if tournament.bracket is not None:
+            try:
+                slot = winner_slot(tournament.matches[round_idx][match_idx].to_doc(), winner_id)
+            except (IndexError, ValueError):
+                return None
+            mask = 1 << match_idx
+            decided = f"bracket.rounds.{round_idx}.decided"
+            bits = {decided: {"or": mask}}
+            if slot == 2:
+                bits[f"bracket.rounds.{round_idx}.team2_won"] = {"or": mask}
+            query = {"id": tournament_id, "current_round": round_idx + 1, decided: {"$bitsAllClear": mask}}
+            update = {"$bit": bits, "$inc": {"version": 1}}
+        else:
+            field = f"matches.{round_idx}.{match_idx}.winner_id"
+            query = {"id": tournament_id, "current_round": round_idx + 1, field: None}
+            update = {"$set": {field: winner_id}, "$inc": {"version": 1}}
+
+        update = with_event_seq(update)
+        updated = await tournaments_collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        if updated:
+            updated = expand_tournament(updated)
+            DBManager._cache_active_tournament(updated['guild_id'], copy.deepcopy(updated))
+            await DBManager._record_event(tournament_id, "winner_set", update, state=updated, seq=updated['event_seq'])
+        else:
+            DBManager._invalidate_tournament(tournament_id)
+        return Tournament.from_doc(updated)
+
+    @staticmethod
+    async def push_round(tournament_id: str, round_matches: list, current_round: int):
+        """
+        Añade una nueva ronda al bracket y actualiza la ronda actual
+        """
+        update = with_event_seq(storage_update(
+            {"$push": {"matches": round_matches}, "$set": {"current_round": current_round}, "$inc": {"version": 1}},
+            await DBManager._stored_bracket(tournament_id)
+        ))
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id}, update, return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            updated = expand_tournament(updated)
+            DBManager._cache_active_tournament(updated['guild_id'], copy.deepcopy(updated))
+            await DBManager._record_event(tournament_id, "round_advanced", update, state=updated, seq=updated['event_seq'])
+
+    @staticmethod
+    async def _stored_bracket(tournament_id: str):
+        """
+        Obtiene el bracket compacto guardado de un torneo, o None si usa el formato antiguo con 'matches'
+        """
+        cached = DBManager._cached_tournament(tournament_id)
+        if cached:
+            return cached.bracket
+        tournament = await tournaments_collection.find_one({"id": tournament_id}, {"bracket": 1})
+        return tournament.get('bracket') if tournament else None
+
+    @staticmethod
+    async def _next_event_seq(tournament_id: str):
+        """
+        Reserva el siguiente número de evento de un torneo (contador 'event_seq' del documento)
+        """
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id}, {"$inc": {"event_seq": 1}},
+            projection={"event_seq": 1}, return_document=ReturnDocument.AFTER
+        )
+        return updated['event_seq'] if updated else None
+
+    @staticmethod
+    async def _sync_event_seq(tournament_id: str):
+        """
+        Adelanta 'event_seq' hasta el último evento guardado (torneos con eventos anteriores al contador)
+        """
+        last = await tournament_events_collection.find_one({"tournament_id": tournament_id}, sort=[("seq", -1)])
+        if last:
+            await tournaments_collection.update_one(
+                {"id": tournament_id, "$or": [{"event_seq": {"$lt": last['seq']}}, {"event_seq": {"$exists": False}}]},
+                {"$set": {"event_seq": last['seq']}}
+            )
+
+    @staticmethod
+    async def _record_event(tournament_id: str, event_type: str, update: Optional[dict] = None, data: Optional[dict] = None, state: Optional[dict] = None, seq: Optional[int] = None):
+        """
+        Añade un evento al historial del torneo (solo se añaden, nunca se modifican).
+        'seq' es el 'event_seq' que ya ha incrementado el update del torneo (ver with_event_seq);
+        si no se indica se reserva uno con _next_event_seq.
+        Cada TOURNAMENT_SNAPSHOT_INTERVAL eventos guarda también una instantánea del estado
+        """
+        for _ in range(TOURNAMENT_CAS_RETRIES):
+            if seq is None:
+                seq = await DBManager._next_event_seq(tournament_id)
+                if seq is None:
+                    return None
+            event = {
+                "tournament_id": tournament_id,
+                "seq": seq,
+                "type": event_type,
+                "version": state.get('version') if state else None,
+                "created_at": datetime.datetime.utcnow()
+            }
+            if update:
+                event["changes"] = event_changes(update)
+            if data:
+                event["data"] = data
+            try:
+                await tournament_events_collection.insert_one(event)
+                break
+            except DuplicateKeyError:
+                await DBManager._sync_event_seq(tournament_id)
+                seq = None
+        else:
+            return None
+
+        if state is not None and seq % TOURNAMENT_SNAPSHOT_INTERVAL == 0:
+            snapshot = storage_state(state)
+            await tournament_snapshots_collection.insert_one({"tournament_id": tournament_id, "seq": seq, "state": snapshot})
+        return seq
+
+    @staticmethod
+    def tournament_events_stream(tournament_id: str, after_seq: int = 0):
+        """
+        Cursor con los eventos de un torneo posteriores a 'after_seq', en orden (para reproducirlos o analizarlos)
+        """
+        return tournament_events_collection.find(
+            {"tournament_id": tournament_id, "seq": {"$gt": after_seq}}
+        ).sort("seq", 1)
+
+    @staticmethod
+    async def get_tournament_events(tournament_id: str, limit: int = 10):
+        """
+        Obtiene los últimos eventos de un torneo (del más reciente al más antiguo)
+        """
+        cursor = tournament_events_collection.find({"tournament_id": tournament_id}).sort("seq", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    @staticmethod
+    async def rebuild_tournament(tournament_id: str, seq: Optional[int] = None):
+        """
+        Reconstruye el torneo a partir de la última instantánea y los eventos posteriores.
+        Si se indica 'seq' reconstruye el estado tras ese evento
+        """
+        return Tournament.from_doc(await DBManager._rebuild_state(tournament_id, seq))
+
+    @staticmethod
+    async def _rebuild_state(tournament_id: str, seq: Optional[int] = None):
+        """
+        Igual que rebuild_tournament pero devuelve el documento (con 'matches' expandido)
+        """
+        snapshot_filter = {"tournament_id": tournament_id}
+        if seq is not None:
+            snapshot_filter["seq"] = {"$lte": seq}
+        snapshot = await tournament_snapshots_collection.find_one(snapshot_filter, sort=[("seq", -1)])
+        state = copy.deepcopy(snapshot['state']) if snapshot else None
+        start = snapshot['seq'] if snapshot else 0
+
+        events_filter = {"tournament_id": tournament_id, "seq": {"$gt": start}}
+        if seq is not None:
+            events_filter["seq"]["$lte"] = seq
+        async for event in tournament_events_collection.find(events_filter).sort("seq", 1):
+            state = apply_event(state, event)
+        return expand_tournament(state)
+
+    @staticmethod
+    async def rollback_tournament(tournament_id: str, seq: int):
+        """
+        Devuelve el estado del torneo (estado, ronda, partidos y ganador) al que tenía tras el evento 'seq'.
+        Los equipos y los canales ya asignados a los partidos no se modifican. Devuelve el torneo actualizado o None si no hay estado para ese evento
+        """
+        state = await DBManager._rebuild_state(tournament_id, seq)
+        if not state:
+            return None
+        current = await tournaments_collection.find_one({"id": tournament_id})
+        if not current:
+            return None
+        stored = keep_live_channels(storage_state(state), current)
+        update = {
+            "$set": {field: stored[field] for field in VERSIONED_FIELDS if field in stored},
+            "$unset": {field: "" for field in VERSIONED_FIELDS if field not in stored},
+            "$inc": {"version": 1, "event_seq": 1}
+        }
+        update = {op: fields for op, fields in update.items() if fields}
+        updated = await tournaments_collection.find_one_and_update(
+            {"id": tournament_id}, update, return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            updated = expand_tournament(updated)
+            DBManager._cache_active_tournament(updated['guild_id'], copy.deepcopy(updated))
+            await DBManager._record_event(tournament_id, "rolled_back", update, data={"to_seq": seq}, state=updated, seq=updated['event_seq'])
+        return Tournament.from_doc(updated)
+
+    @staticmethod
+    def _cached_roster(tournament_id: Optional[str]):
+        """
+        Obtiene el roster cacheado de un torneo, o None si no está en caché
+        """
+        if not tournament_id:
+            return None
+        return roster_cache.get(tournament_id)
+
+    @staticmethod
+    def _roster_of_team(team_id: str):
+        """
+        Obtiene el roster cacheado que contiene un equipo, o None si no está en caché
+        """
+        tournament_id = roster_team_tournaments.get(team_id)
+        if not tournament_id:
+            return None
+        roster = roster_cache.peek(tournament_id)
+        if not roster or team_id not in roster.teams:
+            roster_team_tournaments.pop(team_id, None)
+            return None
+        return roster
+
+    @staticmethod
+    def _invalidate_roster(tournament_id: str):
+        """
+        Elimina de la caché el roster de un torneo
+        """
+        roster = roster_cache.peek(tournament_id)
+        if roster:
+            for team_id in roster.teams:
+                roster_team_tournaments.pop(team_id, None)
+        roster_cache.invalidate(tournament_id)
+
+    @staticmethod
+    def get_roster_cache_stats():
+        """
+        Obtiene las estadísticas (aciertos/fallos) de la caché de rosters
+        """
+        return roster_cache.stats()
 
     @staticmethod
     async def create_team(data: dict):
         """
-        Crea un nuevo equipo
+        Crea un nuevo equipo.
+        Lanza DuplicateTeamError si el nombre ya existe en el torneo o algún miembro ya tiene equipo
         """
-        result = await teams_collection.insert_one(data)
+        try:
+            result = await teams_collection.insert_one(data)
+        except DuplicateKeyError as e:
+            raise DuplicateTeamError.from_error(e)
+        roster = roster_cache.peek(data['tournament_id'])
+        if roster:
+            roster.add(Team.from_doc(copy.deepcopy(data)))
+            roster_team_tournaments[data['id']] = data['tournament_id']
+        await DBManager._record_event(data['tournament_id'], "team_registered", data={
+            "team_id": data['id'],
+            "name": data['name'],
+            "members": data.get('members', [])
+        })
         return result.inserted_id
 
     @staticmethod
-    async def get_team(team_id: str):
+    async def get_team(team_id: str, fresh: bool = False):
         """
-        Obtiene un equipo por su ID
+        Obtiene un equipo por su ID.
+        Con fresh=True lo lee de la base de datos (ver Cachés)
         """
-        return await teams_collection.find_one({"id": team_id})
+        roster = DBManager._roster_of_team(team_id)
+        if roster and not fresh:
+            return copy.deepcopy(roster.teams[team_id])
+        team = Team.from_doc(await teams_collection.find_one({"id": team_id}))
+        if roster and team != roster.teams[team_id]:
+            DBManager._invalidate_roster(roster.teams[team_id].tournament_id)
+        return team
     
     @staticmethod
     async def get_team_by_name(name: str, tournament_id: str):
         """
         Obtiene un equipo por su nombre
         """
-        return await teams_collection.find_one({"name": name, "tournament_id": tournament_id})
+        roster = DBManager._cached_roster(tournament_id)
+        if roster:
+            return copy.deepcopy(roster.by_name(name))
+        return Team.from_doc(await teams_collection.find_one({"name": name, "tournament_id": tournament_id}, collation=NAME_COLLATION))
 
     @staticmethod
-    async def get_team_by_member(user_id: int, tournament_id: str = None):
+    async def get_team_by_member(user_id: int, tournament_id: str = None, fresh: bool = False):
         """
-        Obtiene un equipo por el ID de uno de sus miembros
+        Obtiene un equipo por el ID de uno de sus miembros.
+        Con fresh=True lo lee de la base de datos (ver Cachés)
         """
+        roster = DBManager._cached_roster(tournament_id)
+        if roster and not fresh:
+            return copy.deepcopy(roster.by_member(user_id))
         query = {"members": user_id}
         if tournament_id:
             query["tournament_id"] = tournament_id
-        return await teams_collection.find_one(query)
+        team = Team.from_doc(await teams_collection.find_one(query))
+        if roster and team != roster.by_member(user_id):
+            DBManager._invalidate_roster(tournament_id)
+        return team
+
+    @staticmethod
+    async def get_teams_by_members(user_ids: List[int], tournament_id: str):
+        """
+        Obtiene en una sola consulta los equipos de un torneo a los que pertenece alguno de los usuarios
+        """
+        roster = DBManager._cached_roster(tournament_id)
+        if roster:
+            team_ids = {roster.members[uid] for uid in user_ids if uid in roster.members}
+            return [copy.deepcopy(roster.teams[tid]) for tid in team_ids]
+        cursor = teams_collection.find({"tournament_id": tournament_id, "members": {"$in": list(user_ids)}})
+        return [Team.from_doc(team) async for team in cursor]
+
+    @staticmethod
+    async def count_teams(tournament_id: str):
+        """
+        Cuenta el número de equipos de un torneo
+        """
+        roster = DBManager._cached_roster(tournament_id)
+        if roster:
+            return len(roster.teams)
+        return await teams_collection.count_documents({"tournament_id": tournament_id})
 
     @staticmethod
     async def get_teams(tournament_id: str):
         """
-        Obtiene todos los equipos de un torneo
+        Obtiene todos los equipos de un torneo (y guarda el roster en caché)
         """
-        cursor = teams_collection.find({"tournament_id": tournament_id})
-        return await cursor.to_list(length=None)
+        roster = DBManager._cached_roster(tournament_id)
+        if not roster:
+            cursor = teams_collection.find({"tournament_id": tournament_id})
+            teams = [Team.from_doc(team) async for team in cursor]
+            roster = TeamRoster(teams)
+            roster_cache.set(tournament_id, roster)
+            for team in teams:
+                roster_team_tournaments[team.id] = tournament_id
+        return copy.deepcopy(list(roster.teams.values()))
 
     @staticmethod
     async def delete_team(team_id: str):
@@ -148,6 +1335,10 @@ class DBManager:
         Elimina un equipo
         """
         await teams_collection.delete_one({"id": team_id})
+        roster = DBManager._roster_of_team(team_id)
+        if roster:
+            roster.remove(team_id)
+        roster_team_tournaments.pop(team_id, None)
 
     @staticmethod
     async def update_team(team_id: str, data: dict):
@@ -155,6 +1346,115 @@ class DBManager:
         Actualiza un equipo
         """
         await teams_collection.update_one({"id": team_id}, {"$set": data})
+        roster = DBManager._roster_of_team(team_id)
+        if roster:
+            roster.update(team_id, copy.deepcopy(data))
+
+    @staticmethod
+    async def add_team_member(team_id: str, user_id: int):
+        """
+        Añade un miembro a un equipo.
+        Lanza DuplicateTeamError si el usuario ya pertenece a otro equipo del torneo
+        """
+        try:
+            await teams_collection.update_one({"id": team_id}, {"$addToSet": {"members": user_id}})
+        except DuplicateKeyError as e:
+            raise DuplicateTeamError.from_error(e)
+        roster = DBManager._roster_of_team(team_id)
+        if roster:
+            members = list(roster.teams[team_id].members)
+            if user_id not in members:
+                members.append(user_id)
+            roster.update(team_id, {"members": members})
+
+    @staticmethod
+    async def create_pending_registration(data: dict):
+        """
+        Guarda una inscripción de equipo pendiente de confirmación.
+        Caduca tras PENDING_REGISTRATION_TTL segundos; devuelve la fecha de caducidad
+        """
+        data = dict(data)
+        data['expires_at'] = datetime.datetime.utcnow() + datetime.timedelta(seconds=PENDING_REGISTRATION_TTL)
+        await pending_registrations_collection.insert_one(data)
+        return data['expires_at']
+
+    @staticmethod
+    async def get_pending_registration(pending_id: str):
+        """
+        Obtiene una inscripción pendiente que no haya expirado
+        """
+        return await pending_registrations_collection.find_one(
+            {"id": pending_id, "claimed": {"$ne": True}, "expires_at": {"$gt": datetime.datetime.utcnow()}}
+        )
+
+    @staticmethod
+    async def confirm_pending_member(pending_id: str, user_id: int):
+        """
+        Marca de forma atómica a un miembro como confirmado en una inscripción pendiente.
+        Devuelve (inscripción actualizada, número de confirmados, si se ha añadido ahora),
+        o (None, 0, False) si la inscripción no existe, ha expirado o el usuario no es miembro
+        """
+        before = await pending_registrations_collection.find_one_and_update(
+            {"id": pending_id, "members": user_id, "claimed": {"$ne": True}, "expires_at": {"$gt": datetime.datetime.utcnow()}},
+            {"$addToSet": {"confirmed": user_id}},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not before:
+            return None, 0, False
+        added = user_id not in before['confirmed']
+        if added:
+            before['confirmed'].append(user_id)
+        return before, len(before['confirmed']), added
+
+    @staticmethod
+    async def claim_pending_registration(pending_id: str):
+        """
+        Reclama de forma atómica una inscripción pendiente (solo un proceso la obtiene) y la devuelve,
+        o None si no existe o ya estaba reclamada.
+        El documento se mantiene (respaldando su plaza) hasta que quien la reclama la borra
+        """
+        return await pending_registrations_collection.find_one_and_update(
+            {"id": pending_id, "claimed": {"$ne": True}},
+            {"$set": {"claimed": True}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    async def delete_pending_registration(pending_id: str):
+        """
+        Elimina una inscripción pendiente y la devuelve (None si ya no existía)
+        """
+        return await pending_registrations_collection.find_one_and_delete({"id": pending_id})
+
+    @staticmethod
+    async def cancel_pending_registration(pending_id: str):
+        """
+        Cancela una inscripción pendiente: la reclama, libera su plaza y la borra.
+        Devuelve la inscripción, o None si otro proceso ya la había reclamado
+        """
+        data = await DBManager.claim_pending_registration(pending_id)
+        if not data:
+            return None
+        await DBManager.release_team_slot(data['tourney_id'])
+        await DBManager.delete_pending_registration(pending_id)
+        return data
+
+    @staticmethod
+    async def release_expired_registrations():
+        """
+        Cancela las inscripciones pendientes caducadas y libera sus plazas.
+        No depende de la vista que las creó, así que funciona tras un reinicio o con varios procesos.
+        Devuelve el número de inscripciones canceladas
+        """
+        cursor = pending_registrations_collection.find(
+            {"claimed": {"$ne": True}, "expires_at": {"$lte": datetime.datetime.utcnow()}},
+            {"id": 1}
+        )
+        released = 0
+        async for pending in cursor:
+            if await DBManager.cancel_pending_registration(pending['id']):
+                released += 1
+        return released
 
     @staticmethod
     async def delete_tournament(tournament_id: str):
@@ -162,6 +1462,10 @@ class DBManager:
         Elimina un torneo de la base de datos
         """
         await tournaments_collection.delete_one({"id": tournament_id})
+        await tournaments_archive_collection.delete_one({"id": tournament_id})
+        await tournament_events_collection.delete_many({"tournament_id": tournament_id})
+        await tournament_snapshots_collection.delete_many({"tournament_id": tournament_id})
+        DBManager._invalidate_tournament(tournament_id)
 
     @staticmethod
     async def delete_teams_by_tournament(tournament_id: str):
@@ -169,46 +1473,185 @@ class DBManager:
         Elimina todos los equipos de un torneo
         """
         await teams_collection.delete_many({"tournament_id": tournament_id})
+        DBManager._invalidate_roster(tournament_id)
 
     @staticmethod
-    async def get_tournaments_history(guild_id: int, skip: int = 0, limit: int = 1):
+    def history_cursor(tournament: Tournament):
         """
-        Obtiene el historial de torneos de un servidor
+        Obtiene el cursor de paginación (created_at, id) de un torneo del historial
         """
-        cursor = tournaments_collection.find({"guild_id": guild_id}).sort("created_at", -1).skip(skip).limit(limit)
-        return await cursor.to_list(length=limit)
+        return {"created_at": tournament.created_at, "id": tournament.id}
+
+    @staticmethod
+    def _history_keyset(guild_id: int, cursor: Optional[dict], direction: str):
+        """
+        Construye el filtro y la ordenación para paginar el historial por (created_at, id).
+        'next' avanza hacia torneos más antiguos y 'prev' hacia más recientes
+        """
+        query = {"guild_id": guild_id}
+        op = "$lt" if direction == "next" else "$gt"
+        if cursor:
+            query["$or"] = [
+                {"created_at": {op: cursor['created_at']}},
+                {"created_at": cursor['created_at'], "id": {op: cursor['id']}}
+            ]
+        order = -1 if direction == "next" else 1
+        return query, [("created_at", order), ("id", order)]
+
+    @staticmethod
+    async def get_tournaments_history(guild_id: int, skip: int = 0, limit: int = 1, cursor: Optional[dict] = None, direction: str = "next"):
+        """
+        Obtiene el historial de torneos de un servidor (del más reciente al más antiguo).
+        Con 'cursor' pagina por clave (created_at, id) en lugar de usar skip
+        """
+        query, sort = DBManager._history_keyset(guild_id, cursor, direction)
+        find = tournaments_collection.find(query).sort(sort)
+        if skip:
+            find = find.skip(skip)
+        history = [Tournament.from_doc(t) for t in await find.limit(limit).to_list(length=limit)]
+        if direction == "prev":
+            history.reverse()
+        return history
     
     @staticmethod
-    async def count_tournaments(guild_id: int):
+    async def get_history_page(guild_id: int, cursor: Optional[dict] = None, direction: str = "next", limit: int = 1, with_total: bool = False):
         """
-        Cuenta el número de torneos de un servidor
+        Obtiene en una sola consulta una página del historial de torneos a partir de un cursor.
+        Cada torneo incluye el equipo ganador ('winner_team') y el número de equipos ('teams_count').
+        Si 'with_total' es True también devuelve el total de torneos, si no el total es None
         """
-        return await tournaments_collection.count_documents({"guild_id": guild_id})
+        query, sort = DBManager._history_keyset(guild_id, cursor, direction)
+        items_pipeline = [
+            {"$sort": dict(sort)},
+            {"$limit": limit},
+            {"$lookup": {"from": "teams", "localField": "winner_id", "foreignField": "id", "as": "winner_team"}},
+            {"$lookup": {
+                "from": "teams",
+                "let": {"tid": "$id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$tournament_id", "$$tid"]}}},
+                    {"$count": "count"}
+                ],
+                "as": "teams_count"
+            }},
+            {"$addFields": {
+                "winner_team": {"$arrayElemAt": ["$winner_team", 0]},
+                "teams_count": {"$ifNull": [{"$arrayElemAt": ["$teams_count.count", 0]}, 0]}
+            }}
+        ]
+
+        if not with_total:
+            items = await tournaments_collection.aggregate([{"$match": query}] + items_pipeline).to_list(length=limit)
+            total = None
+        else:
+            pipeline = [
+                {"$match": {"guild_id": guild_id}},
+                {"$facet": {
+                    "total": [{"$count": "count"}],
+                    "items": [{"$match": query}] + items_pipeline
+                }}
+            ]
+            result = await tournaments_collection.aggregate(pipeline).to_list(length=1)
+            if not result:
+                return [], 0
+            facet = result[0]
+            items = facet['items']
+            total = facet['total'][0]['count'] if facet['total'] else 0
+
+        # Los torneos archivados ya guardan 'winner_team' y 'teams_count'
+        archived = await tournaments_archive_collection.find(query, {"teams": 0}).sort(sort).limit(limit).to_list(length=limit)
+        if archived:
+            items = sorted(items + archived, key=lambda t: (t['created_at'], t['id']), reverse=direction == "next")[:limit]
+        if with_total:
+            total += await tournaments_archive_collection.count_documents({"guild_id": guild_id})
+
+        items = [Tournament.from_doc(item) for item in items]
+        if direction == "prev":
+            items.reverse()
+        return items, total
 
     @staticmethod
     async def count_tournaments(guild_id: int):
         """
-        Cuenta el número de torneos de un servidor
+        Cuenta el número de torneos de un servidor (incluidos los archivados)
         """
-        return await tournaments_collection.count_documents({"guild_id": guild_id})
+        active = await tournaments_collection.count_documents({"guild_id": guild_id})
+        archived = await tournaments_archive_collection.count_documents({"guild_id": guild_id})
+        return active + archived
+
+    @staticmethod
+    def _archive_document(tournament: dict, teams: List[dict]):
+        """
+        Construye el documento compacto del archivo: el torneo sin campos de trabajo y con sus equipos embebidos
+        """
+        archived = {k: v for k, v in storage_state(tournament).items() if k not in ('version', 'event_seq', 'reserved_slots')}
+        if tournament.get('bracket') is not None:
+            archived['bracket'] = {
+                "teams": tournament['bracket'].get('teams', []),
+                "rounds": [{k: v for k, v in r.items() if k != 'channels'} for r in tournament['bracket'].get('rounds', [])]
+            }
+        else:
+            archived['matches'] = [
+                [{k: v for k, v in match.items() if k != 'channel_id'} for match in round_matches]
+                for round_matches in tournament.get('matches', [])
+            ]
+        archived['teams'] = [{k: v for k, v in team.items() if k not in ('_id', 'tournament_id')} for team in teams]
+        archived['teams_count'] = len(teams)
+        archived['winner_team'] = next((team for team in archived['teams'] if team['id'] == tournament.get('winner_id')), None)
+        archived['archived'] = True
+        archived['archived_at'] = datetime.datetime.utcnow()
+        return archived
+
+    @staticmethod
+    async def archive_finished_tournaments(older_than: datetime.timedelta, limit: int = ARCHIVE_BATCH_SIZE):
+        """
+        Mueve al archivo los torneos finalizados hace más de 'older_than' junto con sus equipos.
+        Devuelve el número de torneos archivados
+        """
+        cutoff = datetime.datetime.utcnow() - older_than
+        query = {
+            "status": {"$in": FINISHED_STATUSES},
+            "$or": [
+                {"finished_at": {"$lt": cutoff}},
+                {"finished_at": {"$exists": False}, "created_at": {"$lt": cutoff}}
+            ]
+        }
+        tournaments = await tournaments_collection.find(query).limit(limit).to_list(length=limit)
+        for tournament in tournaments:
+            teams = await teams_collection.find({"tournament_id": tournament['id']}).to_list(length=None)
+            # Primero se escribe el archivo: si el proceso se interrumpe, repetirlo es seguro
+            await tournaments_archive_collection.replace_one(
+                {"id": tournament['id']}, DBManager._archive_document(tournament, teams), upsert=True
+            )
+            await teams_collection.delete_many({"tournament_id": tournament['id']})
+            await tournaments_collection.delete_one({"id": tournament['id']})
+            DBManager._invalidate_roster(tournament['id'])
+            DBManager._invalidate_tournament(tournament['id'])
+        return len(tournaments)
 
     @staticmethod
     async def get_guild_config(guild_id: int):
         """
-        Obtiene la configuración de un servidor
+        Obtiene la configuración de un servidor (usa la caché si está disponible).
+        Los servidores sin configuración también se cachean (como None) para no consultar la base de datos en cada comando
         """
-        return await guilds_config_collection.find_one({"guild_id": guild_id})
+        config = guild_config_cache.get(guild_id, _MISSING)
+        if config is _MISSING:
+            config = GuildConfig.from_doc(await guilds_config_collection.find_one({"guild_id": guild_id}))
+            guild_config_cache.set(guild_id, config)
+        return copy.deepcopy(config)
 
     @staticmethod
     async def get_or_create_guild_config(guild_id: int):
         """
         Obtiene la configuración de un servidor o la crea si no existe
         """
-        config = await guilds_config_collection.find_one({"guild_id": guild_id})
+        config = await DBManager.get_guild_config(guild_id)
         if not config:
-            new_config = GuildConfig(guild_id=guild_id, admin_roles=[])
-            await guilds_config_collection.insert_one(new_config.to_dict())
-            return new_config.to_dict()
+            new_config = GuildConfig(guild_id=guild_id)
+            await guilds_config_collection.insert_one(new_config.to_doc())
+            guild_config_cache.invalidate(guild_id)
+            return new_config
         return config
 
     @staticmethod
@@ -218,3 +1661,61 @@ class DBManager:
         """
         await DBManager.get_or_create_guild_config(guild_id)
         await guilds_config_collection.update_one({"guild_id": guild_id}, {"$set": {field: value}})
+        guild_config_cache.invalidate(guild_id)
+
+    @staticmethod
+    def get_guild_config_cache_stats():
+        """
+        Obtiene las estadísticas (aciertos/fallos) de la caché de configuración
+        """
+        return guild_config_cache.stats()
+
+    @staticmethod
+    async def export_guild_documents(guild_id: int, batch_size: int = BACKUP_BATCH_SIZE):
+        """
+        Recorre con cursores los documentos de un servidor (configuración, torneos, archivo, equipos y eventos).
+        Devuelve pares (colección, documento) sin cargar más de un lote por cursor en memoria
+        """
+        config = await guilds_config_collection.find_one({"guild_id": guild_id}, {"_id": 0})
+        if config:
+            yield "guild_config", config
+        for name in ("tournaments", "tournaments_archive"):
+            cursor = BACKUP_COLLECTIONS[name].find({"guild_id": guild_id}, {"_id": 0}).batch_size(batch_size)
+            async for tournament in cursor:
+                yield name, tournament
+                for related in ("teams", "tournament_events", "tournament_snapshots"):
+                    related_cursor = BACKUP_COLLECTIONS[related].find(
+                        {"tournament_id": tournament['id']}, {"_id": 0}
+                    ).batch_size(batch_size)
+                    async for doc in related_cursor:
+                        yield related, doc
+
+    @staticmethod
+    async def import_documents(collection_name: str, documents: List[dict]):
+        """
+        Inserta un lote de documentos de una copia de seguridad con insert_many (los ya existentes se omiten).
+        Devuelve (insertados, omitidos)
+        """
+        collection = BACKUP_COLLECTIONS.get(collection_name)
+        if collection is None:
+            raise ValueError(f"Colección desconocida en la copia: {collection_name}")
+        if not documents:
+            return 0, 0
+        try:
+            result = await collection.insert_many(documents, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            inserted = e.details.get("nInserted", 0)
+
+        for doc in documents:
+            if collection_name == "guild_config":
+                guild_config_cache.invalidate(doc.get('guild_id'))
+            elif collection_name == "tournaments":
+                active_tournament_cache.invalidate(doc.get('guild_id'))
+                DBManager._invalidate_tournament(doc.get('id'))
+            elif collection_name == "teams":
+                DBManager._invalidate_roster(doc.get('tournament_id'))
+        return inserted, len(documents) - inserted
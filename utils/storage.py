@@ -0,0 +1,786 @@
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from typing import List, Optional
+from abc import ABC, abstractmethod
+import datetime
+import asyncio
+import copy
+import uuid
+import re
+
+class StorageBackend(ABC):
+    """
+    Backend de almacenamiento usado por DBManager.
+    Da acceso a colecciones con la API asíncrona de Motor (insert_one, find, update_one, aggregate...)
+    """
+    name = "base"
+
+    def __getitem__(self, collection_name: str):
+        return self.get_collection(collection_name)
+
+    @abstractmethod
+    def get_collection(self, collection_name: str):
+        """
+        Obtiene una colección por nombre
+        """
+
+    @abstractmethod
+    async def ping(self):
+        """
+        Comprueba que el almacenamiento responde
+        """
+
+class LazyCollection:
+    """
+    Colección de Motor que no se resuelve (ni crea el cliente) hasta el primer uso
+    """
+    def __init__(self, backend: "MotorBackend", name: str):
+        self._backend = backend
+        self._name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = self._backend.db[self._name]
+        return getattr(self._collection, attr)
+
+class MotorBackend(StorageBackend):
+    """
+    Backend que usa MongoDB a través de Motor.
+    El cliente se crea en el primer uso con las opciones de pool, timeouts, preferencia de lectura y compresión indicadas
+    """
+    name = "mongo"
+
+    def __init__(self, url: str, database: str, **client_options):
+        self.url = url
+        self.database = database
+        self.client_options = {k: v for k, v in client_options.items() if v not in (None, "")}
+        self._client = None
+        self._collections = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import motor.motor_asyncio
+            self._client = motor.motor_asyncio.AsyncIOMotorClient(self.url, **self.client_options)
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    def get_collection(self, collection_name: str):
+        if collection_name not in self._collections:
+            self._collections[collection_name] = LazyCollection(self, collection_name)
+        return self._collections[collection_name]
+
+    async def ping(self):
+        await self.client.admin.command("ping")
+
+class MemoryBackend(StorageBackend):
+    """
+    Backend en memoria con la misma semántica de consultas que MongoDB para las operaciones que usa el bot.
+    Pensado para pruebas de carga y CI sin base de datos
+    """
+    name = "memory"
+
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, collection_name: str):
+        if collection_name not in self.collections:
+            self.collections[collection_name] = MemoryCollection(collection_name, self)
+        return self.collections[collection_name]
+
+    async def ping(self):
+        await asyncio.sleep(0)
+
+def create_backend(kind: str, url: Optional[str] = None, database: str = "tourney_bot", **client_options):
+    """
+    Crea el backend de almacenamiento indicado ("mongo" o "memory").
+    'client_options' se pasan al cliente de Motor
+    """
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "mongo":
+        return MotorBackend(url, database, **client_options)
+    raise ValueError(f"Backend de almacenamiento desconocido: {kind}")
+
+# --- Resultados de las operaciones (mismos atributos que pymongo) ---
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+class UpdateResult:
+    def __init__(self, matched_count, modified_count):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+# --- Evaluación de consultas ---
+
+_MISSING = object()
+
+def _get_path(doc, path: str):
+    """
+    Obtiene el valor de un campo (admite rutas con puntos e índices de array).
+    Si un tramo intermedio es un array de documentos devuelve la lista de valores
+    """
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            if part.isdigit():
+                idx = int(part)
+                value = value[idx] if idx < len(value) else _MISSING
+            else:
+                values = [v.get(part, _MISSING) for v in value if isinstance(v, dict)]
+                value = [v for v in values if v is not _MISSING]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+def _set_path(doc: dict, path: str, value):
+    """
+    Establece el valor de un campo (admite rutas con puntos e índices de array)
+    """
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    last = parts[-1]
+    if isinstance(target, list):
+        target[int(last)] = value
+    else:
+        target[last] = value
+
+def _fold(value, collation: Optional[dict]):
+    """
+    Normaliza una cadena según la collation (strength <= 2 no distingue mayúsculas)
+    """
+    if collation and isinstance(value, str) and collation.get('strength', 3) <= 2:
+        return value.casefold()
+    return value
+
+def _sort_key(value):
+    """
+    Clave de ordenación compatible con el orden de tipos de MongoDB (null primero)
+    """
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime.datetime):
+        return (3, value)
+    return (5, str(value))
+
+def _compare(a, b, op: str, collation=None):
+    a = _fold(a, collation)
+    b = _fold(b, collation)
+    if op == "$eq":
+        return a == b
+    if op == "$ne":
+        return a != b
+    if a is None or b is None:
+        return False
+    try:
+        if op == "$gt":
+            return a > b
+        if op == "$gte":
+            return a >= b
+        if op == "$lt":
+            return a < b
+        if op == "$lte":
+            return a <= b
+    except TypeError:
+        return False
+    raise ValueError(f"Operador no soportado: {op}")
+
+def _candidates(value):
+    """
+    Valores contra los que se compara un campo (un array se compara elemento a elemento y entero)
+    """
+    if isinstance(value, list):
+        return value + [value]
+    return [value]
+
+def _match_operator(value, op: str, arg, collation=None):
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$in":
+        if value is _MISSING:
+            return None in arg
+        return any(_compare(c, a, "$eq", collation) for c in _candidates(value) for a in arg)
+    if op == "$nin":
+        return not _match_operator(value, "$in", arg, collation)
+    if op == "$ne":
+        return not _match_operator(value, "$eq", arg, collation)
+    if op == "$eq":
+        if value is _MISSING:
+            return arg is None
+        return any(_compare(c, arg, "$eq", collation) for c in _candidates(value))
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        if value is _MISSING:
+            return False
+        return any(_compare(c, arg, op, collation) for c in _candidates(value))
+    if op == "$regex":
+        if value is _MISSING:
+            return False
+        return any(isinstance(c, str) and re.search(arg, c) for c in _candidates(value))
+    if op in ("$bitsAllSet", "$bitsAllClear", "$bitsAnySet", "$bitsAnyClear"):
+        if not isinstance(value, int) or isinstance(value, bool):
+            return False
+        mask = arg if isinstance(arg, int) else sum(1 << bit for bit in arg)
+        if op == "$bitsAllSet":
+            return value & mask == mask
+        if op == "$bitsAllClear":
+            return value & mask == 0
+        if op == "$bitsAnySet":
+            return value & mask != 0
+        return value & mask != mask
+    raise ValueError(f"Operador no soportado: {op}")
+
+def match_document(doc: dict, query: dict, collation: Optional[dict] = None, variables: Optional[dict] = None):
+    """
+    Comprueba si un documento cumple un filtro de MongoDB
+    """
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(match_document(doc, q, collation, variables) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(match_document(doc, q, collation, variables) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(match_document(doc, q, collation, variables) for q in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate_expression(doc, condition, variables):
+                return False
+        else:
+            value = _get_path(doc, key)
+            if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+                for op, arg in condition.items():
+                    if not _match_operator(value, op, arg, collation):
+                        return False
+            elif not _match_operator(value, "$eq", condition, collation):
+                return False
+    return True
+
+def evaluate_expression(doc: dict, expr, variables: Optional[dict] = None):
+    """
+    Evalúa una expresión de agregación ($eq, $lt, $ifNull, $arrayElemAt, "$campo", "$$variable"...)
+    """
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, _, rest = expr[2:].partition('.')
+        value = variables.get(name)
+        if rest:
+            value = _get_path(value, rest)
+        return None if value is _MISSING else value
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get_path(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, list):
+        return [evaluate_expression(doc, e, variables) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {k: evaluate_expression(doc, v, variables) for k, v in expr.items()}
+
+    op, args = next(iter(expr.items()))
+    if op == "$literal":
+        return args
+    values = evaluate_expression(doc, args, variables)
+    if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        return _compare(values[0], values[1], op)
+    if op == "$and":
+        return all(values)
+    if op == "$or":
+        return any(values)
+    if op == "$not":
+        return not values[0]
+    if op == "$ifNull":
+        return next((v for v in values if v is not None), None)
+    if op == "$arrayElemAt":
+        array, idx = values
+        if not isinstance(array, list) or not -len(array) <= idx < len(array):
+            return None
+        return array[idx]
+    if op == "$size":
+        return len(values if not isinstance(args, list) else values[0])
+    if op == "$add":
+        return sum(values)
+    if op == "$in":
+        return values[0] in values[1]
+    raise ValueError(f"Expresión no soportada: {op}")
+
+def apply_projection(doc: dict, projection):
+    """
+    Aplica una proyección de inclusión o exclusión a un documento
+    """
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        result = {}
+        for field in fields:
+            value = _get_path(doc, field)
+            if value is not _MISSING:
+                _set_path(result, field, copy.deepcopy(value))
+    else:
+        result = copy.deepcopy(doc)
+        for field in fields:
+            result.pop(field, None)
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+def apply_update(doc: dict, update: dict):
+    """
+    Aplica los operadores de actualización ($set, $unset, $inc, $bit, $push, $addToSet, $pull) a un documento.
+    Devuelve True si el documento ha cambiado
+    """
+    before = copy.deepcopy(doc)
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = _get_path(doc, path)
+            if op == "$set":
+                _set_path(doc, path, copy.deepcopy(value))
+            elif op == "$unset":
+                parts = path.rsplit('.', 1)
+                parent = doc if len(parts) == 1 else _get_path(doc, parts[0])
+                if isinstance(parent, dict):
+                    parent.pop(parts[-1], None)
+            elif op == "$inc":
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$bit":
+                result = 0 if current is _MISSING else current
+                for bit_op, mask in value.items():
+                    if bit_op == "and":
+                        result &= mask
+                    elif bit_op == "or":
+                        result |= mask
+                    elif bit_op == "xor":
+                        result ^= mask
+                _set_path(doc, path, result)
+            elif op in ("$push", "$addToSet"):
+                array = [] if current is _MISSING else current
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in items:
+                    if op == "$push" or item not in array:
+                        array.append(copy.deepcopy(item))
+                _set_path(doc, path, array)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    _set_path(doc, path, [v for v in current if v != value])
+            else:
+                raise ValueError(f"Operador de actualización no soportado: {op}")
+    return doc != before
+
+def sort_documents(docs: List[dict], sort):
+    """
+    Ordena documentos con una especificación de MongoDB ([(campo, 1 | -1), ...] o dict)
+    """
+    if isinstance(sort, dict):
+        sort = list(sort.items())
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d: _sort_key(_get_path(d, field)), reverse=direction == -1)
+    return docs
+
+# --- Colección y cursores en memoria ---
+
+class MemoryCursor:
+    """
+    Cursor asíncrono en memoria (sort, skip, limit, to_list e iteración con async for)
+    """
+    def __init__(self, loader):
+        self._loader = loader
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            key_or_list = [(key_or_list, direction or 1)]
+        self._sort = key_or_list
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    def _materialize(self):
+        if self._results is None:
+            docs = self._loader()
+            if self._sort:
+                docs = sort_documents(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = docs
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None):
+        await asyncio.sleep(0)
+        docs = self._materialize()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._materialize())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class MemoryCollection:
+    """
+    Colección en memoria con la API asíncrona de Motor usada por DBManager
+    """
+    def __init__(self, name: str, backend: MemoryBackend):
+        self.name = name
+        self.backend = backend
+        self.documents = []
+        self.indexes = {"_id_": {"key": [("_id", 1)], "unique": True}}
+        self.access_counts = {}
+        # Por cada índice único: clave -> documento que la ocupa
+        self.unique_entries = {"_id_": {}}
+
+    # Índices
+
+    async def create_index(self, keys, name: Optional[str] = None, **options):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = name or "_".join(f"{k}_{d}" for k, d in keys)
+        index = {"key": list(keys)}
+        index.update(options)
+        if index.get("unique"):
+            entries = {}
+            for doc in self.documents:
+                for entry in self._index_entries(doc, index):
+                    if entry in entries:
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+                    entries[entry] = doc
+            self.unique_entries[name] = entries
+        self.indexes[name] = index
+        self.access_counts.setdefault(name, 0)
+        return name
+
+    async def drop_index(self, name: str, **kwargs):
+        if name not in self.indexes:
+            raise OperationFailure(f"index not found with name [{name}]", 27)
+        del self.indexes[name]
+        self.unique_entries.pop(name, None)
+        self.access_counts.pop(name, None)
+
+    async def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    def _index_entries(self, doc: dict, index: dict):
+        """
+        Claves que un documento aporta a un índice (varias si algún campo es un array)
+        """
+        entries = [()]
+        for field, _ in index["key"]:
+            value = _get_path(doc, field)
+            values = value if isinstance(value, list) and value else [None if value is _MISSING else value]
+            values = [_fold(v, index.get("collation")) for v in values]
+            entries = [e + (repr(v),) for e in entries for v in values]
+        return set(entries)
+
+    def _check_unique(self, doc: dict, ignore=None):
+        for name, entries in self.unique_entries.items():
+            index = self.indexes[name]
+            for entry in self._index_entries(doc, index):
+                owner = entries.get(entry)
+                if owner is not None and owner is not ignore:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.name} index: {name}",
+                        11000,
+                        {"keyPattern": dict(index["key"]), "index": name}
+                    )
+
+    def _add(self, doc: dict, position: Optional[int] = None):
+        """
+        Guarda un documento y registra sus claves en los índices únicos
+        """
+        if position is None:
+            self.documents.append(doc)
+        else:
+            self.documents.insert(position, doc)
+        for name, entries in self.unique_entries.items():
+            for entry in self._index_entries(doc, self.indexes[name]):
+                entries[entry] = doc
+
+    def _remove(self, doc: dict):
+        """
+        Elimina un documento y sus claves de los índices únicos. Devuelve la posición que ocupaba
+        """
+        position = next(i for i, d in enumerate(self.documents) if d is doc)
+        del self.documents[position]
+        for name, entries in self.unique_entries.items():
+            for entry in self._index_entries(doc, self.indexes[name]):
+                if entries.get(entry) is doc:
+                    del entries[entry]
+        return position
+
+    def _replace(self, doc: dict, updated: dict):
+        """
+        Sustituye un documento por su versión actualizada manteniendo su posición
+        """
+        self._add(updated, self._remove(doc))
+
+    def _expire(self):
+        """
+        Elimina los documentos caducados por índices TTL
+        """
+        now = datetime.datetime.utcnow()
+        for index in self.indexes.values():
+            seconds = index.get("expireAfterSeconds")
+            if seconds is None:
+                continue
+            field = index["key"][0][0]
+            limit = now - datetime.timedelta(seconds=seconds)
+            expired = [
+                d for d in self.documents
+                if isinstance(d.get(field), datetime.datetime) and d[field] <= limit
+            ]
+            for doc in expired:
+                self._remove(doc)
+
+    def _matching(self, query: Optional[dict], collation: Optional[dict] = None):
+        self._expire()
+        fields = set(query or {})
+        for name, index in self.indexes.items():
+            if index["key"][0][0] in fields:
+                self.access_counts[name] = self.access_counts.get(name, 0) + 1
+        return [d for d in self.documents if match_document(d, query or {}, collation)]
+
+    # Lectura
+
+    def find(self, filter: Optional[dict] = None, projection=None, collation: Optional[dict] = None, **kwargs):
+        def loader():
+            return [apply_projection(copy.deepcopy(d), projection) for d in self._matching(filter, collation)]
+        cursor = MemoryCursor(loader)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection=None, collation: Optional[dict] = None, sort=None):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, collation)
+        if sort:
+            docs = sort_documents(list(docs), sort)
+        if not docs:
+            return None
+        return apply_projection(copy.deepcopy(docs[0]), projection)
+
+    async def count_documents(self, filter: Optional[dict] = None, **kwargs):
+        await asyncio.sleep(0)
+        return len(self._matching(filter, kwargs.get("collation")))
+
+    # Escritura
+
+    async def insert_one(self, document: dict, **kwargs):
+        await asyncio.sleep(0)
+        document.setdefault("_id", uuid.uuid4().hex)
+        self._expire()
+        self._check_unique(document)
+        self._add(copy.deepcopy(document))
+        return InsertOneResult(document["_id"])
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True, **kwargs):
+        """
+        Inserta varios documentos. Como en MongoDB, los duplicados se acumulan en un BulkWriteError
+        (con ordered=False se siguen insertando el resto)
+        """
+        inserted = []
+        errors = []
+        for i, document in enumerate(documents):
+            try:
+                result = await self.insert_one(document)
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": 11000, "errmsg": str(e), "keyPattern": (e.details or {}).get("keyPattern")})
+                if ordered:
+                    break
+                continue
+            inserted.append(result.inserted_id)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return InsertManyResult(inserted)
+
+    def _updated_copy(self, doc: dict, update: dict):
+        """
+        Aplica una actualización sobre una copia y comprueba los índices únicos antes de guardarla
+        """
+        updated = copy.deepcopy(doc)
+        changed = apply_update(updated, update)
+        if changed:
+            self._check_unique(updated, ignore=doc)
+        return updated, changed
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, kwargs.get("collation"))
+        if not docs:
+            if upsert:
+                doc = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+                apply_update(doc, update)
+                await self.insert_one(doc)
+            return UpdateResult(0, 0)
+        doc = docs[0]
+        updated, changed = self._updated_copy(doc, update)
+        if changed:
+            self._replace(doc, updated)
+        return UpdateResult(1, 1 if changed else 0)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, kwargs.get("collation"))
+        if not docs:
+            if upsert:
+                await self.insert_one(copy.deepcopy(replacement))
+            return UpdateResult(0, 0)
+        doc = docs[0]
+        updated = copy.deepcopy(replacement)
+        updated["_id"] = doc["_id"]
+        changed = updated != doc
+        if changed:
+            self._check_unique(updated, ignore=doc)
+            self._replace(doc, updated)
+        return UpdateResult(1, 1 if changed else 0)
+
+    async def update_many(self, filter: dict, update: dict, **kwargs):
+        await asyncio.sleep(0)
+        modified = 0
+        docs = self._matching(filter, kwargs.get("collation"))
+        for doc in docs:
+            updated, changed = self._updated_copy(doc, update)
+            if changed:
+                self._replace(doc, updated)
+                modified += 1
+        return UpdateResult(len(docs), modified)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection=None, return_document: bool = False, **kwargs):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, kwargs.get("collation"))
+        if kwargs.get("sort"):
+            docs = sort_documents(list(docs), kwargs["sort"])
+        if not docs:
+            return None
+        doc = docs[0]
+        updated, changed = self._updated_copy(doc, update)
+        if changed:
+            self._replace(doc, updated)
+        result = updated if return_document else doc
+        return apply_projection(copy.deepcopy(result), projection)
+
+    async def find_one_and_delete(self, filter: dict, projection=None, **kwargs):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, kwargs.get("collation"))
+        if not docs:
+            return None
+        self._remove(docs[0])
+        return apply_projection(docs[0], projection)
+
+    async def delete_one(self, filter: dict, **kwargs):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, kwargs.get("collation"))
+        if docs:
+            self._remove(docs[0])
+        return DeleteResult(1 if docs else 0)
+
+    async def delete_many(self, filter: dict, **kwargs):
+        await asyncio.sleep(0)
+        docs = self._matching(filter, kwargs.get("collation"))
+        for doc in docs:
+            self._remove(doc)
+        return DeleteResult(len(docs))
+
+    # Agregación
+
+    def aggregate(self, pipeline: List[dict], **kwargs):
+        def loader():
+            self._expire()
+            return self._run_pipeline(copy.deepcopy(self.documents), pipeline)
+        return MemoryCursor(loader)
+
+    def _run_pipeline(self, docs: List[dict], pipeline: List[dict], variables: Optional[dict] = None):
+        for stage in pipeline:
+            op, spec = next(iter(stage.items()))
+            if op == "$match":
+                docs = [d for d in docs if match_document(d, spec, variables=variables)]
+            elif op == "$sort":
+                docs = sort_documents(docs, spec)
+            elif op == "$skip":
+                docs = docs[spec:]
+            elif op == "$limit":
+                docs = docs[:spec]
+            elif op == "$project":
+                docs = [apply_projection(d, spec) for d in docs]
+            elif op in ("$addFields", "$set"):
+                for d in docs:
+                    for field, expr in spec.items():
+                        _set_path(d, field, evaluate_expression(d, expr, variables))
+            elif op == "$count":
+                docs = [{spec: len(docs)}] if docs else []
+            elif op == "$facet":
+                docs = [{name: self._run_pipeline(copy.deepcopy(docs), sub, variables) for name, sub in spec.items()}]
+            elif op == "$lookup":
+                docs = [self._lookup(d, spec) for d in docs]
+            elif op == "$indexStats":
+                docs = [{"name": name, "key": dict(index["key"]), "accesses": {"ops": self.access_counts.get(name, 0)}} for name, index in self.indexes.items()]
+            else:
+                raise ValueError(f"Etapa de agregación no soportada: {op}")
+        return docs
+
+    def _lookup(self, doc: dict, spec: dict):
+        foreign = self.backend.get_collection(spec["from"])
+        foreign._expire()
+        if "localField" in spec:
+            local = _get_path(doc, spec["localField"])
+            local_values = _candidates(None if local is _MISSING else local)
+            joined = [
+                copy.deepcopy(f) for f in foreign.documents
+                if _match_operator(_get_path(f, spec["foreignField"]), "$in", local_values)
+            ]
+        else:
+            joined = copy.deepcopy(foreign.documents)
+        if "pipeline" in spec:
+            variables = {name: evaluate_expression(doc, expr) for name, expr in spec.get("let", {}).items()}
+            joined = self._run_pipeline(joined, spec["pipeline"], variables)
+        doc[spec["as"]] = joined
+        return doc
@@ -1,17 +1,336 @@
 from PIL import Image, ImageDraw, ImageFont
+from config import (
+    BRACKET_FONT_REGULAR, BRACKET_FONT_BOLD, BRACKET_FONT_TITLE,
+    BRACKET_CACHE_MAX_BYTES, BRACKET_CACHE_DIR, BRACKET_CACHE_DISK_MAX_BYTES,
+    BRACKET_RENDER_EXECUTOR, BRACKET_RENDER_WORKERS, BRACKET_RENDER_QUEUE_SIZE,
+    BRACKET_SKELETON_CACHE_SIZE
+)
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass
+import multiprocessing
+import functools
+import threading
+import asyncio
+import hashlib
+import json
 import io
+import os
 import math
 
 # Tamaño fijo 16:9
 CANVAS_WIDTH = 1280
 CANVAS_HEIGHT = 720
+FOOTER_HEIGHT = 40
+
+# Estilo y tamaño de cada fuente del bracket
+FONT_ROLES = {
+    'title': ('title', 18),
+    'team': ('regular', 11),
+    'seed': ('regular', 10),
+    'footer': ('bold', 14),
+    'footer_small': ('regular', 10)
+}
+
+# Cambiar al modificar el dibujo del bracket: invalida las imágenes ya guardadas (también en disco)
+BRACKET_RENDER_VERSION = 2
+
+class BracketImageCache:
+    """
+    Caché LRU de imágenes de bracket (PNG) limitada por bytes, con una capa opcional en disco
+    """
+    def __init__(self, max_bytes: int, disk_dir: str = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._disk_size = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        Obtiene los bytes de una imagen (memoria y después disco) o None si no está
+        """
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return data
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._store(key, data)
+        return data
+
+    def set(self, key: str, data: bytes):
+        """
+        Guarda una imagen en memoria y en disco
+        """
+        self._store(key, data)
+        self._write_disk(key, data)
+
+    def _store(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._data[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _disk_path(self, key: str):
+        return os.path.join(self.disk_dir, f"{key}.png")
+
+    def _read_disk(self, key: str):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+            # La fecha de modificación hace de orden LRU en disco
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write bracket cache file: {e}")
+            return
+        with self._lock:
+            if self._disk_size is not None:
+                self._disk_size += len(data)
+            over_limit = self._disk_size is None or self._disk_size > self.disk_max_bytes
+        if over_limit:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """
+        Borra las imágenes usadas hace más tiempo hasta quedar por debajo del límite del disco
+        """
+        try:
+            entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(self.disk_dir) if e.name.endswith(".png")]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_size = total
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Obtiene las estadísticas de uso de la caché
+        """
+        return {
+            "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+            "entries": len(self._data), "bytes": self.size, "max_bytes": self.max_bytes,
+            "disk_dir": self.disk_dir
+        }
+
+
+bracket_image_cache = BracketImageCache(BRACKET_CACHE_MAX_BYTES, BRACKET_CACHE_DIR, BRACKET_CACHE_DISK_MAX_BYTES)
+
+
+def bracket_cache_key(tourney, current_round, team_names, server_name=""):
+    """
+    Hash estable de todo lo que se ve en la imagen del bracket
+    """
+    rounds = [
+        [[match.get('team1_id'), match.get('team2_id'), match.get('winner_id')] for match in round_matches]
+        for round_matches in tourney.get('matches') or []
+    ]
+    team_ids = {team_id for round_matches in rounds for match in round_matches for team_id in match[:2] if team_id}
+    payload = {
+        "version": BRACKET_RENDER_VERSION,
+        "fonts": [BRACKET_FONT_REGULAR, BRACKET_FONT_BOLD],
+        "rounds": rounds,
+        "names": {team_id: team_names.get(team_id) for team_id in team_ids},
+        "current_round": current_round,
+        "winner_id": tourney.get('winner_id'),
+        "server_name": server_name,
+        "name": tourney.get('name')
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
 
 def generate_bracket_image(tourney, current_round, team_names, server_name="", server_icon_bytes=None, tourney_image_bytes=None):
+    """
+    Genera la imagen de bracket, o la reutiliza de la caché si ya se dibujó uno idéntico
+    """
+    key = bracket_cache_key(tourney, current_round, team_names, server_name)
+    data = bracket_image_cache.get(key)
+    if data is None:
+        data = render_bracket_image(tourney, current_round, team_names, server_name).getvalue()
+        bracket_image_cache.set(key, data)
+    return io.BytesIO(data)
+
+
+def _bracket_payload(tourney):
+    """
+    Copia mínima (solo tipos básicos) de lo que necesita el render, para enviarla a otro proceso
+    """
+    return {
+        "name": tourney.get('name'),
+        "winner_id": tourney.get('winner_id'),
+        "matches": [
+            [{"team1_id": match.get('team1_id'), "team2_id": match.get('team2_id'), "winner_id": match.get('winner_id')} for match in round_matches]
+            for round_matches in tourney.get('matches') or []
+        ]
+    }
+
+
+def _render_png(payload, current_round, team_names, server_name):
+    """
+    Render ejecutado en el pool: devuelve los bytes PNG
+    """
+    return render_bracket_image(payload, current_round, team_names, server_name).getvalue()
+
+
+class BracketRenderer:
+    """
+    Ejecuta los renders de bracket fuera del event loop, en un pool de procesos o de hilos.
+    Como mucho 'queue_size' renders están en el pool a la vez; el resto espera (backpressure).
+    Las peticiones idénticas simultáneas comparten el mismo render
+    """
+    def __init__(self, kind: str, workers: int, queue_size: int):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.rendered = 0
+        self.waiting = 0
+        self._executor = None
+        self._semaphore = None
+        self._pending = {}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: el bot tiene hilos (Motor, aiohttp) y fork no es seguro con ellos
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=warm_fonts
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bracket-render")
+        return self._executor
+
+    async def render(self, tourney, current_round, team_names, server_name=""):
+        """
+        Devuelve la imagen del bracket (BytesIO), usando la caché o renderizándola en el pool
+        """
+        key = bracket_cache_key(tourney, current_round, team_names, server_name)
+        data = await self._cache_call(bracket_image_cache.get, key)
+        if data is not None:
+            return io.BytesIO(data)
+
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._render(key, tourney, current_round, team_names, server_name))
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return io.BytesIO(await asyncio.shield(future))
+
+    async def _render(self, key, tourney, current_round, team_names, server_name):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.queue_size)
+        # shutdown() puede descartar el semáforo mientras se renderiza: se libera el que se adquirió
+        semaphore = self._semaphore
+        payload = _bracket_payload(tourney)
+        team_ids = {team_id for round_matches in payload['matches'] for match in round_matches for team_id in (match['team1_id'], match['team2_id'])}
+        names = {team_id: team_names[team_id] for team_id in team_ids if team_id in team_names}
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(self.executor, _render_png, payload, current_round, names, server_name)
+        finally:
+            semaphore.release()
+        self.rendered += 1
+        await self._cache_call(bracket_image_cache.set, key, data)
+        return data
+
+    async def _cache_call(self, method, *args):
+        # Con capa en disco la caché hace E/S: se llama desde un hilo
+        if bracket_image_cache.disk_dir:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def shutdown(self):
+        """
+        Cierra el pool (se vuelve a crear en el siguiente render)
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+
+    def stats(self):
+        """
+        Obtiene las estadísticas del pool de render
+        """
+        return {
+            "kind": self.kind, "workers": self.workers, "queue_size": self.queue_size,
+            "in_flight": len(self._pending), "waiting": self.waiting, "rendered": self.rendered
+        }
+
+
+bracket_renderer = BracketRenderer(BRACKET_RENDER_EXECUTOR, BRACKET_RENDER_WORKERS, BRACKET_RENDER_QUEUE_SIZE)
+
+
+async def render_bracket(tourney, current_round, team_names, server_name="", server_icon_bytes=None, tourney_image_bytes=None):
+    """
+    Versión asíncrona de generate_bracket_image: el dibujo se hace en el pool de render sin bloquear el bot
+    """
+    return await bracket_renderer.render(tourney, current_round, team_names, server_name)
+
+
+def render_bracket_image(tourney, current_round, team_names, server_name=""):
     """
     Genera una imagen de bracket con ratio 16:9 que cubre todo el espacio.
     """
     
-    BG_COLOR = (38, 35, 38)
     LINE_COLOR = (85, 80, 85)
     TEXT_COLOR = (220, 220, 220)
     SEED_COLOR = (180, 180, 180)
@@ -24,33 +343,13 @@ def generate_bracket_image(tourney, current_round, team_names, server_name="", s
     
     tournament_winner_id = tourney.get('winner_id')
     
-    img = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), BG_COLOR)
+    # Líneas, subrayados y seeds solo dependen de la estructura de rondas: se copian de la capa cacheada
+    img = bracket_skeleton(tuple(len(round_matches) for round_matches in all_rounds)).copy()
     draw = ImageDraw.Draw(img)
     
     fonts = load_fonts()
     
-    FOOTER_HEIGHT = 40
-    MARGIN_X = 15
-    MARGIN_Y = 10
-    
-    bracket_area_width = CANVAS_WIDTH - (MARGIN_X * 2)
-    bracket_area_height = CANVAS_HEIGHT - FOOTER_HEIGHT - MARGIN_Y
-    bracket_start_y = MARGIN_Y
-    
-    num_rounds = len(all_rounds)
-    first_round_matches = len(all_rounds[0])
-    total_teams = first_round_matches * 2
-    
-    if total_teams >= 16:
-        draw_double_bracket_fixed(draw, all_rounds, team_names, 
-                                   MARGIN_X, bracket_start_y, 
-                                   bracket_area_width, bracket_area_height,
-                                   fonts, total_teams, current_round, tournament_winner_id)
-    else:
-        draw_single_bracket_fixed(draw, all_rounds, team_names,
-                                   MARGIN_X, bracket_start_y,
-                                   bracket_area_width, bracket_area_height,
-                                   fonts, first_round_matches, current_round, tournament_winner_id)
+    draw_bracket_layer(draw, all_rounds, team_names, fonts, current_round, tournament_winner_id, layer="teams")
     
     footer_y = CANVAS_HEIGHT - FOOTER_HEIGHT
     draw.rectangle([0, footer_y, CANVAS_WIDTH, CANVAS_HEIGHT], fill=FOOTER_BG)
@@ -70,14 +369,126 @@ def generate_bracket_image(tourney, current_round, team_names, server_name="", s
     return buf
 
 
-def draw_single_bracket_fixed(draw, all_rounds, team_names, start_x, start_y, 
-                               area_width, area_height, fonts, first_round_matches, current_round, tournament_winner_id=None):
+# Capas estáticas ya dibujadas por (ancho, alto, partidos por ronda), en orden LRU
+_skeleton_cache = OrderedDict()
+_skeleton_lock = threading.Lock()
+
+
+def bracket_skeleton(round_sizes: tuple):
     """
-    Dibuja un bracket simple que ocupa todo el espacio disponible
+    Capa estática del bracket (conectores, subrayados y seeds) para una estructura de rondas.
+    Se dibuja una vez por (tamaño del lienzo, partidos por ronda) y se reutiliza
     """
+    BG_COLOR = (38, 35, 38)
     
-    LINE_COLOR = (85, 80, 85)
-    num_rounds = len(all_rounds)
+    key = (CANVAS_WIDTH, CANVAS_HEIGHT, round_sizes)
+    with _skeleton_lock:
+        skeleton = _skeleton_cache.get(key)
+        if skeleton is not None:
+            _skeleton_cache.move_to_end(key)
+            return skeleton
+    
+    skeleton = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), BG_COLOR)
+    draw = ImageDraw.Draw(skeleton)
+    # La capa estática no lee los partidos: solo cuántos hay en cada ronda
+    placeholder_rounds = [[None] * size for size in round_sizes]
+    draw_bracket_layer(draw, placeholder_rounds, {}, load_fonts(), 0, None, layer="skeleton")
+    
+    with _skeleton_lock:
+        _skeleton_cache[key] = skeleton
+        while len(_skeleton_cache) > BRACKET_SKELETON_CACHE_SIZE:
+            _skeleton_cache.popitem(last=False)
+    return skeleton
+
+
+@dataclass(frozen=True, slots=True)
+class SlotBox:
+    """
+    Posición de un partido en el bracket: dos huecos de equipo de alto 'slot_height' separados por 'match_gap'
+    """
+    round_idx: int
+    match_idx: int
+    x: float
+    y: float
+    width: int
+    slot_height: int
+    match_gap: int
+    seed1: object = ""
+    seed2: object = ""
+    is_final: bool = False
+
+    @property
+    def box(self):
+        """
+        Rectángulo (x0, y0, x1, y1) en píxeles que ocupa el partido
+        """
+        return (self.x, self.y, self.x + self.width, self.y + self.slot_height * 2 + self.match_gap)
+
+
+class BracketLayout:
+    """
+    Geometría precalculada de un bracket: partidos en orden de dibujo y segmentos de los conectores
+    """
+    def __init__(self, mode: str, slots: list, connectors: list):
+        self.mode = mode
+        self.slots = tuple(slots)
+        self.connectors = tuple(connectors)
+        self._by_match = {(slot.round_idx, slot.match_idx): slot for slot in self.slots}
+
+    def match_slot(self, round_idx: int, match_idx: int):
+        """
+        Obtiene el SlotBox de un partido (índices de la lista de rondas del torneo) o None
+        """
+        return self._by_match.get((round_idx, match_idx))
+
+    def match_box(self, round_idx: int, match_idx: int):
+        """
+        Obtiene el rectángulo en píxeles de un partido o None si no se dibuja
+        """
+        slot = self.match_slot(round_idx, match_idx)
+        return slot.box if slot else None
+
+
+def _round_positions(round_sizes: list, start_y: float, area_height: float, first_count: int, block_height: int):
+    """
+    Posición Y de cada partido por ronda. La primera ronda reparte el alto disponible
+    y cada partido posterior se centra entre sus dos partidos previos
+    """
+    # Un partido de la ronda r se centra entre los partidos 2i y 2i+1 de la anterior, aunque ese no exista
+    needed = list(round_sizes)
+    for round_idx in range(len(needed) - 1, 0, -1):
+        needed[round_idx - 1] = max(needed[round_idx - 1], needed[round_idx] * 2)
+    
+    match_space = area_height / first_count
+    rounds = [[start_y + i * match_space + (match_space - block_height) / 2 for i in range(needed[0])]]
+    for count in needed[1:]:
+        prev = rounds[-1]
+        rounds.append([
+            ((prev[i * 2] + block_height / 2) + (prev[i * 2 + 1] + block_height / 2)) / 2 - block_height / 2
+            for i in range(count)
+        ])
+    return rounds
+
+
+def _connector(connector_x, mid_x, end_x, line1_y, line2_y):
+    """
+    Segmentos que unen los dos equipos de un partido con el siguiente
+    """
+    center_y = (line1_y + line2_y) / 2
+    return [
+        ((connector_x, line1_y), (mid_x, line1_y)),
+        ((mid_x, line1_y), (mid_x, line2_y)),
+        ((connector_x, line2_y), (mid_x, line2_y)),
+        ((mid_x, center_y), (end_x, center_y))
+    ]
+
+
+def single_bracket_layout(round_sizes: tuple, start_x, start_y, area_width, area_height):
+    """
+    Geometría de un bracket simple que ocupa todo el espacio disponible
+    """
+    num_rounds = len(round_sizes)
+    first_round_matches = round_sizes[0]
     
     SLOT_WIDTH = min(180, (area_width - 40) // num_rounds)
     round_spacing = area_width // num_rounds
@@ -85,40 +496,17 @@ def draw_single_bracket_fixed(draw, all_rounds, team_names, start_x, start_y,
     match_height_available = area_height / first_round_matches
     slot_height = min(28, max(18, int(match_height_available * 0.35)))
     match_gap = min(15, max(5, int(match_height_available * 0.15)))
-    
     match_block_height = slot_height * 2 + match_gap
     
-    positions_cache = {}
+    positions = _round_positions(round_sizes, start_y, area_height, first_round_matches, match_block_height)
+    slots = []
+    connectors = []
     
-    def get_match_y(round_idx, match_idx):
-        """
-        Obtiene la posición Y de un match
-        """
-        key = (round_idx, match_idx)
-        if key in positions_cache:
-            return positions_cache[key]
-        
-        if round_idx == 0:
-            num_matches = first_round_matches
-            total_space = area_height
-            match_space = total_space / num_matches
-            y = start_y + match_idx * match_space + (match_space - match_block_height) / 2
-        else:
-            prev_y1 = get_match_y(round_idx - 1, match_idx * 2)
-            prev_y2 = get_match_y(round_idx - 1, match_idx * 2 + 1)
-            center1 = prev_y1 + match_block_height / 2
-            center2 = prev_y2 + match_block_height / 2
-            y = (center1 + center2) / 2 - match_block_height / 2
-        
-        positions_cache[key] = y
-        return y
-    
-    for round_idx, round_matches in enumerate(all_rounds):
+    for round_idx, round_size in enumerate(round_sizes):
         x_pos = start_x + round_idx * round_spacing
-        is_past_round = (round_idx + 1) < current_round
         
-        for match_idx, match in enumerate(round_matches):
-            match_y = get_match_y(round_idx, match_idx)
+        for match_idx in range(round_size):
+            match_y = positions[round_idx][match_idx]
             
             if round_idx == 0:
                 seed1 = match_idx * 2 + 1
@@ -127,42 +515,29 @@ def draw_single_bracket_fixed(draw, all_rounds, team_names, start_x, start_y,
                 seed1 = ""
                 seed2 = ""
             
-            draw_match_slot(draw, match, team_names, x_pos, match_y,
-                           SLOT_WIDTH, slot_height, match_gap, fonts, seed1, seed2,
-                           is_past_round=is_past_round, tournament_winner_id=tournament_winner_id)
+            slots.append(SlotBox(round_idx, match_idx, x_pos, match_y, SLOT_WIDTH, slot_height, match_gap, seed1, seed2))
             
             line1_y = match_y + slot_height
             line2_y = match_y + slot_height * 2 + match_gap
-            center_y = (line1_y + line2_y) / 2
+            connector_x = x_pos + SLOT_WIDTH
             
             if round_idx < num_rounds - 1:
-                connector_x = x_pos + SLOT_WIDTH
-                gap_to_next = round_spacing - SLOT_WIDTH
-                mid_x = connector_x + gap_to_next * 0.3
+                mid_x = connector_x + (round_spacing - SLOT_WIDTH) * 0.3
                 next_x = start_x + (round_idx + 1) * round_spacing
-                
-                draw.line([(connector_x, line1_y), (mid_x, line1_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, line1_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(connector_x, line2_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, center_y), (next_x, center_y)], fill=LINE_COLOR, width=1)
             else:
-                connector_x = x_pos + SLOT_WIDTH
                 mid_x = connector_x + 15
-                draw.line([(connector_x, line1_y), (mid_x, line1_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, line1_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(connector_x, line2_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, center_y), (mid_x + 25, center_y)], fill=LINE_COLOR, width=1)
+                next_x = mid_x + 25
+            connectors.extend(_connector(connector_x, mid_x, next_x, line1_y, line2_y))
+    
+    return BracketLayout("single", slots, connectors)
 
 
-def draw_double_bracket_fixed(draw, all_rounds, team_names, start_x, start_y,
-                               area_width, area_height, fonts, total_teams, current_round, tournament_winner_id=None):
+def double_bracket_layout(round_sizes: tuple, start_x, start_y, area_width, area_height):
     """
-    Dibuja un bracket doble corregido
+    Geometría de un bracket doble: cada ronda se reparte entre la izquierda y la derecha y la final va en el centro
     """
-    
-    LINE_COLOR = (85, 80, 85)
-    num_rounds = len(all_rounds)
-    first_round_matches = len(all_rounds[0])
+    first_round_matches = round_sizes[0]
+    total_teams = first_round_matches * 2
     half_first_round = first_round_matches // 2
     rounds_per_side = 0
     temp_matches = half_first_round
@@ -182,74 +557,25 @@ def draw_double_bracket_fixed(draw, all_rounds, team_names, start_x, start_y,
     match_gap = min(12, max(4, int(match_height_available * 0.12)))
     match_block_height = slot_height * 2 + match_gap
     
-    left_rounds = []
-    right_rounds = []
-    final_match = None
-    
-    for round_idx, round_matches in enumerate(all_rounds):
-        n = len(round_matches)
+    side_rounds = [(round_idx, n) for round_idx, n in enumerate(round_sizes) if n >= 2]
+    final_round_idx = None
+    for round_idx, n in enumerate(round_sizes):
         if n == 1:
-            final_match = (round_matches[0], round_idx)
-        elif n >= 2:
-            half = n // 2
-            left_rounds.append((round_matches[:half], round_idx))
-            right_rounds.append((round_matches[half:], round_idx))
-    
-    left_positions = {}
-    right_positions = {}
-    
-    def get_left_y(round_idx, match_idx):
-        """
-        Obtiene la posición Y de un match
-        """
-        key = (round_idx, match_idx)
-        if key in left_positions:
-            return left_positions[key]
-        
-        if round_idx == 0:
-            num = half_first_round
-            match_space = area_height / num
-            y = start_y + match_idx * match_space + (match_space - match_block_height) / 2
-        else:
-            y1 = get_left_y(round_idx - 1, match_idx * 2)
-            y2 = get_left_y(round_idx - 1, match_idx * 2 + 1)
-            center1 = y1 + match_block_height / 2
-            center2 = y2 + match_block_height / 2
-            y = (center1 + center2) / 2 - match_block_height / 2
-        
-        left_positions[key] = y
-        return y
+            final_round_idx = round_idx
     
-    def get_right_y(round_idx, match_idx):
-        """
-        Obtiene la posición Y de un match
-        """
-        key = (round_idx, match_idx)
-        if key in right_positions:
-            return right_positions[key]
-        
-        if round_idx == 0:
-            num = half_first_round
-            match_space = area_height / num
-            y = start_y + match_idx * match_space + (match_space - match_block_height) / 2
-        else:
-            y1 = get_right_y(round_idx - 1, match_idx * 2)
-            y2 = get_right_y(round_idx - 1, match_idx * 2 + 1)
-            center1 = y1 + match_block_height / 2
-            center2 = y2 + match_block_height / 2
-            y = (center1 + center2) / 2 - match_block_height / 2
-        
-        right_positions[key] = y
-        return y
+    left_positions = _round_positions([n // 2 for _, n in side_rounds], start_y, area_height, half_first_round, match_block_height)
+    right_positions = _round_positions([n - n // 2 for _, n in side_rounds], start_y, area_height, half_first_round, match_block_height)
     
     center_x = CANVAS_WIDTH / 2
+    last_local_round = len(side_rounds) - 1
+    slots = []
+    connectors = []
     
-    for local_round_idx, (round_matches, actual_round_idx) in enumerate(left_rounds):
+    for local_round_idx, (round_idx, n) in enumerate(side_rounds):
         x_pos = start_x + local_round_idx * round_spacing
-        is_past_round = (actual_round_idx + 1) < current_round
         
-        for match_idx, match in enumerate(round_matches):
-            match_y = get_left_y(local_round_idx, match_idx)
+        for match_idx in range(n // 2):
+            match_y = left_positions[local_round_idx][match_idx]
             
             if local_round_idx == 0:
                 seed1 = match_idx * 2 + 1
@@ -258,38 +584,26 @@ def draw_double_bracket_fixed(draw, all_rounds, team_names, start_x, start_y,
                 seed1 = ""
                 seed2 = ""
             
-            draw_match_slot(draw, match, team_names, x_pos, match_y,
-                           SLOT_WIDTH, slot_height, match_gap, fonts, seed1, seed2,
-                           is_past_round=is_past_round, tournament_winner_id=tournament_winner_id)
+            slots.append(SlotBox(round_idx, match_idx, x_pos, match_y, SLOT_WIDTH, slot_height, match_gap, seed1, seed2))
             
             line1_y = match_y + slot_height
             line2_y = match_y + slot_height * 2 + match_gap
-            center_y = (line1_y + line2_y) / 2
             connector_x = x_pos + SLOT_WIDTH
             
-            if local_round_idx < len(left_rounds) - 1:
-                gap = round_spacing - SLOT_WIDTH
-                mid_x = connector_x + gap * 0.3
+            if local_round_idx < last_local_round:
+                mid_x = connector_x + (round_spacing - SLOT_WIDTH) * 0.3
                 next_x = start_x + (local_round_idx + 1) * round_spacing
-                
-                draw.line([(connector_x, line1_y), (mid_x, line1_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, line1_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(connector_x, line2_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, center_y), (next_x, center_y)], fill=LINE_COLOR, width=1)
             else:
                 mid_x = connector_x + 15
-                final_x = center_x - SLOT_WIDTH / 2
-                draw.line([(connector_x, line1_y), (mid_x, line1_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, line1_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(connector_x, line2_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, center_y), (final_x, center_y)], fill=LINE_COLOR, width=1)
+                next_x = center_x - SLOT_WIDTH / 2
+            connectors.extend(_connector(connector_x, mid_x, next_x, line1_y, line2_y))
     
-    for local_round_idx, (round_matches, actual_round_idx) in enumerate(right_rounds):
+    for local_round_idx, (round_idx, n) in enumerate(side_rounds):
         x_pos = CANVAS_WIDTH - start_x - SLOT_WIDTH - local_round_idx * round_spacing
-        is_past_round = (actual_round_idx + 1) < current_round
+        half = n // 2
         
-        for match_idx, match in enumerate(round_matches):
-            match_y = get_right_y(local_round_idx, match_idx)
+        for match_idx in range(n - half):
+            match_y = right_positions[local_round_idx][match_idx]
             
             if local_round_idx == 0:
                 base = half_first_round * 2
@@ -299,54 +613,88 @@ def draw_double_bracket_fixed(draw, all_rounds, team_names, start_x, start_y,
                 seed1 = ""
                 seed2 = ""
             
-            draw_match_slot(draw, match, team_names, x_pos, match_y,
-                           SLOT_WIDTH, slot_height, match_gap, fonts, seed1, seed2,
-                           is_past_round=is_past_round, tournament_winner_id=tournament_winner_id)
+            slots.append(SlotBox(round_idx, half + match_idx, x_pos, match_y, SLOT_WIDTH, slot_height, match_gap, seed1, seed2))
             
             line1_y = match_y + slot_height
             line2_y = match_y + slot_height * 2 + match_gap
-            center_y = (line1_y + line2_y) / 2
             connector_x = x_pos
             
-            if local_round_idx < len(right_rounds) - 1:
-                gap = round_spacing - SLOT_WIDTH
-                mid_x = connector_x - gap * 0.3
+            if local_round_idx < last_local_round:
+                mid_x = connector_x - (round_spacing - SLOT_WIDTH) * 0.3
                 next_x = CANVAS_WIDTH - start_x - SLOT_WIDTH - (local_round_idx + 1) * round_spacing + SLOT_WIDTH
-                
-                draw.line([(connector_x, line1_y), (mid_x, line1_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, line1_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(connector_x, line2_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, center_y), (next_x, center_y)], fill=LINE_COLOR, width=1)
             else:
                 mid_x = connector_x - 15
-                final_x = center_x + SLOT_WIDTH / 2
-                draw.line([(connector_x, line1_y), (mid_x, line1_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, line1_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(connector_x, line2_y), (mid_x, line2_y)], fill=LINE_COLOR, width=1)
-                draw.line([(mid_x, center_y), (final_x, center_y)], fill=LINE_COLOR, width=1)
-    
-    if final_match:
-        match, final_round_idx = final_match
-        is_past_round = (final_round_idx + 1) < current_round
-        
+                next_x = center_x + SLOT_WIDTH / 2
+            connectors.extend(_connector(connector_x, mid_x, next_x, line1_y, line2_y))
+    
+    if final_round_idx is not None:
         final_x = center_x - SLOT_WIDTH / 2
         final_y = start_y + area_height / 2 - match_block_height / 2
-        
-        draw_match_slot(draw, match, team_names, final_x, final_y,
-                       SLOT_WIDTH, slot_height, match_gap, fonts, "", "",
-                       is_final=True, is_past_round=is_past_round, tournament_winner_id=tournament_winner_id)
+        slots.append(SlotBox(final_round_idx, 0, final_x, final_y, SLOT_WIDTH, slot_height, match_gap, is_final=True))
+    
+    return BracketLayout("double", slots, connectors)
+
+
+@functools.lru_cache(maxsize=128)
+def bracket_layout(round_sizes: tuple):
+    """
+    Geometría del bracket para una estructura de rondas (partidos por ronda). Se calcula una vez y se reutiliza
+    """
+    MARGIN_X = 15
+    MARGIN_Y = 10
+    
+    bracket_area_width = CANVAS_WIDTH - (MARGIN_X * 2)
+    bracket_area_height = CANVAS_HEIGHT - FOOTER_HEIGHT - MARGIN_Y
+    
+    total_teams = round_sizes[0] * 2
+    if total_teams >= 16:
+        return double_bracket_layout(round_sizes, MARGIN_X, MARGIN_Y, bracket_area_width, bracket_area_height)
+    return single_bracket_layout(round_sizes, MARGIN_X, MARGIN_Y, bracket_area_width, bracket_area_height)
+
+
+def draw_bracket_layer(draw, all_rounds, team_names, fonts, current_round, tournament_winner_id, layer):
+    """
+    Dibuja una capa del bracket: "skeleton" (conectores, subrayados y seeds) o "teams" (nombres y ganadores)
+    """
+    LINE_COLOR = (85, 80, 85)
+    
+    layout = bracket_layout(tuple(len(round_matches) for round_matches in all_rounds))
+    for slot in layout.slots:
+        match = None if layer == "skeleton" else all_rounds[slot.round_idx][slot.match_idx]
+        draw_match_slot(draw, match, team_names, slot.x, slot.y,
+                       slot.width, slot.slot_height, slot.match_gap, fonts, slot.seed1, slot.seed2,
+                       is_final=slot.is_final, is_past_round=(slot.round_idx + 1) < current_round,
+                       tournament_winner_id=tournament_winner_id, layer=layer)
+    
+    if layer == "skeleton":
+        for segment in layout.connectors:
+            draw.line(list(segment), fill=LINE_COLOR, width=1)
 
 
-def draw_match_slot(draw, match, team_names, x, y, slot_width, slot_height, match_gap, fonts, seed1, seed2, is_final=False, is_past_round=False, tournament_winner_id=None):
+def draw_match_slot(draw, match, team_names, x, y, slot_width, slot_height, match_gap, fonts, seed1, seed2, is_final=False, is_past_round=False, tournament_winner_id=None, layer="teams"):
     """
-    Dibuja un match individual. Muestra ganadores en verde si is_past_round=True, y al campeón en amarillo si tournament_winner_id está definido
+    Dibuja un match individual. Muestra ganadores en verde si is_past_round=True, y al campeón en amarillo si tournament_winner_id está definido.
+    La capa "skeleton" dibuja los subrayados y los seeds en su color normal; la capa "teams" los nombres y los seeds coloreados
     """
     
+    BG_COLOR = (38, 35, 38)
     TEXT_COLOR = (220, 220, 220)
     SEED_COLOR = (180, 180, 180)
     LINE_COLOR = (85, 80, 85)
     WINNER_COLOR = (100, 200, 120)
     FINAL_COLOR = (255, 215, 0)
+    SEED_WIDTH = 20
+    
+    text_offset_y = max(2, (slot_height - 12) // 2)
+    team1_y = y
+    team2_y = y + slot_height + match_gap
+    
+    if layer == "skeleton":
+        for seed, team_y in ((seed1, team1_y), (seed2, team2_y)):
+            if seed:
+                draw.text((x, team_y + text_offset_y), str(seed), fill=SEED_COLOR, font=fonts['seed'])
+            draw.line([(x, team_y + slot_height), (x + slot_width, team_y + slot_height)], fill=LINE_COLOR, width=1)
+        return
     
     team1_id = match.get('team1_id')
     team2_id = match.get('team2_id')
@@ -397,58 +745,96 @@ def draw_match_slot(draw, match, team_names, x, y, slot_width, slot_height, matc
     font_team = fonts['team']
     font_seed = fonts['seed']
     
-    text_offset_y = max(2, (slot_height - 12) // 2)
     max_chars = max(12, int(slot_width / 7))
     
-    team1_y = y
     if seed1:
-        draw.text((x, team1_y + text_offset_y), str(seed1), fill=seed1_color, font=font_seed)
-        name_x = x + 20
+        if seed1_color != SEED_COLOR:
+            # El seed ya está en el esqueleto con el color normal: se tapa antes de repintarlo
+            draw.rectangle([x, team1_y, x + SEED_WIDTH - 1, team1_y + slot_height - 1], fill=BG_COLOR)
+            draw.text((x, team1_y + text_offset_y), str(seed1), fill=seed1_color, font=font_seed)
+        name_x = x + SEED_WIDTH
     else:
         name_x = x + 5
     
     display_name1 = team1_name[:max_chars] + ".." if len(team1_name) > max_chars else team1_name
     draw.text((name_x, team1_y + text_offset_y), display_name1, fill=text1_color, font=font_team)
-    line1_y = team1_y + slot_height
-    draw.line([(x, line1_y), (x + slot_width, line1_y)], fill=LINE_COLOR, width=1)
     
-    team2_y = y + slot_height + match_gap
     if seed2:
-        draw.text((x, team2_y + text_offset_y), str(seed2), fill=seed2_color, font=font_seed)
-        name_x = x + 20
+        if seed2_color != SEED_COLOR:
+            draw.rectangle([x, team2_y, x + SEED_WIDTH - 1, team2_y + slot_height - 1], fill=BG_COLOR)
+            draw.text((x, team2_y + text_offset_y), str(seed2), fill=seed2_color, font=font_seed)
+        name_x = x + SEED_WIDTH
     else:
         name_x = x + 5
     
     display_name2 = team2_name[:max_chars] + ".." if len(team2_name) > max_chars else team2_name
     draw.text((name_x, team2_y + text_offset_y), display_name2, fill=text2_color, font=font_team)
-    line2_y = team2_y + slot_height
-    draw.line([(x, line2_y), (x + slot_width, line2_y)], fill=LINE_COLOR, width=1)
+
+
+class FontRegistry:
+    """
+    Registro de fuentes del proceso: resuelve una vez la ruta de cada estilo
+    y guarda las fuentes ya cargadas por (ruta, tamaño)
+    """
+    def __init__(self, candidates: dict):
+        self.candidates = candidates
+        self.paths = {}
+        self._fonts = {}
+
+    def get(self, style: str, size: int):
+        """
+        Devuelve la fuente de un estilo y tamaño (la fuente por defecto de PIL si no hay ninguna disponible)
+        """
+        if style not in self.paths:
+            return self._resolve(style, size)
+        path = self.paths[style]
+        font = self._fonts.get((path, size))
+        if font is None:
+            font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+            self._fonts[(path, size)] = font
+        return font
+
+    def _resolve(self, style: str, size: int):
+        """
+        Prueba las rutas candidatas de un estilo y se queda con la primera que carga
+        """
+        for path in self.candidates.get(style, []):
+            try:
+                font = ImageFont.truetype(path, size)
+            except OSError:
+                continue
+            self.paths[style] = path
+            self._fonts[(path, size)] = font
+            return font
+        print(f"No bracket font found for '{style}', using PIL default font")
+        self.paths[style] = None
+        return self.get(style, size)
+
+    def clear(self):
+        self.paths.clear()
+        self._fonts.clear()
+
+
+font_registry = FontRegistry({
+    'regular': [path.strip() for path in BRACKET_FONT_REGULAR.split(",") if path.strip()],
+    'bold': [path.strip() for path in BRACKET_FONT_BOLD.split(",") if path.strip()],
+    'title': [path.strip() for path in BRACKET_FONT_TITLE.split(",") if path.strip()]
+})
 
 
 def load_fonts():
     """
-    Carga las fuentes para el bracket
+    Obtiene las fuentes para el bracket desde el registro (solo se leen de disco la primera vez)
     """
-    try:
-        return {
-            'title': ImageFont.truetype("arial.ttf", 18),
-            'team': ImageFont.truetype("arial.ttf", 11),
-            'seed': ImageFont.truetype("arial.ttf", 10),
-            'footer': ImageFont.truetype("arialbd.ttf", 14),
-            'footer_small': ImageFont.truetype("arial.ttf", 10)
-        }
-    except:
-        try:
-            return {
-                'title': ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 18),
-                'team': ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 11),
-                'seed': ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 10),
-                'footer': ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 14),
-                'footer_small': ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 10)
-            }
-        except:
-            default = ImageFont.load_default()
-            return {'title': default, 'team': default, 'seed': default, 'footer': default, 'footer_small': default}
+    return {role: font_registry.get(style, size) for role, (style, size) in FONT_ROLES.items()}
+
+
+def warm_fonts():
+    """
+    Carga de antemano todas las fuentes del bracket y devuelve la ruta usada por cada estilo
+    """
+    load_fonts()
+    return dict(font_registry.paths)
 
 
 def create_empty_bracket():